@@ -0,0 +1,447 @@
+import asyncio                          # For the client engine
+from collections import OrderedDict, deque  # For in flight and held messages
+from time import perf_counter_ns, monotonic    # For metrics and idle time
+from threading import Thread, Lock  # For the shared engine loop
+
+from defaults import CONNECT_TIMEOUT, WELCOME_TIMEOUT, ECHO_TIMEOUT, WINDOW
+from inbox import Inbox
+from messages import Message, encode_message, encode_messages, parse_welcome, FrameDecoder, RECV_POOL, FRAMING_BINARY, COMPRESS_MIN
+from metrics import Metrics
+
+# =============================================================================
+# Async Echo Client
+#
+# The async client is the engine which does all of a client's network work:
+#  * opening a connection to the server and reading its welcome
+#  * encoding and sending messages, optionally awaiting their echo
+#  * pipelining sends, keeping up to a window of messages in flight at once
+#  * batching sends into single scatter/gather writes, optionally coalescing them
+#  * compressing large texts, when the server's welcome says it accepts the codec
+#  * a listener protocol, which decodes recieved bytes into an inbox of messages
+#  * closing the connection
+#
+# Recieved bytes land directly in the decoder's pooled buffer (asyncio.BufferedProtocol,
+# recv_into underneath) and frames are decoded in place, with no per-read bytes objects.
+#
+# Every sent message is stamped with a sequence id which the server echos back, so
+# each echo resolves the future of the message it answers. Echos without an id
+# (legacy framing) answer the oldest message still in flight.
+#
+# Nothing waits on the server forever: connecting, reading the welcome and waiting
+# for echos each have a timeout (0 for none), after which TimeoutError is raised.
+# An echo wait times out when no awaited echo arrives for that long, so a big batch
+# against a slow but live server still finishes.
+#
+# Any number of async clients can run on a single event loop.
+# The synchronous Client in client.py wraps one of these, running it on a
+# shared background loop (see run_sync) so its API can stay blocking.
+# =============================================================================
+
+WELCOME_SIZE = 1024     # Most bytes read for the server's welcome
+SEQ_LIMIT = 2**32       # Sequence ids wrap around at the frame field's size
+
+class AsyncClient():
+    # --------------
+    # Initialization
+    # --------------
+
+    def __init__(self, host: str = None, port: int = None, framing: str = FRAMING_BINARY, inbox: Inbox = None,
+                 window: int = WINDOW):
+        self.host = host
+        self.port = port
+        self.framing = framing                      # Framing messages are sent/recieved with
+        self.window = window                        # Most messages in flight at once
+        self.connect_timeout = CONNECT_TIMEOUT      # Seconds each wait may take, 0 for no limit
+        self.welcome_timeout = WELCOME_TIMEOUT
+        self.echo_timeout = ECHO_TIMEOUT
+        self.inbox = Inbox() if inbox is None else inbox    # Messages recieved by client
+        self.channels = {}                          # Channel id -> inbox its echos go to (see mux.py)
+        self.welcome = None                         # Welcome the server sent on connect
+        self.codecs = ()                            # Compression codecs the welcome says the server accepts
+        self.compress = "off"                       # Codec to compress texts with, if the server accepts it
+        self.compress_min = COMPRESS_MIN            # Smallest text (bytes) compressed
+        self.recorder = None                        # TraceRecorder capturing the raw traffic (see traffic.py)
+
+        self._transport = None  # Connection transport
+        self._protocol = None   # Listener protocol
+        self._decoder = None    # Splits the recieved byte stream into messages
+        self._lost = False      # Set once the server closes the connection
+        self._held = deque()    # Decoded messages waiting for room in a blocking inbox
+        self._unblocker = None  # Task waiting for that room
+
+        self._seq = 0                   # Sequence id for the next sent message
+        self._pending = OrderedDict()   # In flight messages: seq -> (future for its echo, send time)
+        self._window_free = asyncio.Event() # Set when a slot in the window opens
+        self._watchers = []             # Futures waiting for the next recieved message
+        self._probes = set()            # Sequence ids of in flight health probes (kept out of the inbox)
+        self.last_active = monotonic()  # When something was last sent or recieved
+
+        # Nagle style write coalescing, off while both are 0
+        #  sends are held and written together once coalesce_bytes are waiting,
+        #  or coalesce_us after the first was held
+        self.coalesce_us = 0
+        self.coalesce_bytes = 0
+        self._out = []                  # Held frame buffers
+        self._out_bytes = 0
+        self._flush_handle = None       # Timer flushing the held frames
+
+        self.metrics = Metrics()        # Counters, timers and round trip latencies
+
+    # Number of sent messages still waiting for their echo
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    # Whether the connection is open and usable
+    def is_connected(self) -> bool:
+        return self._transport is not None and not self._lost
+
+    # Whether the connection is open, even if the server has since dropped it
+    def is_open(self) -> bool:
+        return self._transport is not None
+
+    # Codec sends are compressed with (None if compression is off or the server doesn't accept it)
+    def codec(self) -> str:
+        if self.compress in self.codecs: return self.compress
+        return None
+
+    # =========================================================================
+
+    # ---------
+    # Listening
+    # ---------
+
+    # Called by the listener protocol after n bytes were recieved into the decoder's buffer
+    #  Appends each completed message to the inbox and hands it to whoever is waiting on it
+    def _recieved(self, nbytes: int):
+        self.metrics.bytes_recieved += nbytes
+        self.last_active = monotonic()
+        started = perf_counter_ns()
+        try: messages = self._decoder.buffer_updated(nbytes)
+        except ValueError as e:
+            print(f" ! dropping undecodable bytes from server: {e}")
+            return
+        finally: self.metrics.decode_ns += perf_counter_ns() - started
+        self.metrics.messages_recieved += len(messages)
+        if self._held or self.inbox.must_wait():
+            self._held.extend(messages)
+            self._deliver_held()
+        else:
+            for mess in messages: self._deliver(mess)
+
+    # Delivers held messages while the inbox has room
+    #  A full inbox set to block stops reading, pushing back on the server until space frees
+    def _deliver_held(self):
+        while self._held:
+            if self.inbox.must_wait():
+                if self._unblocker is None:
+                    self._transport.pause_reading()
+                    self._unblocker = asyncio.create_task(self._await_space())
+                return
+            self._deliver(self._held.popleft())
+
+    async def _await_space(self):
+        while self.inbox.must_wait(): await asyncio.to_thread(self.inbox.wait_space, 0.25)
+        self._unblocker = None
+        if self._transport is None: return
+        self._deliver_held()
+        if self._unblocker is None: self._transport.resume_reading()
+
+    # Called by the listener protocol when the connection drops
+    def _connection_lost(self):
+        self._lost = True
+        self._fail_waiters(ConnectionError("connection closed by server"))
+
+    # Add a recieved message to the inbox, resolve the future of the message it echos and any watchers
+    #  Echos of health probes only resolve their probe
+    def _deliver(self, mess: Message):
+        seq = mess.seq
+        if seq is None and self._pending: seq = next(iter(self._pending))   # Legacy echo, answers the oldest
+        waiter = None
+        if seq in self._pending:
+            waiter, sent_at = self._pending.pop(seq)
+            self._window_free.set()
+            if seq in self._probes:
+                self._probes.discard(seq)
+                if not waiter.done(): waiter.set_result(mess)
+                return
+            self.metrics.rtt.record(perf_counter_ns() - sent_at)
+        if mess.channel is None: self.inbox.append(mess)
+        else: self._deliver_channel(mess)
+        if waiter is not None and not waiter.done(): waiter.set_result(mess)
+        watchers, self._watchers = self._watchers, []
+        for watcher in watchers:
+            if not watcher.done(): watcher.set_result(mess)
+
+    # Add a recieved message to its channel's inbox
+    #  A full channel inbox never blocks (it would stall every channel on the connection),
+    #  under the block policy its arrivals are dropped instead
+    def _deliver_channel(self, mess: Message):
+        inbox = self.channels.get(mess.channel, self.inbox)
+        if inbox is not self.inbox and inbox.must_wait(): inbox.dropped += 1
+        else: inbox.append(mess)
+
+    # Fail everything still waiting on a recieve
+    def _fail_waiters(self, error: Exception):
+        for waiter, _ in self._pending.values():
+            if not waiter.done(): waiter.set_exception(error)
+        self._pending.clear()
+        self._probes.clear()
+        self._window_free.set()
+        for watcher in self._watchers:
+            if not watcher.done(): watcher.set_exception(error)
+        self._watchers = []
+
+    # =========================================================================
+
+    # ----------------
+    # Sending Messages
+    # ----------------
+
+    # Waits until there is room in the window
+    #  Raises TimeoutError if no echo frees a slot within the echo timeout
+    async def _window_wait(self):
+        while len(self._pending) >= self.window:
+            self._window_free.clear()
+            try: await asyncio.wait_for(self._window_free.wait(), _limit(self.echo_timeout))
+            except TimeoutError: raise TimeoutError(f"no echo within {self.echo_timeout}s, window full") from None
+        if not self.is_connected(): raise ConnectionError("connection is closed")
+
+    # Stamps a message with the next sequence id and registers it in flight
+    #  Returns the future its echo will resolve
+    def _stamp(self, msg: Message, sent_at: int) -> asyncio.Future:
+        msg.seq = self._seq
+        self._seq = (self._seq + 1) % SEQ_LIMIT
+        echo = asyncio.get_running_loop().create_future()
+        self._pending[msg.seq] = (echo, sent_at)
+        return echo
+
+    # Writes frame buffers to the transport, or holds them to coalesce with later sends
+    def _write(self, buffers: list):
+        self.last_active = monotonic()
+        if self.coalesce_us == 0 and self.coalesce_bytes == 0 and len(self._out) == 0:
+            self._transmit(buffers)
+            return
+        self._out.extend(buffers)
+        self._out_bytes += sum(len(buffer) for buffer in buffers)
+        if self.coalesce_bytes and self._out_bytes >= self.coalesce_bytes: self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.coalesce_us / 1e6, self._flush)
+
+    # Writes every held frame in one go
+    def _flush(self):
+        if self._flush_handle is not None: self._flush_handle.cancel()
+        self._flush_handle = None
+        if len(self._out) == 0 or self._transport is None: return
+        self._transmit(self._out)
+        self._out, self._out_bytes = [], 0
+
+    def _transmit(self, buffers: list):
+        if self.recorder is not None: self.recorder.sent(self, buffers)
+        self._transport.writelines(buffers)
+
+    # Stamps, encodes and sends a message once there is room in the window
+    #  Returns a future resolved with the message's echo
+    #  'intended' is when the send was meant to happen (perf_counter_ns), its round trip
+    #  is measured from then rather than from now, so time spent waiting counts too
+    async def message_send_pipelined(self, msg: Message, intended: int = None) -> asyncio.Future:
+        await self._window_wait()
+        started = perf_counter_ns()
+        echo = self._stamp(msg, started if intended is None else intended)
+        frame = encode_message(msg, self.framing, self.codec(), self.compress_min)
+        self.metrics.encode_ns += perf_counter_ns() - started
+        self._write([frame])
+        self.metrics.messages_sent += 1
+        self.metrics.bytes_sent += len(frame)
+        await self._protocol.drain()
+        return echo
+
+    # Stamps, encodes and sends many messages, as many as the window has room for per write
+    #  Each write is a single scatter/gather syscall of every frame's header and text
+    #  Returns the futures resolved with their echos, in send order
+    async def message_send_batch(self, msgs: list[Message]) -> list[asyncio.Future]:
+        echos = []
+        first = 0
+        while first < len(msgs):
+            await self._window_wait()
+            batch = msgs[first:first+max(self.window - len(self._pending), 1)]
+            first += len(batch)
+            started = perf_counter_ns()
+            echos += [self._stamp(msg, started) for msg in batch]
+            buffers = encode_messages(batch, self.framing, self.codec(), self.compress_min)
+            self.metrics.encode_ns += perf_counter_ns() - started
+            self._write(buffers)
+            self.metrics.messages_sent += len(batch)
+            self.metrics.bytes_sent += sum(len(buffer) for buffer in buffers)
+            await self._protocol.drain()
+        return echos
+
+    # Sends an empty unechoed probe outside the window and waits for it to come back
+    #  Returns the round trip in nanoseconds, raises TimeoutError or ConnectionError if it doesn't
+    async def ping(self, timeout: float) -> int:
+        if not self.is_connected(): raise ConnectionError("connection is closed")
+        probe = Message({"modifiers":{"echo":False}})
+        started = perf_counter_ns()
+        echo = self._stamp(probe, started)
+        self._probes.add(probe.seq)
+        self._write([encode_message(probe, self.framing)])
+        await asyncio.wait_for(echo, timeout)
+        return perf_counter_ns() - started
+
+    # Sends a message
+    #  Optionally wait for and return its echo with 'await_echo'
+    #  Raises TimeoutError if the echo doesn't arrive within the echo timeout
+    #  (it still lands in the inbox if it turns up later)
+    async def message_send(self, msg: Message, await_echo: bool = False) -> Message:
+        echo = await self.message_send_pipelined(msg)
+        if await_echo: return (await echo_wait([echo], self.echo_timeout))[0]
+        echo.add_done_callback(_discard_echo)
+        return None
+
+    # Sends every message in batches through the window, returns their echos in send order
+    async def message_send_many(self, msgs: list[Message]) -> list[Message]:
+        return await echo_wait(await self.message_send_batch(msgs), self.echo_timeout)
+
+    # -------------
+    # Reading Inbox
+    # -------------
+
+    # Waits for and returns the next message recieved
+    async def inbox_next(self) -> Message:
+        if not self.is_connected(): raise ConnectionError("connection is closed")
+        watcher = asyncio.get_running_loop().create_future()
+        self._watchers.append(watcher)
+        return await watcher
+
+    # Returns inbox message number n, waiting for it to arrive if needed
+    #  (None if it arrived but was since deleted or dropped)
+    async def inbox_get(self, number: int) -> Message:
+        while number >= self.inbox.next_number(): await self.inbox_next()
+        return self.inbox.get(number)
+
+    # =========================================================================
+
+    # ---------------------------
+    # Opening/Closing Connection
+    # ---------------------------
+
+    # Opens the connection, reads the server's welcome and starts the listener
+    #  Raises OSError (or TimeoutError) if the connection can't be made
+    async def connection_open(self) -> str:
+        if self._transport is not None: raise ConnectionError("connection already open")
+        self._lost = False
+        self._decoder = FrameDecoder(self.framing, RECV_POOL)
+        loop = asyncio.get_running_loop()
+        try:
+            self._transport, self._protocol = await asyncio.wait_for(
+                loop.create_connection(lambda: _ListenerProtocol(self), self.host, self.port), _limit(self.connect_timeout))
+        except TimeoutError: raise TimeoutError(f"no connection within {self.connect_timeout}s") from None
+        try: welcome = await asyncio.wait_for(self._protocol.welcome, _limit(self.welcome_timeout))
+        except (ConnectionError, TimeoutError) as e:
+            await self.connection_close()
+            if isinstance(e, ConnectionError): raise
+            raise TimeoutError(f"no welcome from server within {self.welcome_timeout}s") from None
+        self.welcome, self.codecs = parse_welcome(welcome)
+        return self.welcome
+
+    # Closes the connection and stops the listener
+    async def connection_close(self):
+        if self._transport is None: return
+        self._flush()
+        self._transport.close()
+        await self._protocol.closed
+        if self.recorder is not None: self.recorder.closed(self)
+        if self._unblocker is not None: self._unblocker.cancel()
+        self._fail_waiters(ConnectionError("connection closed"))
+        self._held.clear()
+        self._transport = None
+        self._protocol = None
+        self._unblocker = None
+
+# The listener protocol, feeds the engine's decoder straight from the socket
+#  The first bytes recieved are the server's welcome, everything after is frames
+class _ListenerProtocol(asyncio.BufferedProtocol):
+    def __init__(self, engine: AsyncClient):
+        self.engine = engine
+        loop = asyncio.get_running_loop()
+        self.welcome = loop.create_future()     # Resolved with the welcome text
+        self.closed = loop.create_future()      # Resolved once the connection is gone
+        self._welcome_buffer = bytearray(WELCOME_SIZE)
+        self._drain_waiter = None               # Set while the transport's write buffer is full
+        self._buffer = None                     # Buffer last handed out to recieve into
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        if not self.welcome.done(): self._buffer = memoryview(self._welcome_buffer)
+        else: self._buffer = self.engine._decoder.get_buffer(sizehint)
+        return self._buffer
+
+    def buffer_updated(self, nbytes: int):
+        recorder = self.engine.recorder
+        if recorder is not None:
+            if self.welcome.done(): recorder.recieved(self.engine, self._buffer[:nbytes])
+            else: recorder.welcomed(self.engine, self._buffer[:nbytes])
+        self._buffer = None
+        if not self.welcome.done():
+            self.welcome.set_result(self._welcome_buffer[:nbytes].decode(errors="replace"))
+            self._welcome_buffer = None
+            return
+        self.engine._recieved(nbytes)
+
+    def connection_lost(self, exc: Exception):
+        if not self.welcome.done(): self.welcome.set_exception(ConnectionError("connection closed before welcome"))
+        self.engine._connection_lost()
+        self.resume_writing()
+        if not self.closed.done(): self.closed.set_result(None)
+
+    # Flow control, drain() waits while the transport says its write buffer is full
+    def pause_writing(self):
+        self._drain_waiter = asyncio.get_running_loop().create_future()
+
+    def resume_writing(self):
+        if self._drain_waiter is not None and not self._drain_waiter.done(): self._drain_waiter.set_result(None)
+        self._drain_waiter = None
+
+    async def drain(self):
+        if self._drain_waiter is not None: await self._drain_waiter
+
+# Marks an unwatched echo's outcome as seen, so a failed one isn't reported as never retrieved
+def _discard_echo(echo: asyncio.Future):
+    if not echo.cancelled(): echo.exception()
+
+# Timeout value for asyncio waits, where 0 means no limit
+def _limit(timeout: float) -> float:
+    return timeout or None
+
+# Waits for echo futures, returns their echos in order
+#  Raises TimeoutError once timeout seconds pass without any of them arriving (0 for no limit).
+#  The futures aren't cancelled, echos arriving later still land in the inbox.
+async def echo_wait(echos: list, timeout: float) -> list[Message]:
+    waiting = {echo for echo in echos if not echo.done()}
+    while waiting:
+        done, waiting = await asyncio.wait(waiting, timeout=_limit(timeout), return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            for echo in waiting: echo.add_done_callback(_discard_echo)
+            if len(echos) == 1: raise TimeoutError(f"no echo within {timeout}s")
+            raise TimeoutError(f"{len(waiting)} of {len(echos)} echos didn't arrive within {timeout}s")
+    return [echo.result() for echo in echos]
+
+# =============================================================================
+
+# -----------------
+# Shared Event Loop
+# -----------------
+
+# A single background loop runs the engines of every synchronous Client
+_loop = None
+_loop_lock = Lock()
+
+def _engine_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            Thread(target=_loop.run_forever, name="echo-engine", daemon=True).start()
+    return _loop
+
+# Runs a coroutine on the shared loop from synchronous code and returns its result
+def run_sync(coro, timeout: float = None):
+    return asyncio.run_coroutine_threadsafe(coro, _engine_loop()).result(timeout)
@@ -0,0 +1,160 @@
+import argparse             # For command line options
+import os                   # For os.devnull
+import sys
+from contextlib import redirect_stdout
+from dataclasses import dataclass, field
+
+from client import Client
+from commands import Command, CommandCode, command_get, command_run
+
+# =============================================================================
+# Batch Mode
+#
+# Runs client commands from a script file (or stdin) with no prompts, for
+# driving many sessions from a harness:
+#  * the host and port come from the command line, the client connects before
+#    the script starts
+#  * every line is a command, exactly as typed at the '> ' prompt
+#  * blank lines and lines starting with '#' are skipped
+#  * 'repeat N' runs the lines up to its 'end' N times, 'loop' runs them until
+#    the script quits or a command fails under --stop
+#    (either can take a single command on the same line instead of a block:
+#     'repeat 1000 write hello')
+#
+# Lines are read as the script streams in, and each block is parsed once no
+# matter how many times it repeats.
+#
+# Exit codes:
+#  0  every command succeeded
+#  1  a command failed
+#  2  the script couldn't be opened or parsed
+#  3  the connection couldn't be made
+#
+# ex: python batch.py 127.0.0.1 31800 session.txt
+#     printf 'set instantread off\nrepeat 10000 write hi\n' | python batch.py 127.0.0.1 31800 -q
+# =============================================================================
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_SCRIPT = 2
+EXIT_CONNECT = 3
+
+INTERACTIVE_ONLY = (CommandCode.Simple,)    # Commands which read from the terminal
+
+# Raised for lines a script can't be run with
+class ScriptError(ValueError):
+    pass
+
+# A block of steps run a number of times (None for forever)
+@dataclass
+class Repeat():
+    count: int
+    steps: list = field(default_factory=list)
+
+# How a script run went
+@dataclass
+class BatchResult():
+    commands: int = 0   # Commands run
+    failures: int = 0   # Commands which failed
+
+# =============================================================================
+
+# --------------
+# Reading Scripts
+# --------------
+
+# Turns (line number, line) pairs into steps: Commands and Repeats
+#  Top level steps are yielded as soon as they're read, so a script streamed
+#  over stdin starts running before it ends. A nested read stops at its 'end'.
+def read_steps(lines, nested: bool = False):
+    for number, line in lines:
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"): continue
+        word, _, rest = stripped.partition(" ")
+        word = word.lower()
+        if word == "end":
+            if nested: return
+            raise ScriptError(f"line {number}: 'end' without a 'repeat' or 'loop'")
+        if word in ("repeat", "loop"):
+            count = None
+            if word == "repeat":
+                count, _, rest = rest.strip().partition(" ")
+                if not count.isdigit(): raise ScriptError(f"line {number}: repeat needs a count, ex: 'repeat 100'")
+                count = int(count)
+            if rest.strip(): yield Repeat(count, [_command(number, rest.strip())])
+            else: yield Repeat(count, list(read_steps(lines, True)))
+            continue
+        yield _command(number, line.rstrip("\r\n"))
+    if nested: raise ScriptError("a 'repeat' or 'loop' block is missing its 'end'")
+
+def _command(number: int, line: str) -> Command:
+    cmd = command_get(line)
+    if cmd.opcode == CommandCode.Null: raise ScriptError(f"line {number}: unknown command '{line.strip()}'")
+    if cmd.opcode in INTERACTIVE_ONLY: raise ScriptError(f"line {number}: '{line.strip()}' needs a terminal")
+    return cmd
+
+# =============================================================================
+
+# ---------------
+# Running Scripts
+# ---------------
+
+# Runs steps on a client, returns False once the run should stop (quit, or a failure under stop)
+def run_steps(client: Client, steps: list, result: BatchResult, stop: bool = False) -> bool:
+    for step in steps:
+        if client.killme: return False
+        if isinstance(step, Repeat):
+            done = 0
+            while step.count is None or done < step.count:
+                if not run_steps(client, step.steps, result, stop): return False
+                done += 1
+            continue
+        result.commands += 1
+        if not command_run(client, step, interactive=False):
+            result.failures += 1
+            if stop: return False
+    return True
+
+# Runs a whole script, streaming its lines, returns an exit code
+def run_script(client: Client, lines, result: BatchResult, stop: bool = False) -> int:
+    try:
+        for step in read_steps(enumerate(lines, 1)):
+            if not run_steps(client, [step], result, stop): break
+    except ScriptError as e:
+        print(f" ! {e}", file=sys.stderr)
+        return EXIT_SCRIPT
+    if result.failures > 0: return EXIT_FAILED
+    return EXIT_OK
+
+def main():
+    parser = argparse.ArgumentParser(description="Run client commands from a script, without prompts")
+    parser.add_argument("host")
+    parser.add_argument("port", type=int)
+    parser.add_argument("script", nargs="?", default="-", help="file of commands, '-' (the default) for stdin")
+    parser.add_argument("-q", "--quiet", action="store_true", help="print nothing, only set the exit code")
+    parser.add_argument("-s", "--stop", action="store_true", help="stop at the first failed command")
+    parser.add_argument("--no-connect", action="store_true", help="don't connect before running the script")
+    args = parser.parse_args()
+
+    # Open the script first, so a bad path fails before anything connects
+    try: script = sys.stdin if args.script == "-" else open(args.script)
+    except OSError as e:
+        print(f" ! couldn't open script '{args.script}': {e.strerror}", file=sys.stderr)
+        sys.exit(EXIT_SCRIPT)
+
+    client = Client()
+    result = BatchResult()
+    with redirect_stdout(open(os.devnull, "w") if args.quiet else sys.stdout):
+        client.connection_set_ip(args.host)
+        client.connection_set_port(args.port)
+        if not args.no_connect and not client.connection_establish(): sys.exit(EXIT_CONNECT)
+        try:
+            with script: code = run_script(client, script, result, args.stop)
+        except KeyboardInterrupt: code = EXIT_FAILED
+        if client.is_connected(): client.shutdown()
+    if result.failures > 0 and not args.quiet:
+        print(f" ! {result.failures} of {result.commands} commands failed", file=sys.stderr)
+    sys.exit(code)
+
+if __name__ == "__main__":
+    main()
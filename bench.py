@@ -0,0 +1,283 @@
+import argparse         # For command line options
+import asyncio          # For the end to end scenarios
+import json             # For machine readable results
+import os               # For locating run.py
+import platform         # For recording where results came from
+import socket           # For catching the first byte a started client sends
+import subprocess       # For timing client startup
+import sys
+import time             # For timing
+from threading import Thread
+
+from aclient import AsyncClient
+from commands import command_get
+from messages import (Message, MessageBatch, TemplateCache, encode_message, decode_message, parse_message_data_string,
+                      stringify_message_fancy, FRAMING_BINARY, FRAMING_LEGACY, COMPRESS_MIN)
+from metrics import Histogram
+from server import EchoServer
+from transforms import transform_batch, mismatches
+
+# =============================================================================
+# Benchmark Suite
+#
+# Measures the client's hot paths so regressions are caught before they ship:
+#  * microbenchmarks of encoding, decoding, parsing message strings, reading
+#    commands and formatting messages (singly and in bulk), across text sizes
+#  * end to end scenarios against an echo server the suite starts in process:
+#     - roundtrip:  one message at a time, each awaiting its echo
+#     - burst:      many messages sent back to back, awaiting all the echos
+#     - concurrent: many clients bursting at once
+#  * startup of a fresh client process: from exec until run.py's fast path
+#    sends its first byte, and how long importing the client takes, with the
+#    slowest imports (from -X importtime) listed so a heavy import stands out
+#
+# Every benchmark reports nanoseconds per operation (lower is better). Results
+# can be written as JSON, and compared against a stored baseline: any benchmark
+# slower than the baseline by more than the tolerance is a regression, and the
+# suite exits with status 1.
+#
+# ex: python bench.py --json new.json --baseline base.json --tolerance 0.1
+# =============================================================================
+
+SIZES = (16, 256, 4096, 65536)  # Text sizes microbenchmarks run at
+REPEATS = 5                     # Timing runs per microbenchmark, the best is kept
+TOLERANCE = 0.10                # Slowdown (fraction) counted as a regression
+
+# ---------------
+# Microbenchmarks
+# ---------------
+
+# Times a function, returning the best nanoseconds per call over REPEATS runs
+#  Each run calls it enough times to take at least min_time seconds
+def _time_op(op, min_time: float) -> float:
+    calls = 1
+    while True:
+        start = time.perf_counter_ns()
+        for _ in range(calls): op()
+        took = time.perf_counter_ns() - start
+        if took >= min_time * 1e9: break
+        calls *= 2 if took == 0 else max(2, min(10, int(min_time * 1e9 / took) + 1))
+    best = took / calls
+    for _ in range(REPEATS - 1):
+        start = time.perf_counter_ns()
+        for _ in range(calls): op()
+        best = min(best, (time.perf_counter_ns() - start) / calls)
+    return best
+
+# Yields (name, function) for each microbenchmark
+def _micro_ops():
+    for size in SIZES:
+        text = ("abcdefghij" * (size // 10 + 1))[:size]
+        mess = Message({"text":text, "modifiers":{"caps":True, "rvrs":True}})
+        mess.seq = 7
+        binary = encode_message(mess, FRAMING_BINARY)
+        legacy = encode_message(mess, FRAMING_LEGACY)
+        string = ";caps ;reverse " + text
+        yield (f"encode_message.binary.{size}", lambda: encode_message(mess, FRAMING_BINARY))
+        yield (f"encode_message.legacy.{size}", lambda: encode_message(mess, FRAMING_LEGACY))
+        yield (f"decode_message.binary.{size}", lambda: decode_message(binary))
+        yield (f"decode_message.binary+text.{size}", lambda: decode_message(binary).text)
+        yield (f"decode_message.legacy.{size}", lambda: decode_message(legacy))
+        if size >= COMPRESS_MIN:
+            packed = encode_message(mess, FRAMING_BINARY, "zlib", COMPRESS_MIN)
+            yield (f"encode_message.zlib.{size}", lambda: encode_message(mess, FRAMING_BINARY, "zlib", COMPRESS_MIN))
+            yield (f"decode_message.zlib.{size}", lambda: decode_message(packed))
+        yield (f"parse_message_data_string.{size}", lambda: parse_message_data_string(string))
+        yield (f"write_path.parse+encode.{size}", lambda: encode_message(Message(parse_message_data_string(string))))
+        templates = TemplateCache()
+        templates.message(string)
+        yield (f"write_path.template+encode.{size}", lambda: encode_message(templates.message(string)))
+        yield (f"stringify_message_fancy.{size}", lambda: stringify_message_fancy(mess))
+        if size <= 4096:
+            batch = MessageBatch([mess] * 1000)
+            yield (f"transform_batch.1000x{size}", lambda: transform_batch(batch))
+            yield (f"mismatches.1000x{size}", lambda: mismatches(batch, batch))
+    for line in ("status", "set logging on", "write ;caps hello there", "read 12"):
+        yield (f"command_get.{line.split()[0]}", lambda line=line: command_get(line))
+
+def run_micro(min_time: float, only: str = None) -> dict:
+    results = {}
+    for name, op in _micro_ops():
+        if only and only not in name: continue
+        results[name] = {"ns_per_op": _time_op(op, min_time)}
+    return results
+
+# =============================================================================
+
+# -----------------------
+# End to End Scenarios
+# -----------------------
+
+# Starts an echo server on its own thread's loop, so it doesn't share the clients'
+def _start_server() -> EchoServer:
+    loop = asyncio.new_event_loop()
+    Thread(target=loop.run_forever, name="bench-server", daemon=True).start()
+    server = EchoServer()
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+    return server
+
+def _message(size: int) -> Message:
+    return Message({"text":"x" * size})
+
+async def _roundtrip(port: int, count: int, size: int) -> dict:
+    client = AsyncClient("127.0.0.1", port)
+    await client.connection_open()
+    latency = Histogram()
+    start = time.perf_counter_ns()
+    for _ in range(count):
+        sent = time.perf_counter_ns()
+        await client.message_send(_message(size), True)
+        latency.record(time.perf_counter_ns() - sent)
+    took = time.perf_counter_ns() - start
+    await client.connection_close()
+    return {"ns_per_op": took / count, "p50_ns": latency.percentile(50), "p99_ns": latency.percentile(99)}
+
+async def _burst(port: int, count: int, size: int) -> dict:
+    client = AsyncClient("127.0.0.1", port)
+    await client.connection_open()
+    start = time.perf_counter_ns()
+    await client.message_send_many([_message(size) for _ in range(count)])
+    took = time.perf_counter_ns() - start
+    await client.connection_close()
+    return {"ns_per_op": took / count, "msgs_per_s": count / (took / 1e9)}
+
+async def _concurrent(port: int, clients: int, count: int, size: int) -> dict:
+    members = [AsyncClient("127.0.0.1", port) for _ in range(clients)]
+    await asyncio.gather(*[member.connection_open() for member in members])
+    start = time.perf_counter_ns()
+    await asyncio.gather(*[member.message_send_many([_message(size) for _ in range(count)]) for member in members])
+    took = time.perf_counter_ns() - start
+    await asyncio.gather(*[member.connection_close() for member in members])
+    total = clients * count
+    return {"ns_per_op": took / total, "msgs_per_s": total / (took / 1e9)}
+
+def run_e2e(scale: float, only: str = None) -> dict:
+    server = _start_server()
+    scenarios = {"e2e.roundtrip.64"     : lambda: _roundtrip(server.port, int(2000 * scale), 64),
+                 "e2e.roundtrip.4096"   : lambda: _roundtrip(server.port, int(1000 * scale), 4096),
+                 "e2e.burst.64"         : lambda: _burst(server.port, int(20000 * scale), 64),
+                 "e2e.burst.4096"       : lambda: _burst(server.port, int(5000 * scale), 4096),
+                 "e2e.concurrent.32x64" : lambda: _concurrent(server.port, 32, int(1000 * scale), 64)}
+    results = {}
+    for name in scenarios:
+        if only and only not in name: continue
+        runs = [asyncio.run(scenarios[name]()) for _ in range(3)]
+        results[name] = min(runs, key=lambda run: run["ns_per_op"])
+    return results
+
+# =============================================================================
+
+# -------
+# Startup
+# -------
+
+STARTUP_RUNS = 10       # Client processes started per startup benchmark, the best is kept
+RUN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "run.py")
+
+# Nanoseconds from starting 'python run.py host port' to the first byte it sends
+#  A bare listening socket stands in for the server, so only the client is timed
+def _first_byte() -> int:
+    with socket.create_server(("127.0.0.1", 0)) as listener:
+        started = time.perf_counter_ns()
+        client = subprocess.Popen([sys.executable, RUN_SCRIPT, "127.0.0.1", str(listener.getsockname()[1])],
+                                  stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        client.stdin.write(b"write hi\nquit\n")
+        client.stdin.close()
+        connection, _ = listener.accept()
+        with connection:
+            connection.sendall(b"Welcome!")
+            connection.recv(1)
+            took = time.perf_counter_ns() - started
+    client.wait()
+    return took
+
+# Parses -X importtime output into {module: cumulative microseconds}
+def _import_times(output: str) -> dict:
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line: continue
+        _, cumulative, module = line.split("|")
+        if cumulative.strip().isdigit(): times[module.strip()] = int(cumulative)
+    return times
+
+# Cumulative nanoseconds importing the client's modules, and the slowest imports
+def _imports() -> dict:
+    runs = []
+    for _ in range(STARTUP_RUNS):
+        output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import commands"],
+                                cwd=os.path.dirname(RUN_SCRIPT), capture_output=True, text=True).stderr
+        runs.append(_import_times(output))
+    best = min(runs, key=lambda times: times.get("commands", 0))
+    slowest = sorted((module for module in best if module != "commands"), key=best.get, reverse=True)[:5]
+    return {"ns_per_op": best.get("commands", 0) * 1000, "slowest": {module: best[module] * 1000 for module in slowest}}
+
+def run_startup(only: str = None) -> dict:
+    scenarios = {"startup.first_byte": lambda: {"ns_per_op": min(_first_byte() for _ in range(STARTUP_RUNS))},
+                 "startup.imports"   : _imports}
+    return {name: scenarios[name]() for name in scenarios if not only or only in name}
+
+# =============================================================================
+
+# ---------------------
+# Reporting/Comparing
+# ---------------------
+
+# Returns (name, baseline ns, new ns, ratio, regressed) for benchmarks in both runs
+def compare(results: dict, baseline: dict, tolerance: float = TOLERANCE) -> list:
+    rows = []
+    for name in results:
+        if name not in baseline: continue
+        old = baseline[name]["ns_per_op"]
+        new = results[name]["ns_per_op"]
+        ratio = new / old if old else 1
+        rows.append((name, old, new, ratio, ratio > 1 + tolerance))
+    return rows
+
+def report(results: dict):
+    print(" [Benchmarks]:")
+    for name in results:
+        print(f"  {name:<36} {_format_ns(results[name]['ns_per_op']):>12} per op")
+        for module, ns in results[name].get("slowest", {}).items():
+            print(f"    {module:<34} {_format_ns(ns):>12}")
+
+def report_comparison(rows: list):
+    print(" [Against Baseline]:")
+    for name, old, new, ratio, regressed in rows:
+        mark = "  REGRESSION" if regressed else ""
+        print(f"  {name:<36} {_format_ns(old):>12} -> {_format_ns(new):>12}  {ratio:6.2f}x{mark}")
+
+def _format_ns(ns: float) -> str:
+    if ns >= 1e6: return f"{ns/1e6:.3f}ms"
+    if ns >= 1e3: return f"{ns/1e3:.2f}us"
+    return f"{ns:.0f}ns"
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the client's hot paths")
+    parser.add_argument("--only", help="run only benchmarks whose name contains this")
+    parser.add_argument("--quick", action="store_true", help="shorter runs, noisier numbers")
+    parser.add_argument("--no-e2e", action="store_true", help="skip the end to end scenarios")
+    parser.add_argument("--no-startup", action="store_true", help="skip timing client process startup")
+    parser.add_argument("--json", help="write results to this file ('-' for stdout)")
+    parser.add_argument("--baseline", help="compare against results stored in this file")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="slowdown fraction counted as a regression")
+    args = parser.parse_args()
+
+    results = run_micro(0.02 if args.quick else 0.2, args.only)
+    if not args.no_e2e: results.update(run_e2e(0.2 if args.quick else 1, args.only))
+    if not args.no_startup: results.update(run_startup(args.only))
+
+    if args.json != "-": report(results)
+    document = {"meta"    : {"python":platform.python_version(), "platform":platform.platform(), "time":time.time()},
+                "results" : results}
+    if args.json == "-": json.dump(document, sys.stdout, indent=2)
+    elif args.json:
+        with open(args.json, "w") as f: json.dump(document, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f: baseline = json.load(f)["results"]
+        rows = compare(results, baseline, args.tolerance)
+        if args.json != "-": report_comparison(rows)
+        if any(row[4] for row in rows): sys.exit(1)
+
+if __name__ == "__main__":
+    main()
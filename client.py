@@ -1,9 +1,9 @@
-from threading import Thread    # For listener thread
-
-from sock import socketConnection
-from messages import Message, modify_message, \
-                     encode_message, decode_message, \
+from defaults import WINDOW, CONNECT_TIMEOUT, WELCOME_TIMEOUT, ECHO_TIMEOUT, POOL_POLICIES
+from inbox import Inbox, POLICIES
+from messages import Message, MessageBatch, TemplateCache, modify_message, codec_available, \
+                     FRAMING_BINARY, FRAMING_LEGACY, CODECS, COMPRESS_MIN, \
                      stringify_message_fancy, stringify_message_raw
+from metrics import Metrics
 
 # =============================================================================
 # Echo Client
@@ -11,26 +11,81 @@ from messages import Message, modify_message, \
 # The echo client consists of:
 #  * a user written message, which can be stored, edited, and sent to the server
 #  * an inbox of messages recieved from the server, which can be viewed and emptied 
-#  * a socket connection to the server, wherein the ip and port can be specified
-#  * a threaded reciever, which silently processes bytes recieved on the connection
+#    (optionally bounded, see inbox.py)
+#  * a pool of async engines (pool.py, aclient.py) which own the connections to the server,
+#    wherein the ip and port can be specified, and silently process bytes recieved on them
 #  * various settings which tweak the functionality of the client's operations
 #
 # The user interacts with the client through a command system defined in commands.py
+#
+# The engine runs on a background event loop shared by every Client, so the methods
+# here block only while their own operation is in flight, without spinning. It is
+# only imported (and asyncio with it) once the client first connects.
 # =============================================================================
 
+PATH_SETTINGS = ("inboxlog", "record")  # Settings whose values are file paths, kept in the case they're typed
+
+# Runs one of the engine's coroutines on its shared loop (see aclient.run_sync)
+#  Only the engine makes those, so it's always imported by the time this is called
+def run_sync(coro, timeout: float = None):
+    import aclient
+    return aclient.run_sync(coro, timeout)
+
+# Stands in for a client's ConnectionPool until it first connects, keeping what it's set up with
+class _UnopenedPool():
+    def __init__(self, inbox: Inbox):
+        self.inbox = inbox
+        self.host = None
+        self.port = None
+        self.size = 1
+        self.policy = "roundrobin"
+        self.options = {}       # Engine options configured so far
+        self.codecs = ()
+        self.metrics = Metrics()
+
+    def configure(self, **options):
+        self.options.update(options)
+
+    def is_connected(self) -> bool:
+        return False
+
+    def is_open(self) -> bool:
+        return False
+
+    def describe(self) -> str:
+        return "0/0 connected, 0 reconnects"
+
+    def resize(self, size: int):
+        self.size = size
+
+    # Nothing recieves yet, so unlike the pool's this needs no loop (see ConnectionPool.swap_inbox)
+    def swap_inbox(self, inbox: Inbox) -> Inbox:
+        old = self.inbox
+        if len(inbox) == 0: inbox.append_from(old)
+        self.inbox = inbox
+        return old
+
+    # Imports the engine and returns the pool this stood in for
+    def start(self):
+        from pool import ConnectionPool
+        pool = ConnectionPool(size=self.size, policy=self.policy, inbox=self.inbox)
+        if self.host is not None: pool.host = self.host
+        if self.port is not None: pool.port = self.port
+        pool.configure(**self.options)
+        return pool
+
 class Client():
     # --------------
     # Initialization
     # --------------
 
-    def __init__(self):
+    #  engine replaces the client's own ConnectionPool, ex: a multiplexed channel (see mux.py)
+    def __init__(self, engine = None):
         self._message = None                    # Message written from client
-        self._inbox = []                        # Messages recieved by client
-        self._connection = socketConnection()   # Socket manager
-
-        self._ls_thread = None              # Listener thread
-        self._ls_running = False            # Controls the listener recieve loop
-        self._ls_signal_recieved = False    # Signals True when a recieve occured
+        self._inbox = Inbox() if engine is None else engine.inbox  # Messages recieved by client
+        self._templates = TemplateCache()       # Pre-encoded messages for repeated definitions
+        self._engine = _UnopenedPool(self._inbox) if engine is None else engine  # Connection manager, a ConnectionPool from the first connect
+        self._recorder = None                   # Records the raw traffic while 'record' is set
 
         self.flags = {"logging"     : False,    # Client logs its operations to screen
                       "force"       : False,    # Let messages in buffer be written over
@@ -38,39 +93,28 @@ class Client():
                       "instantsend" : True,     # Instantly send a message once written
                       "instantread" : True,     # Instantly read a message once recieved
                       "burnonsend"  : True,     # Clear the message buffer on send
-                      "burnonread"  : False}    # Delete the recieved message once read
-
+                      "burnonread"  : False,    # Delete the recieved message once read
+                      "legacyframes": False}    # Frame messages with the old text markers
+
+        self.settings = {"window"       : WINDOW,           # Most sent messages awaiting their echo at once
+                         "inboxsize"    : 0,                # Most messages kept in inbox (0 for no limit)
+                         "inboxpolicy"  : "dropoldest",     # What a full inbox does with arrivals
+                         "inboxlog"     : "off",            # Path the inbox is kept on disk at (see inboxlog.py)
+                         "templatecache": self._templates.size, # Most message definitions kept pre-encoded (0 for off)
+                         "coalesceus"   : 0,                # Hold sends up to this long to write them together
+                         "coalescebytes": 0,                # Write held sends once this many bytes wait
+                         "poolsize"     : 1,                # Connections kept open to the server
+                         "poolpolicy"   : "roundrobin",     # How sends are spread across them
+                         "connecttimeout": CONNECT_TIMEOUT, # Seconds to wait for a connection (0 for no limit)
+                         "welcometimeout": WELCOME_TIMEOUT, # Seconds to wait for the server's welcome
+                         "echotimeout"  : ECHO_TIMEOUT,     # Seconds to wait for an echo
+                         "compress"     : "off",            # Codec large texts are sent compressed with
+                         "compressmin"  : COMPRESS_MIN,     # Smallest text (bytes) compressed
+                         "record"       : "off"}            # Path the raw traffic is recorded to (see traffic.py)
         self.killme = False     # Signal client manager to stop processing this client
 
     # =========================================================================
 
-    # ------------------ 
-    # Threaded Recieving
-    # ------------------
-
-    # The listener process
-    # Waits for recieves from socket, appends decoded bytes to client inbox
-    def _listener_process(self):
-        while(self._ls_running):
-            data = self._connection.recv_msg()  # perhaps slight risk of mangled recvs if messages sent in quick succession
-            self._inbox.append(decode_message(data)) # @todo implement multi message decode / bad message conditions in decode_message
-            self._ls_signal_recieved = True
-
-    # Start the listener thread
-    def _listener_start(self):
-        self._ls_thread = Thread(target=self._listener_process)
-        self._ls_running = True
-        self._ls_thread.start()
-
-    # Stop the listener thread
-    def _listener_stop(self):
-        self._ls_running = False
-        self._connection.send_msg(b"Bye!")    # @jank Default rcv causes hanging (no timeout), must send final msg for it to grab
-        self._ls_thread.join()
-        self.inbox_delete(len(self._inbox)-1) # Clear the bye message from inbox
-
-    # =========================================================================
-
     # -------------------------
     # Creating/Sending Messages
     # -------------------------
@@ -78,7 +122,7 @@ class Client():
     # Writes a message object to empty message buffer
     #  Optionally overwrite occupied buffer with 'force' 
     #  Optionally send message instantly with 'instantsend' 
-    def message_write(self, msg: Message):
+    def message_write(self, msg: Message) -> bool:
         if self._message != None:
             print(" ! message in buffer")
             if self.flags["force"]:
@@ -86,67 +130,98 @@ class Client():
                 self.message_clear()
             else:
                 print(" ! cancelling write, clear write buffer or set the 'force' flag to override")
-                return
+                return False
 
         if self.flags["logging"]: print(" . writing message to buffer")
         self._message = msg
-        if self.flags["instantsend"]: self.message_send()
+        if self.flags["instantsend"]: return self.message_send()
+        return True
+
+    # Returns a new message from a definition string ('write' operands)
+    #  Repeated definitions come pre-encoded from the template cache
+    def message_template(self, definition: str) -> Message:
+        return self._templates.message(definition)
 
     # Edits parts of the message in the buffer via dict w/ message component keys
-    def message_edit(self, changes: dict):
+    def message_edit(self, changes: dict) -> bool:
         if self._message == None:
             print(" ! no message in buffer to edit")
-            return
+            return False
 
         if self.flags["logging"]: print(f" . updating message with {changes}")
         modify_message(self._message, changes)
+        return True
 
     # Displays the written message in the buffer
-    def message_view(self):
+    def message_view(self) -> bool:
         if self._message == None:
             print(" ! no message in buffer to view")
-            return
+            return False
 
         print(f" {stringify_message_raw(self._message)}")
+        return True
 
     # Clears the message in the buffer
-    def message_clear(self):
+    def message_clear(self) -> bool:
         if self._message == None:
             print(" ! no message in buffer to clear")
-            return
+            return False
 
         if self.flags["logging"]: print(" . clearing message in buffer")
         self._message = None
+        return True
 
     # Sends the message in the buffer through the connection socket
     #  Optionally wait for and read the recieved echo with 'instantread'
+    #   (without it sends are pipelined, blocking only once 'window' echos are outstanding)
     #  Optionally clear the message buffer on send with 'burnonsend'
-    def message_send(self):
-        if self._connection.sock == None:
+    def message_send(self) -> bool:
+        if not self._engine.is_connected():
             print(" ! connection is closed, aborting send")
-            return
+            return False
         if self._message == None:
             print(" ! no message in buffer to send")
-            return
+            return False
 
-        # Clear the listener's recieved signal
-        self._ls_signal_recieved = False
+        # A blocking full inbox would never take the echo instantread waits for
+        if self.flags["instantread"] and self._inbox.must_wait():
+            print(" ! inbox full and set to block, delete messages before sending")
+            return False
 
-        # Encode+send message
-        if self.flags["logging"]: print(" . encoding message in write buffer")
-        msgbytes = encode_message(self._message)
-        if self.flags["logging"]: print(" . sending encoded message through socket")
-        self._connection.send_msg(msgbytes)
+        # Encode+send message, the engine hands back the echo when instantread wants it
+        if self.flags["logging"]: print(" . encoding and sending message in write buffer")
+        if self.flags["logging"] and self.flags["instantread"]: print(" . waiting for recieve")
+        try: echo = run_sync(self._engine.message_send(self._message, self.flags["instantread"]))
+        except (ConnectionError, OSError) as e:
+            print(f" ! send failed: {e}")
+            return False
 
         # Delete message if set to burnonsend
         if self.flags["burnonsend"]: self.message_clear()
 
-        # If in instantread mode, wait for the recieve signal then display
-        if self.flags["instantread"]:
-            if not self._ls_signal_recieved:
-                if self.flags["logging"]: print(" . waiting for recieve")
-                while not self._ls_signal_recieved: pass    # @jank this will cause a hang if host refuses echo
-            self.inbox_read_top()
+        # If in instantread mode, display the recieved echo
+        if echo is None: return True
+        newest = self._inbox.newest()
+        if newest is not None and (newest[1] is echo    # An inbox log reads back copies, compare what they hold
+                                   or (newest[1].seq, newest[1].bits, newest[1].text) == (echo.seq, echo.bits, echo.text)):
+            self.inbox_read(newest[0])
+        else:
+            print(" ! echo dropped by full inbox")
+            print(f"\n  {self._reader()(echo)}")
+        return True
+
+    # Sends many messages pipelined through the window, returns their echos in send order
+    #  Each window's worth is written with a single syscall
+    #  Bypasses the write buffer, the echos still land in the inbox
+    def message_send_many(self, msgs: list[Message]) -> list[Message]:
+        if not self._engine.is_connected():
+            print(" ! connection is closed, aborting send")
+            return []
+        if self.flags["logging"]: print(f" . pipelining {len(msgs)} messages")
+        try: return run_sync(self._engine.message_send_many(msgs))
+        except (ConnectionError, OSError) as e:
+            print(f" ! send failed: {e}")
+            return []
 
     # =========================================================================
 
@@ -154,58 +229,63 @@ class Client():
     # Reading/Emptying Inbox
     # ----------------------
 
-    # Displays message at index in inbox
+    # Displays message number n in inbox
     #  Optionally delete the message with 'burnonread'
     #  Optionally display the message raw with 'rawread'
-    def inbox_read(self, index: int):
-        if index < 0 or index >= len(self._inbox):
-            print(f" ! inbox message {index+1} doesn't exist")
-            return
-        reader = stringify_message_fancy
-        if self.flags["rawread"]: reader = stringify_message_raw
-        print(f"\n  {reader(self._inbox[index])}")
-        if self.flags["burnonread"]: self.inbox_delete(messindex)
+    def inbox_read(self, number: int) -> bool:
+        mess = self._inbox.get(number)
+        if mess is None:
+            print(f" ! inbox message {number} doesn't exist")
+            return False
+        print(f"\n  {self._reader()(mess)}")
+        if self.flags["burnonread"]: self.inbox_delete(number)
+        return True
 
     # Displays the most recent message added to inbox
     #  Optionally delete the message with 'burnonread'
     #  Optionally display raw message data with 'rawread'
-    def inbox_read_top(self):
-        if len(self._inbox) == 0:
+    def inbox_read_top(self) -> bool:
+        newest = self._inbox.newest()
+        if newest is None:
             print(" ! inbox empty")
-            return
-        self.inbox_read(len(self._inbox)-1)
+            return False
+        return self.inbox_read(newest[0])
 
     # Displays all messages in inbox
     #  Optionally empty inbox with 'burnonread'
     #  Optionally display messages raw with 'rawread'
-    def inbox_read_all(self):
-        if len(self._inbox) == 0:
+    def inbox_read_all(self) -> bool:
+        messages = self._inbox.items()
+        if len(messages) == 0:
             print(" ! inbox empty")
-            return
-        reader = stringify_message_fancy
-        if self.flags["rawread"]: reader = stringify_message_raw
+            return False
+        if self.flags["rawread"]: lines = [stringify_message_raw(mess) for _, mess in messages]
+        else:
+            from transforms import transform_batch  # Only imported once asked for, keeping startup short
+            lines = transform_batch(MessageBatch(mess for _, mess in messages))     # Whole inbox at once
         print()
-        for messindex in range(len(self._inbox)-1, -1, -1):
-            print(f"  {messindex+1}. {reader(self._inbox[messindex])}")
+        for i in reversed(range(len(messages))):
+            print(f"  {messages[i][0]}. {lines[i]}")
         print()
         if self.flags["burnonread"]: self.inbox_empty()
+        return True
 
-    # Delete message at index in inbox
-    def inbox_delete(self, index: int):
-        if index < 0 or index >= len(self._inbox):
-            print(f" ! inbox message {index+1} doesn't exist")
-            return
-        if self.flags["logging"]: print(f" . deleting inbox message {index+1}")
-        del self._inbox[index]
+    # Delete message number n in inbox
+    def inbox_delete(self, number: int) -> bool:
+        if self.flags["logging"]: print(f" . deleting inbox message {number}")
+        if not self._inbox.delete(number):
+            print(f" ! inbox message {number} doesn't exist")
+            return False
+        return True
 
     # Delete all messages in inbox
-    def inbox_empty(self):
+    def inbox_empty(self) -> bool:
         if len(self._inbox) == 0:
             print(f" ! inbox already empty")
-            return
+            return False
         if self.flags["logging"]: print(f" . emptying {len(self._inbox)} messages from inbox")
-        self._inbox = []
-        # alternatively: for i in range(0, len(self._inbox)): self.inbox_delete(i)
+        self._inbox.clear()
+        return True
 
     # =========================================================================
 
@@ -213,40 +293,55 @@ class Client():
     # Setting/Opening/Closing Connection
     # ----------------------------------
 
-    def connection_set_ip(self, ip: str):
-        if self._connection.sock is not None:
+    def connection_set_ip(self, ip: str) -> bool:
+        if self._engine.is_connected():
             print(" ! connection active, disconnect to change ip")
-            return
+            return False
         if self.flags["logging"]: print(f" . setting connection host to {ip}")
-        self._connection.host = ip  # ip validity verified by manager on connect
+        self._engine.host = ip  # ip validity verified by engine on connect
+        return True
 
-    def connection_set_port(self, port: int):
-        if self._connection.sock is not None:
+    def connection_set_port(self, port: int) -> bool:
+        if self._engine.is_connected():
             print(" ! connection active, disconnect to change port")
-            return
+            return False
+        if not 1 <= port <= 65535:
+            print(f" ! can't set port to {port}, must be between 1 and 65535")
+            return False
         if self.flags["logging"]: print(f" . setting connection port to {port}")
-        self._connection.port = port # port validitiy verified by manager on connect
+        self._engine.port = port # port validitiy verified by engine on connect
+        return True
 
-    def connection_establish(self):
-        if self._connection.sock is not None:
+    def connection_establish(self) -> bool:
+        if self._engine.is_connected():
             print(" ! connection already established")
-            return
+            return False
+        if type(self._engine) is _UnopenedPool: self._engine = self._engine.start()    # First connect, bring up the engine
+        if self._engine.is_open(): run_sync(self._engine.connection_close())   # Clean up after a dropped connection
         if self.flags["logging"]: print(" . establishing connection")
-        if self._connection.open():
-            print(f" The server says: {self._connection.recv_msg().decode()}") # Welcome from server
-            if self.flags["logging"]: print(" . starting listener thread")
-            self._listener_start()
-        else: print(" ! connection failed")
-
-    def connection_close(self):
-        if self._connection.sock is None:
+        self._engine.configure(framing=self._framing())
+        try: welcome = run_sync(self._engine.connection_open())
+        except (OSError, TimeoutError, OverflowError, ValueError) as e:  # Bad endpoints fail here too
+            print(f" ! connection failed: {e or 'timed out'}")
+            return False
+        print(f" Connected to {self._engine.host}:{self._engine.port} ({self._engine.describe()})")
+        print(f" The server says: {welcome}") # Welcome from server
+        self._compress_check()
+        return True
+
+    # Warns when the server won't take the frames the 'compress' setting asks for
+    def _compress_check(self):
+        compress = self.settings["compress"]
+        if compress != "off" and (compress not in self._engine.codecs or self.flags["legacyframes"]):
+            print(f" ! server doesn't accept {compress} compressed frames, sending uncompressed")
+
+    def connection_close(self) -> bool:
+        if not self._engine.is_open():
             print(" ! connection already closed")
-            return
-        if self.flags["logging"]: print(" . stopping listener thread")
-        self._listener_stop()
-        while self._ls_running: pass
+            return False
         if self.flags["logging"]: print(" . closing connection")
-        self._connection.close()
+        run_sync(self._engine.connection_close())
+        return True
 
     # =========================================================================
 
@@ -254,21 +349,162 @@ class Client():
     # Meta Client Functions
     # ---------------------
 
+    # The function messages are displayed with, chosen by the 'rawread' flag
+    def _reader(self):
+        if self.flags["rawread"]: return stringify_message_raw
+        return stringify_message_fancy
+
+    # The framing messages are sent and recieved with, chosen by the 'legacyframes' flag
+    def _framing(self) -> str:
+        if self.flags["legacyframes"]: return FRAMING_LEGACY
+        return FRAMING_BINARY
+
+    # Changes a client setting from its string value, returns whether it was accepted
+    def setting_set(self, setting: str, value: str) -> bool:
+        match setting:
+            case "window":
+                if not value.isdigit() or int(value) < 1:
+                    print(f" ! window must be a whole number above 0, not '{value}'")
+                    return False
+                self.settings["window"] = int(value)
+                self._engine.configure(window=int(value))
+            case "inboxsize":
+                if not value.isdigit():
+                    print(f" ! inboxsize must be a whole number (0 for no limit), not '{value}'")
+                    return False
+                self.settings["inboxsize"] = int(value)
+                self._inbox.configure(capacity=int(value))
+            case "inboxpolicy":
+                if value not in POLICIES:
+                    print(f" ! inboxpolicy must be one of {', '.join(POLICIES)}, not '{value}'")
+                    return False
+                self.settings["inboxpolicy"] = value
+                self._inbox.configure(policy=value)
+            case "inboxlog":
+                if not self._inbox_move(value): return False
+                self.settings["inboxlog"] = value
+            case "templatecache":
+                if not value.isdigit():
+                    print(f" ! templatecache must be a whole number (0 to turn off), not '{value}'")
+                    return False
+                self.settings["templatecache"] = int(value)
+                self._templates.resize(int(value))
+            case "coalesceus" | "coalescebytes":
+                if not value.isdigit():
+                    print(f" ! {setting} must be a whole number (0 to turn off), not '{value}'")
+                    return False
+                self.settings[setting] = int(value)
+                self._engine.configure(coalesce_us=self.settings["coalesceus"],
+                                       coalesce_bytes=self.settings["coalescebytes"])
+            case "poolsize":
+                if not value.isdigit() or int(value) < 1:
+                    print(f" ! poolsize must be a whole number above 0, not '{value}'")
+                    return False
+                self.settings["poolsize"] = int(value)
+                if type(self._engine) is _UnopenedPool: self._engine.resize(int(value))
+                else: run_sync(self._engine.resize(int(value)))
+            case "poolpolicy":
+                if value not in POOL_POLICIES:
+                    print(f" ! poolpolicy must be one of {', '.join(POOL_POLICIES)}, not '{value}'")
+                    return False
+                self.settings["poolpolicy"] = value
+                self._engine.policy = value
+            case "connecttimeout" | "welcometimeout" | "echotimeout":
+                try: seconds = float(value)
+                except ValueError: seconds = -1
+                if not 0 <= seconds < float("inf"):
+                    print(f" ! {setting} must be a number of seconds (0 for no limit), not '{value}'")
+                    return False
+                self.settings[setting] = seconds
+                self._engine.configure(**{setting.removesuffix("timeout") + "_timeout": seconds})
+            case "compress":
+                if value != "off" and value not in CODECS:
+                    print(f" ! compress must be off or one of {', '.join(CODECS)}, not '{value}'")
+                    return False
+                if value != "off" and not codec_available(value):
+                    print(f" ! this Python can't compress with {value}")
+                    return False
+                self.settings["compress"] = value
+                self._engine.configure(compress=value)
+                if self._engine.is_connected(): self._compress_check()
+            case "compressmin":
+                if not value.isdigit():
+                    print(f" ! compressmin must be a whole number of bytes, not '{value}'")
+                    return False
+                self.settings["compressmin"] = int(value)
+                self._engine.configure(compress_min=int(value))
+            case "record":
+                if not self._record(value): return False
+                self.settings["record"] = value
+            case _:
+                print(f" ! unknown client setting '{setting}'")
+                return False
+        if self.flags["logging"]: print(f" . {setting} set to {self.settings[setting]}")
+        return True
+
+    # Moves the inbox onto the log at a path ('off' for back into memory), returns whether it could
+    #  An existing log is reopened as it was left. Otherwise the current messages move across.
+    def _inbox_move(self, path: str) -> bool:
+        if path == self.settings["inboxlog"]: return True
+        capacity = self.settings["inboxsize"]
+        policy = self.settings["inboxpolicy"]
+        from inboxlog import InboxLog   # Only imported once asked for, keeping startup short
+        try: inbox = Inbox(capacity, policy) if path == "off" else InboxLog(path, capacity, policy)
+        except (OSError, ValueError) as e:
+            print(f" ! couldn't open inbox log '{path}': {e}")
+            return False
+        if self.flags["logging"] and len(inbox) > 0: print(f" . reopened inbox log with {len(inbox)} messages")
+        if type(self._engine) is _UnopenedPool: self._engine.swap_inbox(inbox).close()
+        else: run_sync(self._engine.swap_inbox(inbox)).close()
+        self._inbox = inbox
+        return True
+
+    # Starts recording every connection's traffic to a trace at a path ('off' to stop), returns whether it could
+    #  An existing trace at the path is replaced
+    def _record(self, path: str) -> bool:
+        if path == self.settings["record"]: return True
+        from traffic import TraceRecorder   # Only imported once asked for, keeping startup short
+        try: recorder = None if path == "off" else TraceRecorder(path)
+        except OSError as e:
+            print(f" ! couldn't open trace '{path}': {e}")
+            return False
+        self._engine.configure(recorder=recorder)
+        if self._recorder is not None: self._recorder.close()
+        self._recorder = recorder
+        return True
+
     # Returns a dict describing the state of each client component
     def get_state(self) -> dict:
-        state = {"connection":((self._connection.sock is not None)*"Active" + (self._connection.sock is None)*"Disconnected"),
-                 "connectionhost":self._connection.host,
-                 "connectionport":self._connection.port,
+        connected = self._engine.is_connected()
+        state = {"connection":(connected*"Active" + (not connected)*"Disconnected"),
+                 "connectionhost":self._engine.host,
+                 "connectionport":self._engine.port,
+                 "connectionpool":self._engine.describe(),
                  "messagebuffer":((self._message is not None)*"Occupied" + (self._message is None)*"Empty"),
-                 "recievebuffer":(str(len(self._inbox)) + " messages"),
-                 "flags":{}}
+                 "templates":self._templates.describe(),
+                 "recievebuffer":(str(len(self._inbox)) + " messages" + (self._inbox.dropped > 0)*f" ({self._inbox.dropped} dropped)"),
+                 "flags":{},
+                 "settings":{},
+                 "metrics":self.metrics().summary()}
         for flag in self.flags:
             state["flags"][flag] = self.flags[flag]*"on" + (not self.flags[flag])*"off"
+        for setting in self.settings:
+            state["settings"][setting] = str(self.settings[setting])
         return state
 
+    # Whether any connection to the server is up
+    def is_connected(self) -> bool:
+        return self._engine.is_connected()
+
+    # Metrics of the connections the client sends on (see ConnectionPool.metrics)
+    def metrics(self) -> Metrics:
+        return self._engine.metrics
+
     # Gracefully shutdown client connection, set the kill signal
     def shutdown(self):
         if self.flags["logging"]: print(" . shutting down")
         self.connection_close()
+        self._inbox.close()
+        if self._recorder is not None: self._recorder.close()
         self.killme = True
 
@@ -1,14 +1,59 @@
 from enum import Enum
 from dataclasses import dataclass
+from functools import lru_cache
 
-from client import Client
-from messages import Message, parse_message_data_string
+from client import Client, PATH_SETTINGS
+from messages import parse_message_data_string
 
 # =============================================================================
 # Here lies all commands possible with our echo client:
 #
 # Commands are simple structs holding a command type and any related operands.
 # Command logic is defined in single functions which operate on Client objects.
+#
+# Each command is declared once, with the @command decorator on its procedure:
+# its name, aliases, group, how many operands it takes and its help text. The
+# CommandCode types, the lookup table command_get dispatches through and the
+# help command's text are all built from these declarations.
+# =============================================================================
+
+# ----------------
+# Command Registry
+# ----------------
+
+# Command groups, in the order help lists them
+GROUPS = {"client"     : "Client",
+          "messages"   : "Messages",
+          "inbox"      : "Inbox",
+          "connection" : "Connection"}
+
+# Everything known about one command
+@dataclass(frozen=True)
+class CommandSpec():
+    name: str               # Word that runs the command
+    procedure: callable     # Function implementing it
+    signature: int          # Arguments the procedure takes: 0b01 operands, 0b10 client, 0b11 both
+    group: str              # Group it's listed under in help
+    arity: tuple            # (fewest, most) operands accepted, most None for no limit
+    desc: str               # Help description
+    exam: str               # Help examples
+    aliases: tuple = ()     # Other words that run the command
+    raw: bool = False       # Takes the rest of the line as one operand, spacing and case kept
+    keepcase: bool = False  # Operands keep their case, the procedure lowercases what it needs to
+
+COMMANDS = {}   # Command name -> CommandSpec, in declaration order
+
+# Declares the decorated procedure as a command
+#  Its signature is read from the procedure's parameters (client and/or operands)
+def command(name: str, group: str, desc: str, exam: str, arity: tuple = (0, 0), aliases: tuple = (), raw: bool = False,
+            keepcase: bool = False):
+    def declare(procedure):
+        params = procedure.__code__.co_varnames[:procedure.__code__.co_argcount]     # Its parameter names
+        signature = (0b10 if "client" in params else 0) | (0b01 if "operands" in params else 0)
+        COMMANDS[name] = CommandSpec(name, procedure, signature, group, arity, desc, exam, aliases, raw, keepcase)
+        return procedure
+    return declare
+
 # =============================================================================
 
 # ------------------
@@ -16,24 +61,22 @@ from messages import Message, parse_message_data_string
 # ------------------
 
 # -----------------------------
-#     HELP/STATUS/SET/QUIT
+#  HELP/STATUS/STATS/SET/QUIT
 # miscellaneous client commands
 # -----------------------------
 
 # HELP
 # Prints instructions on how to use the client
-def cmd_help(operands: list[str]):
-    cmds = operands
+@command("help", "client", "lends a helping hand", "'help' / 'help all'", arity=(0, None), aliases=("?",))
+def cmd_help(operands: list[str]) -> bool:
+    cmds = list(operands)
+    success = True
     if len(cmds) == 0:
         print(" [Commands]: ")
-        print("  [Client]:")
-        print("   * help * status * set * quit")
-        print("  [Messages]:")
-        print("   * write * view * edit * clear * send * simple")
-        print("  [Inbox]:")
-        print("   * read * delete * empty")
-        print("  [Connection]:")
-        print("   * host * port * connect * disconnect\n")
+        for group in GROUPS:
+            print(f"  [{GROUPS[group]}]:")
+            print("   " + " ".join(f"* {spec.name}" for spec in COMMANDS.values() if spec.group == group))
+        print()
         print("  Run this command with commands or command groups you want help with (or all for all commands)")
         print("  ex: 'help status' / 'help write status delete' / 'help messages' / 'help all'\n")
 
@@ -44,7 +87,25 @@ def cmd_help(operands: list[str]):
         print("  * instantsend  instantly send a message on write")
         print("  * instantread  instantly read a message on echo recieve")
         print("  * burnonsend   clear your message after sending")
-        print("  * burnonread   delete your recieved echos once read\n")
+        print("  * burnonread   delete your recieved echos once read")
+        print("  * legacyframes send messages in the old text marker format (for draco1 style servers)\n")
+
+        print(" [Client Settings]: ")
+        print("  * window       most sent messages awaiting their echo at once (with instantread off)")
+        print("  * inboxsize    most messages kept in the inbox, 0 for no limit")
+        print("  * inboxpolicy  what a full inbox does with new echos: dropoldest | dropnewest | block")
+        print("  * inboxlog     keep the inbox on disk at this path (reopened if it exists), off for memory")
+        print("  * templatecache most message definitions kept pre-encoded for repeat writes, 0 for off")
+        print("  * coalesceus   hold sends up to this many microseconds to write them together, 0 for off")
+        print("  * coalescebytes write held sends once this many bytes are waiting, 0 for off")
+        print("  * poolsize     connections kept open to the server, dropped ones reconnect on their own")
+        print("  * poolpolicy   how sends are spread across connections: roundrobin | leastinflight")
+        print("  * connecttimeout seconds to wait for a connection to open, 0 for no limit")
+        print("  * welcometimeout seconds to wait for the server's welcome, 0 for no limit")
+        print("  * echotimeout  seconds to wait for an echo before reporting it missing, 0 for no limit")
+        print("  * compress     send large texts compressed, if the server accepts it: off | zlib | lzma")
+        print("  * compressmin  smallest text (in bytes) worth compressing")
+        print("  * record       record the raw traffic to a trace at this path for replay (see traffic.py), off to stop\n")
 
         print(" [Writing Messages]:")
         print("  Message modifiers begin with ';'.")
@@ -59,111 +120,75 @@ def cmd_help(operands: list[str]):
         print("  * ;reverse  reverse the message")
         print("  * ;text     explicitly begin your message's text")
     else:
-        if "all" in cmds: cmds = ["client", "messages", "inbox", "connection"]
-        if "client" in cmds:
-            cmds += ["help", "status", "set", "quit"]
-            cmds.remove("client")
-        if "messages" in cmds:
-            cmds += ["write", "view", "edit", "clear", "send", "simple"]
-            cmds.remove("messages")
-        if "inbox" in cmds:
-            cmds += ["read", "delete", "empty"]
-            cmds.remove("inbox")
-        if "connection" in cmds:
-            cmds += ["host", "port", "connect", "disconnect"]
-            cmds.remove("connection")
-        cmds = list(dict.fromkeys(cmds)) # remove duplicates
+        if "all" in cmds: cmds = list(GROUPS)
+        expanded = []
+        for cmd in cmds:
+            if cmd in GROUPS: expanded += [spec.name for spec in COMMANDS.values() if spec.group == cmd]
+            else: expanded.append(cmd)
+        cmds = list(dict.fromkeys(expanded)) # remove duplicates
     for cmd in cmds:
-        desc = None
-        exam = None
-        match cmd:
-            case "help":
-                desc = "lends a helping hand"
-                exam = "'help' / 'help all'"
-            case "status":
-                desc = "displays the current state of the client"
-                exam = "'status'"
-            case "set":
-                desc = "sets a client flag on or off"
-                exam = "'set instantsend on' / 'set instantread off'"
-            case "quit":
-                desc = "shuts down connection and quits the client"
-                exam = "'quit'"
-            case "write":
-                desc = "write a message to the write buffer"
-                exam = "ex: 'write yourmsghere' / 'write ;mod1 ;mod2 ... yourmsghere'"
-            case "view":
-                desc = "view the message in the write buffer"
-                exam = "'view'"
-            case "edit":
-                desc = "edit a message in the write buffer"
-                exam = "'edit changetexttothis' / 'edit ;mod1 ;mod2' "
-            case "clear":
-                desc = "clear the write buffer"
-                exam = "'clear'"
-            case "send":
-                desc = "send message in buffer to server"
-                exam = "'send'"
-            case "simple":
-                desc = "enter simple mode: write messages and read echos instantly without commands"
-                exam = "'simple'"
-            case "read":
-                desc = "read one, all, or the most recent message in inbox"
-                exam = "'read' / 'read 1' / 'read all'"
-            case "delete":
-                desc = "delete a single message from inbox"
-                exam = "'delete 1'"
-            case "empty":
-                desc = "delete all messages in inbox"
-                exam = "'empty'"
-            case "host":
-                desc = "set the connection host address"
-                exam = "'host 127.0.0.1' / 'host draco1'"
-            case "port":
-                desc = "set the connection host port"
-                exam = "'port 31800'"
-            case "connect":
-                desc = "attempt a connection with the set host and port"
-                exam = "'connect'"
-            case "disconnect":
-                desc = "disconnect from the established connection"
-                exam = "'disconnect'"
-            case _:
-                print(f" ! can't help you with '{cmd}'")
-                continue
-        print(f"\n [{cmd}]")
-        print(f"  {desc}")
-        print(f"  ex: {exam}")
+        code = _LOOKUP.get(cmd)
+        if code is None:
+            print(f" ! can't help you with '{cmd}'")
+            success = False
+            continue
+        spec = code.value
+        print(f"\n [{spec.name}]")
+        print(f"  {spec.desc}")
+        print(f"  ex: {spec.exam}")
+        if spec.aliases: print(f"  aliases: {' / '.join(spec.aliases)}")
+    return success
 
 # STATUS
 # Displays the state of the client's components
+@command("status", "client", "displays the current state of the client", "'status'")
 def cmd_status(client: Client) -> bool:
     client_state = client.get_state()
 
     print(f" Connection: {client_state["connection"]}")
     print(f" Host: {client_state["connectionhost"]}")
-    print(f" Port: {client_state["connectionport"]}\n")
+    print(f" Port: {client_state["connectionport"]}")
+    print(f" Pool: {client_state["connectionpool"]}\n")
 
     print(f" Write Buffer: {client_state["messagebuffer"]}")
+    print(f" Templates: {client_state["templates"]}")
     print(f" Inbox: {client_state["recievebuffer"]}\n")
 
     for flag in client_state["flags"]:
         print(f"  {flag}: {client_state["flags"][flag]}")
+    print()
 
+    for setting in client_state["settings"]:
+        print(f"  {setting}: {client_state["settings"][setting]}")
+
+    return True
+
+# STATS
+# Displays the client's traffic counters and round trip latencies
+@command("stats", "client", "displays traffic counters and round trip latency percentiles", "'stats'")
+def cmd_stats(client: Client) -> bool:
+    client_metrics = client.get_state()["metrics"]
+    for metric in client_metrics:
+        print(f" {metric}: {client_metrics[metric]}")
     return True
 
 # SET
-# Toggle parts of the client on/off
+# Toggle parts of the client on/off, or change a client setting
+@command("set", "client", "sets a client flag on or off, or a client setting to a value",
+         "'set instantsend on' / 'set instantread off' / 'set window 128'", arity=(2, 2), keepcase=True)
 def cmd_set(client: Client, operands: list[str]) -> bool:
-    if len(operands) != 2:
-        print(" ! bad set command, must be 3 words (set flag on/off)")
-        return False
-
     success = True
-    flag = operands[0]
+    flag = operands[0].lower()
     onoff = operands[1]
-    if flag in client.flags:
-        if onoff in ["on", "off"]:
+    if flag not in PATH_SETTINGS or onoff.lower() == "off": onoff = onoff.lower()   # Paths keep their case
+    if flag in client.settings:
+        success = client.setting_set(flag, onoff)
+        if success: print(f" {flag}: {client.settings[flag]}")
+    elif flag in client.flags:
+        if flag == "legacyframes" and client.is_connected():    # Framing is fixed when the connection opens
+            print(" ! connection active, disconnect to change legacyframes")
+            success = False
+        elif onoff in ["on", "off"]:
             client.flags[flag] = onoff == "on"
             print(f" {flag}: {client.flags[flag]}")
         else:
@@ -176,6 +201,7 @@ def cmd_set(client: Client, operands: list[str]) -> bool:
 
 # QUIT
 # Closes the connection, sets the client's kill signal
+@command("quit", "client", "shuts down connection and quits the client", "'quit'", aliases=("exit",))
 def cmd_quit(client: Client) -> bool:
     client.shutdown()
     return True
@@ -187,41 +213,43 @@ def cmd_quit(client: Client) -> bool:
 
 # WRITE
 # Creates a Message from string & writes it to the client's write buffer
+@command("write", "messages", "write a message to the write buffer",
+         "'write yourmsghere' / 'write ;mod1 ;mod2 ... yourmsghere'", arity=(0, 1), raw=True)
 def cmd_write(client: Client, operands: list[str]) -> bool:
     if len(operands) > 0: msg_definition_str = operands[0]
     else: msg_definition_str = ""   # allow for blank messages
-    mess = Message(parse_message_data_string(msg_definition_str))
-    client.message_write(mess)
-    return True
+    return client.message_write(client.message_template(msg_definition_str))
 
 # VIEW
 # View the message in buffer
+@command("view", "messages", "view the message in the write buffer", "'view'")
 def cmd_view(client: Client) -> bool:
-    client.message_view()
-    return True
+    return client.message_view()
 
 # EDIT
 # Edit the message in buffer
+@command("edit", "messages", "edit a message in the write buffer",
+         "'edit changetexttothis' / 'edit ;mod1 ;mod2'", arity=(0, 1), raw=True)
 def cmd_edit(client: Client, operands: list[str]) -> bool:
     if len(operands) > 0: msg_definition_str = operands[0]
     else: msg_definition_str = ""   # allow for empty edits
-    client.message_edit(parse_message_data_string(msg_definition_str))
-    return True
+    return client.message_edit(parse_message_data_string(msg_definition_str))
 
 # CLEAR
 # Clear message from client write buffer
+@command("clear", "messages", "clear the write buffer", "'clear'")
 def cmd_clear(client: Client) -> bool:
-    client.message_clear()
-    return True
+    return client.message_clear()
 
 # SEND
 # Send message in buffer over connection
+@command("send", "messages", "send message in buffer to server", "'send'")
 def cmd_send(client: Client) -> bool:
-    client.message_send()
-    return True
+    return client.message_send()
 
 # SIMPLE
 # Basic send and echo mode, loops writing and sending a new message each input
+@command("simple", "messages", "enter simple mode: write messages and read echos instantly without commands", "'simple'")
 def cmd_simple(client: Client) -> bool:
     print(" entering simple echo mode")
     print(" type 'complex' before your message text/modifiers to quit\n")
@@ -239,10 +267,11 @@ def cmd_simple(client: Client) -> bool:
     client.flags["burnonsend"] = True
     #client.flags["burnonread"] = True
 
-    # Write input loop
+    # Write input loop, each line is written as the operands of 'write' would be
     inpt = input(": ")
     while inpt != "complex":
-        command_run(client, command_get("write " + inpt))
+        client.message_write(client.message_template(inpt))
+        print()
         inpt = input(": ")
 
     print( "exiting simple echo mode")
@@ -260,14 +289,12 @@ def cmd_simple(client: Client) -> bool:
 
 # READ
 # Read one, all, or most recent message in inbox
+@command("read", "inbox", "read one, all, or the most recent message in inbox", "'read' / 'read 1' / 'read all'", arity=(0, 1))
 def cmd_read(client: Client, operands: list[str]) -> bool:
-    if len(operands) > 1:
-        print(" ! bad read command, must be 1 or 2 words (read / read all / read n)")
-        return
     success = True
-    if len(operands) == 0: client.inbox_read_top()                    # No operands, read top
-    elif operands[0] == "all": client.inbox_read_all()                # "All", list entire inbox
-    elif operands[0].isdigit(): client.inbox_read(int(operands[0])-1) # Int, read msg at index
+    if len(operands) == 0: success = client.inbox_read_top()                    # No operands, read top
+    elif operands[0] == "all": success = client.inbox_read_all()                # "All", list entire inbox
+    elif operands[0].isdigit(): success = client.inbox_read(int(operands[0]))   # Int, read msg by number
     else:
         print(f" ! can't read '{operands[0]}', only (read / read all / read n) accepted")
         success = False
@@ -275,12 +302,10 @@ def cmd_read(client: Client, operands: list[str]) -> bool:
 
 # DELETE
 # Delete a specific number in inbox
+@command("delete", "inbox", "delete a single message from inbox", "'delete 1'", arity=(1, 1))
 def cmd_delete(client: Client, operands: list[str]) -> bool:
-    if len(operands) != 1:
-        print(" ! bad delete command, must be 2 words (delete n)")
-        return
     success = True
-    if operands[0].isdigit(): client.inbox_delete(int(operands[0])-1)
+    if operands[0].isdigit(): success = client.inbox_delete(int(operands[0]))
     else:
         print(f" ! can't delete '{operands[0]}', must be inbox message number")
         success = False
@@ -288,9 +313,9 @@ def cmd_delete(client: Client, operands: list[str]) -> bool:
 
 # EMPTY
 # Delete entire inbox
+@command("empty", "inbox", "delete all messages in inbox", "'empty'")
 def cmd_empty(client: Client) -> bool:
-    client.inbox_empty()
-    return True
+    return client.inbox_empty()
 
 # ----------------------------
 # HOST/PORT/CONNECT/DISCONNECT
@@ -298,34 +323,29 @@ def cmd_empty(client: Client) -> bool:
 # ----------------------------
 
 # Set the client's connection socket host
+@command("host", "connection", "set the connection host address", "'host 127.0.0.1' / 'host draco1'", arity=(1, 1))
 def cmd_host(client: Client, operands: list[str]) -> bool:
-    if len(operands) != 1:
-        print(" ! bad host command, must be 2 words (host address")
-        return
-    client.connection_set_ip(operands[0])
-    return True
+    return client.connection_set_ip(operands[0])
 
-# Set the client's connection socket port 
+# Set the client's connection socket port
+@command("port", "connection", "set the connection host port", "'port 31800'", arity=(1, 1))
 def cmd_port(client: Client, operands: list[str]) -> bool:
-    if len(operands) != 1:
-        print(" ! bad port command, must be 2 words (port 31800)")
-        return
     success = True
-    if operands[0].isdigit(): client.connection_set_port(int(operands[0]))
+    if operands[0].isdigit(): success = client.connection_set_port(int(operands[0]))
     else:
         success = False
         print(f" ! can't set port to '{operands[0]}', must be int")
     return success
 
 # Activate the client's connection socket
+@command("connect", "connection", "attempt a connection with the set host and port", "'connect'")
 def cmd_connect(client: Client) -> bool:
-    client.connection_establish()
-    return True
+    return client.connection_establish()
 
 # Disconnect the client's connection socket
+@command("disconnect", "connection", "disconnect from the established connection", "'disconnect'")
 def cmd_disconnect(client: Client) -> bool:
-    client.connection_close()
-    return True
+    return client.connection_close()
 
 # =============================================================================
 
@@ -333,32 +353,17 @@ def cmd_disconnect(client: Client) -> bool:
 # Command Types and Data
 # ----------------------
 
-# Types of commands in the client + associated procedures
-class CommandCode(Enum):
-    Null    = None
-    # Client misc
-    Help    = cmd_help #0            # Help text
-    Status  = cmd_status #1          # Client state
-    Set     = cmd_set #3             # Set a client flag
-    Quit    = cmd_quit #4
-    # Message making
-    Write   = cmd_write  #2           # Write message
-    View    = cmd_view #5            # View message written in buffer
-    Edit    = cmd_edit #6            # Edit message written in buffer
-    Clear   = cmd_clear     # clear message in buffer
-    Send    = cmd_send      # send message in buffer
-    Simple  = cmd_simple              # keep write mode
-    # Inbox
-    Read    = cmd_read # read top message
-    Delete  = cmd_delete # delete at inbox index 
-    Empty   = cmd_empty # delete all
-    # Connection
-    Host    = cmd_host       # set socket host
-    Port    = cmd_port    # set socket port
-    Connect     = cmd_connect  # connect to socket
-    Disconnect  = cmd_disconnect # disconnect from socket
-
-# Command data container 
+# Types of commands in the client, each holding its CommandSpec (Null for none)
+#  ex: CommandCode.Write.value.procedure is cmd_write
+CommandCode = Enum("CommandCode", [("Null", None)] + [(name.capitalize(), COMMANDS[name]) for name in COMMANDS])
+
+# Command word (name or alias) -> CommandCode, what command_get dispatches through
+_LOOKUP = {}
+for _code in CommandCode:
+    if _code.value is None: continue
+    for _word in (_code.value.name,) + _code.value.aliases: _LOOKUP[_word] = _code
+
+# Command data container
 @dataclass
 class Command():
     opcode: CommandCode     # Command type and related procedure
@@ -371,97 +376,50 @@ class Command():
 # Getting and Running Commands
 # ----------------------------
 
+# Splits an input line into (CommandCode, operands), remembering recent lines
+#  Scripts send the same few lines over and over, so most lines skip parsing entirely
+@lru_cache(maxsize=1024)
+def _parse(inpt: str) -> tuple:
+    stripped = inpt.lstrip()
+    word = stripped.split(None, 1)[0] if stripped else ""
+    code = _LOOKUP.get(word.lower())
+    if code is None: return (None, ())
+    rest = stripped[len(word)+1:]
+    if code.value.raw: return (code, (rest,) if rest.strip() else ())   # Keep text spacing and case
+    if code.value.keepcase: return (code, tuple(rest.split()))
+    return (code, tuple(rest.lower().split()))
+
 # COMMAND_GET
 # Returns a Command dataclass interpreted from the given string
 def command_get(inpt: str) -> Command:
-    # Process words of command
-    cmdwords = inpt.lower().split()
-
-    # If operands given, add them
-    if len(cmdwords) > 1: operands = cmdwords[1:]
-    else: operands = []
-
-    # Set opcode and signature
-    opcode = CommandCode.Null   # Default null command
-    signature = 0b00            # Empty signature
-    if len(cmdwords) > 0:
-        match cmdwords[0]:
-            case "help":
-                opcode = CommandCode.Help
-                signature = 0b01
-            case "status":
-                opcode = CommandCode.Status
-                signature = 0b10
-            case "set":
-                opcode = CommandCode.Set
-                signature = 0b11
-            case "quit":
-                opcode = CommandCode.Quit
-                signature = 0b10
-            case "write":
-                opcode = CommandCode.Write
-                signature = 0b11
-                # Special operand case: use single raw input string to preserve text spacing
-                if len(operands) > 0: operands = [inpt[6:]]
-            case "view":
-                opcode = CommandCode.View
-                signature = 0b10
-            case "edit":
-                opcode = CommandCode.Edit
-                signature = 0b11
-                # Special operand case: use single raw input string to preserve text spacing
-                if len(operands) > 0: operands = [inpt[5:]]
-            case "clear":
-                opcode = CommandCode.Clear
-                signature = 0b10
-            case "send":
-                opcode = CommandCode.Send
-                signature = 0b10
-            case "simple":
-                opcode = CommandCode.Simple
-                signature = 0b10
-            case "read":
-                opcode = CommandCode.Read
-                signature = 0b11
-            case "delete":
-                opcode = CommandCode.Delete
-                signature = 0b11
-            case "empty":
-                opcode = CommandCode.Empty
-                signature = 0b10
-            case "host":
-                opcode = CommandCode.Host
-                signature = 0b11
-            case "port":
-                opcode = CommandCode.Port
-                signature = 0b11
-            case "connect":
-                opcode = CommandCode.Connect
-                signature = 0b10
-            case "disconnect":
-                opcode = CommandCode.Disconnect
-                signature = 0b10
-            case _:
-                print(f" ! unknown command '{inpt}'")
-
-    return Command(opcode, operands, signature)
+    code, operands = _parse(inpt)
+    if code is None:
+        if inpt.strip(): print(f" ! unknown command '{inpt}'")
+        return Command(CommandCode.Null, [], 0b00)
+    return Command(code, list(operands), code.value.signature)
 
 # COMMAND_RUN
 # Executes the given command's procedure on a Client object
-def command_run(client: Client, cmd: Command) -> bool:
+#  Interactive runs end each command with a blank line and hint at help after bad input,
+#  scripted runs (interactive False) print only what the command itself prints
+def command_run(client: Client, cmd: Command, interactive: bool = True) -> bool:
     success = True
     if cmd.opcode != CommandCode.Null:
-        match cmd.signature:
-            case 0b01: success = cmd.opcode(cmd.operands)
-            case 0b10: success = cmd.opcode(client)
-            case 0b11: success = cmd.opcode(client, cmd.operands)
-            case _:
-                success = False
-                print(" ! bad command signature, how did that happen?")
+        spec = cmd.opcode.value
+        fewest, most = spec.arity
+        if len(cmd.operands) < fewest or (most is not None and len(cmd.operands) > most):
+            print(f" ! bad {spec.name} command, ex: {spec.exam}")
+            success = False
+        else:
+            match cmd.signature:
+                case 0b01: success = spec.procedure(cmd.operands)
+                case 0b10: success = spec.procedure(client)
+                case 0b11: success = spec.procedure(client, cmd.operands)
+                case _:
+                    success = False
+                    print(" ! bad command signature, how did that happen?")
     else:
-        print(" hint: use the 'help' command")
+        if interactive: print(" hint: use the 'help' command")
         success = False
-    print() # newline between commands
+    if interactive: print() # newline between commands
     return success
-
-
@@ -0,0 +1,14 @@
+# =============================================================================
+# Engine Defaults
+#
+# What the engine (aclient.py, pool.py) starts out with. Kept apart from it so
+# the client can offer these as its settings' defaults without importing the
+# engine, and with it asyncio, before anything connects.
+# =============================================================================
+
+CONNECT_TIMEOUT = 5     # Seconds to wait for a connection to open
+WELCOME_TIMEOUT = 5     # Seconds to wait for the server's welcome once connected
+ECHO_TIMEOUT = 10       # Seconds to wait for an echo (or room in the window) before giving up
+WINDOW = 64             # Default most messages in flight at once
+
+POOL_POLICIES = ("roundrobin", "leastinflight")     # How a pool spreads sends across its connections
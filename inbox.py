@@ -0,0 +1,160 @@
+from collections import OrderedDict     # For numbered messages
+from threading import Condition         # For thread safe access
+
+from messages import Message, MessageBatch
+
+# =============================================================================
+# Inbox
+#
+# The inbox holds the messages a client recieves:
+#  * each message is numbered on arrival, numbers never shift when others are deleted
+#  * appending, reading/deleting by number, and popping either end are all O(1)
+#  * an optional capacity bounds memory, with a policy for arrivals when full:
+#     - dropoldest: evict the oldest message to make room
+#     - dropnewest: discard the arriving message
+#     - block:      hold the producer until a message is deleted
+#
+# The engine appends from its event loop thread while commands read and delete
+# from the main thread, so every operation takes the inbox's lock.
+# =============================================================================
+
+POLICIES = ("dropoldest", "dropnewest", "block")
+
+class Inbox():
+    def __init__(self, capacity: int = 0, policy: str = "dropoldest"):
+        self.capacity = capacity    # Most messages held, 0 for no limit
+        self.policy = policy        # What to do with arrivals when full
+        self.dropped = 0            # Messages lost to the policy
+
+        self._messages = OrderedDict()  # Message number -> Message, oldest first
+        self._next_number = 1           # Number given to the next arrival
+        self._lock = Condition()        # Guards the above, signals freed space
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    # Whether the inbox is at capacity
+    def full(self) -> bool:
+        return self.capacity > 0 and len(self._messages) >= self.capacity
+
+    # Whether an arrival now would have to wait under the block policy
+    def must_wait(self) -> bool:
+        return self.policy == "block" and self.full()
+
+    # Waits until there is room for an arrival (or timeout seconds pass), returns whether there is
+    def wait_space(self, timeout: float = None) -> bool:
+        with self._lock:
+            return self._lock.wait_for(lambda: not self.full(), timeout)
+
+    # =========================================================================
+
+    # ---------------
+    # Adding/Removing
+    # ---------------
+
+    # Adds a message, returns the number it was given (None if the policy dropped it)
+    #  number keeps one the message already has (moving it from another inbox), it must
+    #  be at least next_number() and later arrivals are numbered on from it
+    #  Under the block policy this waits for room
+    def append(self, mess: Message, number: int = None) -> int:
+        with self._lock:
+            if number is not None and number < self._next_number:
+                raise ValueError(f"message {number} is numbered below the inbox's next number ({self._next_number})")
+            if self.full():
+                match self.policy:
+                    case "dropoldest":
+                        while self.full(): self._messages.popitem(last=False)
+                        self.dropped += 1
+                    case "dropnewest":
+                        self.dropped += 1
+                        return None
+                    case "block":
+                        self._lock.wait_for(lambda: not self.full())
+            if number is None: number = self._next_number
+            self._next_number = number + 1
+            self._messages[number] = mess
+            return number
+
+    # Appends another inbox's messages, oldest first, keeping their numbers
+    #  If this inbox has already given out numbers past the first of them they're numbered afresh
+    def append_from(self, other: "Inbox"):
+        messages = other.items()
+        keep = len(messages) > 0 and messages[0][0] >= self.next_number()
+        for number, mess in messages: self.append(mess, number if keep else None)
+
+    # Removes the message with a number, returns whether it existed
+    def delete(self, number: int) -> bool:
+        with self._lock:
+            if self._messages.pop(number, None) is None: return False
+            self._lock.notify_all()
+            return True
+
+    # Removes and returns the oldest (number, Message), or None if empty
+    def pop_oldest(self) -> tuple:
+        with self._lock:
+            if len(self._messages) == 0: return None
+            item = self._messages.popitem(last=False)
+            self._lock.notify_all()
+            return item
+
+    # Removes and returns the newest (number, Message), or None if empty
+    def pop_newest(self) -> tuple:
+        with self._lock:
+            if len(self._messages) == 0: return None
+            item = self._messages.popitem(last=True)
+            self._lock.notify_all()
+            return item
+
+    # Removes every message, numbering starts again from 1
+    def clear(self):
+        with self._lock:
+            self._messages.clear()
+            self._next_number = 1
+            self._lock.notify_all()
+
+    # =========================================================================
+
+    # -------
+    # Reading
+    # -------
+
+    # Number the next arrival will be given
+    def next_number(self) -> int:
+        return self._next_number
+
+    # Returns the message with a number, or None
+    def get(self, number: int) -> Message:
+        with self._lock:
+            return self._messages.get(number)
+
+    # Returns the newest (number, Message), or None if empty
+    def newest(self) -> tuple:
+        with self._lock:
+            if len(self._messages) == 0: return None
+            number = next(reversed(self._messages))
+            return (number, self._messages[number])
+
+    # Returns a snapshot list of (number, Message), oldest first
+    def items(self) -> list:
+        with self._lock:
+            return list(self._messages.items())
+
+    # Returns a snapshot of the messages as a columnar MessageBatch, oldest first
+    #  (compact for handing large inboxes to bulk consumers)
+    def batch(self) -> MessageBatch:
+        with self._lock:
+            return MessageBatch(self._messages.values())
+
+    # Changes the capacity and policy, evicting the oldest if the new capacity is smaller
+    def configure(self, capacity: int = None, policy: str = None):
+        with self._lock:
+            if capacity is not None: self.capacity = capacity
+            if policy is not None: self.policy = policy
+            while self.capacity > 0 and len(self._messages) > self.capacity:
+                self._messages.popitem(last=False)
+                self.dropped += 1
+            self._lock.notify_all()
+
+    # Releases anything the inbox holds open (nothing, for an inbox in memory)
+    def close(self):
+        pass
@@ -0,0 +1,328 @@
+import mmap                 # For mapping the log and index files
+import os
+import struct               # For the index header and entries
+from threading import Thread, Lock
+
+from inbox import Inbox
+from messages import Message, MessageBatch, encode_message, decode_message
+
+# =============================================================================
+# Inbox Log
+#
+# An inbox kept on disk instead of in memory, for runs which capture more echos
+# than fit in RAM, or which must survive the client quitting or crashing:
+#  * <path>.log is an append-only log of the messages, as binary frames
+#  * <path>.idx is a header followed by a fixed width (offset, length) entry
+#    per message number, so reading message n is a single seek
+#  * both files are mmapped, and grow by doubling as messages arrive
+#  * deleting a message marks its index entry as a tombstone; once most of the
+#    log is dead, a background thread copies the live messages to a fresh log
+#    (numbers never change, only where their bytes live)
+#
+# Opening an existing log picks up where it left off, numbering included.
+# Capacity and full-inbox policies behave exactly as they do for Inbox.
+# =============================================================================
+
+INDEX_HEADER = struct.Struct("!4sIQQQ")     # magic, version, first number indexed, next number, log bytes used
+INDEX_ENTRY = struct.Struct("!QI")          # message's log offset, frame length
+INDEX_MAGIC = b"INBX"
+INDEX_VERSION = 1
+TOMBSTONE = 0xFFFFFFFF                      # Frame length marking a deleted message
+
+LOG_START_SIZE = 1 << 20        # Bytes a new log file starts at
+INDEX_START_SIZE = 1 << 16      # Bytes a new index file starts at
+COMPACT_MIN = 1 << 20           # Dead log bytes needed before compacting
+
+# A file mapped into memory, remapped larger as it fills
+class _MappedFile():
+    def __init__(self, path: str, start_size: int):
+        self.path = path
+        self.file = open(path, "r+b" if os.path.exists(path) else "w+b")
+        size = os.fstat(self.file.fileno()).st_size
+        if size < start_size:
+            self.file.truncate(start_size)
+            size = start_size
+        self.map = mmap.mmap(self.file.fileno(), size)
+
+    # Grow the file (doubling) until it holds at least size bytes
+    def ensure(self, size: int):
+        if size <= len(self.map): return
+        grown = len(self.map)
+        while grown < size: grown *= 2
+        self.map.close()
+        self.file.truncate(grown)
+        self.map = mmap.mmap(self.file.fileno(), grown)
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+
+class InboxLog(Inbox):
+    def __init__(self, path: str, capacity: int = 0, policy: str = "dropoldest"):
+        super().__init__(capacity, policy)
+        self.path = path
+        self._messages = None       # Messages live on disk
+        self._compactor = None      # Background compaction thread
+        self._compacting = Lock()   # Held while compacting, so two compactions never share the files
+        self._generation = 0        # Bumped by clear(), so compaction can tell its snapshot is stale
+        self._open()
+
+    # Map the files, reading (or writing) the index header and counting the live messages
+    def _open(self):
+        self._log = _MappedFile(self.path + ".log", LOG_START_SIZE)
+        self._index = _MappedFile(self.path + ".idx", INDEX_START_SIZE)
+        magic, version, base, next_number, end = INDEX_HEADER.unpack_from(self._index.map, 0)
+        if magic == bytes(len(INDEX_MAGIC)):    # New log
+            base, next_number, end = 1, 1, 0
+        elif magic != INDEX_MAGIC or version != INDEX_VERSION:
+            self._log.close()
+            self._index.close()
+            raise ValueError(f"'{self.path}' isn't an inbox log this client can read")
+        self._base = base                   # Number of the first index entry
+        self._next_number = next_number
+        self._end = end                     # Log bytes used
+        self._count = 0                     # Live messages
+        self._live_bytes = 0                # Log bytes held by live messages
+        self._first = base                  # No live message is numbered below this
+        self._last = next_number - 1        # or above this
+        for number in range(base, next_number):
+            length = self._entry(number)[1]
+            if length == TOMBSTONE: continue
+            self._count += 1
+            self._live_bytes += length
+        self._write_header()
+
+    # Flush and unmap the files (waits out any compaction)
+    def close(self):
+        compactor = self._compactor
+        if compactor is not None: compactor.join()
+        with self._lock:
+            self._log.close()
+            self._index.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def full(self) -> bool:
+        return self.capacity > 0 and self._count >= self.capacity
+
+    # =========================================================================
+
+    # --------------
+    # Index and Log
+    # --------------
+
+    def _slot(self, number: int) -> int:
+        return INDEX_HEADER.size + (number - self._base) * INDEX_ENTRY.size
+
+    # (offset, length) of a message's frame in the log
+    def _entry(self, number: int) -> tuple:
+        return INDEX_ENTRY.unpack_from(self._index.map, self._slot(number))
+
+    def _live(self, number: int) -> bool:
+        return self._base <= number < self._next_number and self._entry(number)[1] != TOMBSTONE
+
+    def _write_header(self):
+        INDEX_HEADER.pack_into(self._index.map, 0, INDEX_MAGIC, INDEX_VERSION, self._base, self._next_number, self._end)
+
+    def _read(self, number: int) -> Message:
+        offset, length = self._entry(number)
+        return decode_message(self._log.map[offset:offset+length])
+
+    # Tombstone a live message
+    def _kill(self, number: int):
+        offset, length = self._entry(number)
+        INDEX_ENTRY.pack_into(self._index.map, self._slot(number), offset, TOMBSTONE)
+        self._count -= 1
+        self._live_bytes -= length
+        self._lock.notify_all()
+
+    # Lowest and highest live numbers (None if empty), moving the bounds past tombstones
+    def _oldest(self) -> int:
+        if self._count == 0: return None
+        while not self._live(self._first): self._first += 1
+        return self._first
+
+    def _newest(self) -> int:
+        if self._count == 0: return None
+        while not self._live(self._last): self._last -= 1
+        return self._last
+
+    # =========================================================================
+
+    # ---------------
+    # Adding/Removing
+    # ---------------
+
+    def append(self, mess: Message, number: int = None) -> int:
+        with self._lock:
+            if number is not None and number < self._next_number:
+                raise ValueError(f"message {number} is numbered below the inbox's next number ({self._next_number})")
+            if self.full():
+                match self.policy:
+                    case "dropoldest":
+                        while self.full(): self._kill(self._oldest())
+                        self.dropped += 1
+                    case "dropnewest":
+                        self.dropped += 1
+                        return None
+                    case "block":
+                        self._lock.wait_for(lambda: not self.full())
+            frame = encode_message(mess)
+            if number is None: number = self._next_number
+            elif self._count == 0: self._restart(number)    # Nothing live to keep, index from the kept number
+            self._log.ensure(self._end + len(frame))
+            self._log.map[self._end:self._end+len(frame)] = frame
+            self._index.ensure(self._slot(number) + INDEX_ENTRY.size)
+            for skipped in range(self._next_number, number):    # Numbers passed over are tombstones
+                INDEX_ENTRY.pack_into(self._index.map, self._slot(skipped), 0, TOMBSTONE)
+            INDEX_ENTRY.pack_into(self._index.map, self._slot(number), self._end, len(frame))
+            self._end += len(frame)
+            self._next_number = number + 1
+            self._last = number
+            self._count += 1
+            self._live_bytes += len(frame)
+            self._write_header()
+            self._compact_later()
+            return number
+
+    def delete(self, number: int) -> bool:
+        with self._lock:
+            if not self._live(number): return False
+            self._kill(number)
+            self._compact_later()
+            return True
+
+    def pop_oldest(self) -> tuple:
+        with self._lock:
+            number = self._oldest()
+            if number is None: return None
+            item = (number, self._read(number))
+            self._kill(number)
+            self._compact_later()
+            return item
+
+    def pop_newest(self) -> tuple:
+        with self._lock:
+            number = self._newest()
+            if number is None: return None
+            item = (number, self._read(number))
+            self._kill(number)
+            self._compact_later()
+            return item
+
+    # Removes every message, numbering starts again from 1
+    def clear(self):
+        with self._lock:
+            self._restart(1)
+            self._lock.notify_all()
+
+    # Empties the log and index, the next message is numbered 'number'
+    def _restart(self, number: int):
+        self._base = self._first = self._next_number = number
+        self._last = number - 1
+        self._end = self._count = self._live_bytes = 0
+        self._generation += 1
+        self._write_header()
+
+    # =========================================================================
+
+    # -------
+    # Reading
+    # -------
+
+    def get(self, number: int) -> Message:
+        with self._lock:
+            if not self._live(number): return None
+            return self._read(number)
+
+    def newest(self) -> tuple:
+        with self._lock:
+            number = self._newest()
+            if number is None: return None
+            return (number, self._read(number))
+
+    def items(self) -> list:
+        with self._lock:
+            if self._count == 0: return []
+            return [(number, self._read(number)) for number in range(self._oldest(), self._newest() + 1) if self._live(number)]
+
+    def batch(self) -> MessageBatch:
+        return MessageBatch(mess for _, mess in self.items())
+
+    def configure(self, capacity: int = None, policy: str = None):
+        with self._lock:
+            if capacity is not None: self.capacity = capacity
+            if policy is not None: self.policy = policy
+            while self.capacity > 0 and self._count > self.capacity:
+                self._kill(self._oldest())
+                self.dropped += 1
+            self._lock.notify_all()
+
+    # =========================================================================
+
+    # ----------
+    # Compaction
+    # ----------
+
+    # Starts a compaction in the background once most of the log is dead
+    def _compact_later(self):
+        dead = self._end - self._live_bytes
+        if self._compactor is not None or dead < COMPACT_MIN or dead < self._live_bytes: return
+        self._compactor = Thread(target=self._compact_background, name="inbox-compact", daemon=True)
+        self._compactor.start()
+
+    def _compact_background(self):
+        try: self.compact()
+        finally: self._compactor = None
+
+    # Rewrites the log with only its live messages
+    #  The bulk of the copying happens without the lock, from a snapshot of the live
+    #  messages; messages appended or deleted meanwhile are reconciled at the end.
+    #  Waits for any compaction already running to finish first.
+    def compact(self):
+        with self._compacting:
+            with self._lock:
+                generation = self._generation
+                first = self._oldest() or self._next_number
+                snap_next = self._next_number
+                live = [(number,) + self._entry(number) for number in range(first, snap_next) if self._live(number)]
+            fd = self._log.file.fileno()
+
+            # Copy the snapshot's live frames into a new log (they never change once written)
+            offsets = {}
+            with open(self.path + ".log.compact", "w+b") as fresh:
+                for number, offset, length in live:
+                    offsets[number] = fresh.tell()
+                    fresh.write(os.pread(fd, length, offset))
+
+                with self._lock:
+                    if generation != self._generation:      # Cleared meanwhile, the copy is stale
+                        os.remove(self.path + ".log.compact")
+                        return
+                    # Frames appended since the snapshot
+                    for number in range(snap_next, self._next_number):
+                        if not self._live(number): continue
+                        offset, length = self._entry(number)
+                        offsets[number] = fresh.tell()
+                        fresh.write(self._log.map[offset:offset+length])
+                    end = fresh.tell()
+                    fresh.truncate(max(end, LOG_START_SIZE))
+
+                    # Index from the first live number, anything deleted meanwhile stays a tombstone
+                    entries = bytearray(INDEX_HEADER.size + (self._next_number - first) * INDEX_ENTRY.size)
+                    INDEX_HEADER.pack_into(entries, 0, INDEX_MAGIC, INDEX_VERSION, first, self._next_number, end)
+                    for number in range(first, self._next_number):
+                        slot = INDEX_HEADER.size + (number - first) * INDEX_ENTRY.size
+                        if self._live(number): INDEX_ENTRY.pack_into(entries, slot, offsets[number], self._entry(number)[1])
+                        else: INDEX_ENTRY.pack_into(entries, slot, 0, TOMBSTONE)
+                    with open(self.path + ".idx.compact", "wb") as index:
+                        index.write(entries)
+                        index.truncate(max(len(entries), INDEX_START_SIZE))
+
+                    self._log.close()
+                    self._index.close()
+                    os.replace(self.path + ".log.compact", self.path + ".log")
+                    os.replace(self.path + ".idx.compact", self.path + ".idx")
+                    self._open()
@@ -0,0 +1,235 @@
+import argparse         # For command line options
+import asyncio          # For driving many connections at once
+import random           # For the modifier mix and message sizes
+import time             # For pacing and latency
+from dataclasses import dataclass, field
+
+from aclient import AsyncClient, WINDOW
+from inbox import Inbox
+from messages import Message, FRAMING_BINARY, FRAMING_LEGACY
+from metrics import Histogram
+from scheduler import OpenLoop, TimerWheel, ARRIVALS
+
+# =============================================================================
+# Load Generator
+#
+# Soak tests an echo server by driving many client connections at once:
+#  * each connection is its own AsyncClient, all running on one event loop
+#  * messages are sent at a target rate, or as fast as the window allows
+#  * at a target rate sends are open loop (see scheduler.py): each is due at a
+#    time set in advance, constant or Poisson, and its latency counts from then
+#  * each message gets modifiers from a weighted mix and a size from a distribution
+#  * the run stops after a duration or a message count, whichever comes first
+#
+# When it finishes it reports throughput, error counts and latency percentiles.
+#
+# ex: python loadgen.py 127.0.0.1 31800 -c 50 -r 5000 -d 30 --mix plain=6,caps=2,reverse+caps=1 --size 16-512
+# =============================================================================
+
+# ---------------
+# Load Definition
+# ---------------
+
+# Modifier names accepted in a mix, and what they set on a Message
+MIX_MODIFIERS = {"plain"   : {},
+                 "caps"    : {"caps":True},
+                 "reverse" : {"rvrs":True},
+                 "noecho"  : {"echo":False}}
+
+# Characters message text is cut from
+_TEXT = "".join(random.Random(0).choices("abcdefghijklmnopqrstuvwxyz ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789", k=65536))
+
+# What to send, where, and for how long
+@dataclass
+class LoadSpec():
+    host: str
+    port: int
+    connections: int = 1            # Connections to open
+    rate: float = 0                 # Messages per second across all connections (0 for as fast as possible)
+    arrivals: str = "constant"      # How sends at a rate are spaced: constant or poisson
+    duration: float = None          # Seconds to send for
+    count: int = None               # Messages to send across all connections
+    mix: list = field(default_factory=lambda: [({}, 1)])   # (modifiers, weight) pairs
+    sizes: tuple = ("fixed", 64)    # Text size distribution
+    window: int = WINDOW            # Most messages in flight per connection
+    framing: str = FRAMING_BINARY
+    seed: int = None
+
+# Everything measured during a run
+@dataclass
+class LoadResult():
+    sent: int = 0
+    recieved: int = 0
+    errors: int = 0
+    connect_errors: int = 0
+    bytes_sent: int = 0
+    elapsed: float = 0
+    latency: Histogram = field(default_factory=Histogram)  # Round trips, in nanoseconds (from the intended send time, at a rate)
+    lag: Histogram = field(default_factory=Histogram)      # How late sends at a rate started, in nanoseconds
+
+    # Fold another connection's result into this one
+    def merge(self, other: "LoadResult"):
+        self.sent += other.sent
+        self.recieved += other.recieved
+        self.errors += other.errors
+        self.connect_errors += other.connect_errors
+        self.bytes_sent += other.bytes_sent
+        self.latency.merge(other.latency)
+        self.lag.merge(other.lag)
+
+# Parse a mix definition string like 'plain=6,caps=2,reverse+caps=1'
+def parse_mix(definition: str) -> list:
+    mix = []
+    for entry in definition.split(","):
+        names, _, weight = entry.partition("=")
+        modifiers = {}
+        for name in names.split("+"):
+            if name not in MIX_MODIFIERS: raise ValueError(f"unknown mix modifier '{name}'")
+            modifiers.update(MIX_MODIFIERS[name])
+        mix.append((modifiers, float(weight or 1)))
+    return mix
+
+# Parse a size distribution string: '64' (fixed), '16-512' (uniform) or 'exp:128' (exponential mean)
+def parse_sizes(definition: str) -> tuple:
+    if definition.startswith("exp:"): return ("exp", float(definition[4:]))
+    if "-" in definition:
+        low, high = definition.split("-")
+        return ("uniform", int(low), int(high))
+    return ("fixed", int(definition))
+
+# Draw a message size from a distribution
+def _draw_size(rng: random.Random, sizes: tuple) -> int:
+    match sizes[0]:
+        case "fixed": size = sizes[1]
+        case "uniform": size = rng.randint(sizes[1], sizes[2])
+        case "exp": size = int(rng.expovariate(1 / sizes[1]))
+    return min(size, len(_TEXT))
+
+# Build the next message to send
+def _draw_message(rng: random.Random, spec: LoadSpec) -> Message:
+    modifiers = rng.choices([entry[0] for entry in spec.mix], [entry[1] for entry in spec.mix])[0]
+    size = _draw_size(rng, spec.sizes)
+    start = rng.randrange(len(_TEXT) - size + 1)
+    return Message({"text":_TEXT[start:start+size], "modifiers":dict(modifiers)})
+
+# =============================================================================
+
+# ------------
+# Running Load
+# ------------
+
+# Drive one connection until its deadline or message quota is reached
+async def _run_connection(spec: LoadSpec, index: int, quota: int, deadline: float, wheel: TimerWheel) -> LoadResult:
+    result = LoadResult()
+    rng = random.Random(None if spec.seed is None else spec.seed + index)
+    client = AsyncClient(spec.host, spec.port, spec.framing, Inbox(1), spec.window)    # Echos are only measured, keep just the last
+    try: await client.connection_open()
+    except (OSError, TimeoutError):
+        result.connect_errors += 1
+        return result
+
+    outstanding = []
+
+    # Count an echo once it arrives (its latency is recorded by the client's metrics)
+    def on_echo(echo: asyncio.Future):
+        if echo.cancelled() or echo.exception() is not None: result.errors += 1
+        else: result.recieved += 1
+
+    # Send the next message, its round trip measured from 'intended' when given
+    async def send(intended: int = None):
+        mess = _draw_message(rng, spec)
+        echo = await client.message_send_pipelined(mess, intended)
+        echo.add_done_callback(on_echo)
+        outstanding.append(echo)
+        result.sent += 1
+        result.bytes_sent += len(mess.text)
+
+    # Open loop sends can fail independently, each failure is counted
+    async def send_scheduled(intended: int):
+        try: await send(intended)
+        except (ConnectionError, OSError, TimeoutError): result.errors += 1
+
+    try:
+        if spec.rate > 0:
+            schedule = OpenLoop(send_scheduled, spec.rate / spec.connections, spec.arrivals, rng.getrandbits(64), wheel)
+            remaining = deadline - time.monotonic()
+            await schedule.run(duration=None if remaining == float("inf") else max(remaining, 0), count=quota)
+            result.lag = schedule.lag
+        else:
+            while (quota is None or result.sent < quota) and time.monotonic() < deadline: await send()
+        # Give the last echos until the deadline (or a moment past a count) to come back
+        if outstanding:
+            await asyncio.wait(outstanding, timeout=max(deadline - time.monotonic(), 1))
+    except (ConnectionError, OSError, TimeoutError): result.errors += 1
+    finally: await client.connection_close()
+    result.latency = client.metrics.rtt
+    return result
+
+# Run the whole load, returning the merged result
+async def run_load(spec: LoadSpec) -> LoadResult:
+    duration = spec.duration
+    if duration is None and spec.count is None: duration = 10
+    deadline = time.monotonic() + (duration if duration is not None else float("inf"))
+
+    quotas = [None] * spec.connections
+    if spec.count is not None:
+        quotas = [spec.count // spec.connections + (i < spec.count % spec.connections) for i in range(spec.connections)]
+
+    wheel = TimerWheel()    # One wheel paces every connection's sends
+    start = time.monotonic()
+    results = await asyncio.gather(*[_run_connection(spec, i, quotas[i], deadline, wheel) for i in range(spec.connections)])
+    total = LoadResult()
+    for result in results: total.merge(result)
+    total.elapsed = time.monotonic() - start
+    return total
+
+# =============================================================================
+
+# ---------
+# Reporting
+# ---------
+
+# Print a summary of a run
+def report(result: LoadResult):
+    elapsed = result.elapsed or 1
+    print(" [Load Results]:")
+    print(f"  elapsed:     {result.elapsed:.2f}s")
+    print(f"  sent:        {result.sent} ({result.sent/elapsed:.0f} msg/s, {result.bytes_sent/elapsed/1024:.1f} KiB/s)")
+    print(f"  recieved:    {result.recieved} ({result.recieved/elapsed:.0f} msg/s)")
+    print(f"  errors:      {result.errors}")
+    print(f"  failed connects: {result.connect_errors}")
+    print(" [Latency]:")
+    for p in (50, 90, 99, 99.9):
+        print(f"  p{p:<5} {result.latency.percentile(p)/1e6:8.3f}ms")
+    print(f"  max    {result.latency.max/1e6:8.3f}ms")
+    if result.lag.count:
+        print(" [Send Lag]:")
+        print(f"  p99    {result.lag.percentile(99)/1e6:8.3f}ms")
+        print(f"  max    {result.lag.max/1e6:8.3f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive load against an echo server")
+    parser.add_argument("host")
+    parser.add_argument("port", type=int)
+    parser.add_argument("-c", "--connections", type=int, default=1, help="connections to open")
+    parser.add_argument("-r", "--rate", type=float, default=0, help="messages per second in total, 0 for max")
+    parser.add_argument("--arrivals", choices=ARRIVALS, default="constant", help="spacing of sends at a rate")
+    parser.add_argument("-d", "--duration", type=float, help="seconds to run for")
+    parser.add_argument("-n", "--count", type=int, help="messages to send in total")
+    parser.add_argument("--mix", default="plain=1", help="weighted modifiers, ex: plain=6,caps=2,reverse+noecho=1")
+    parser.add_argument("--size", default="64", help="text size: 64 / 16-512 (uniform) / exp:128")
+    parser.add_argument("--window", type=int, default=WINDOW, help="most messages in flight per connection")
+    parser.add_argument("--legacy", action="store_true", help="use the old text marker framing")
+    parser.add_argument("--seed", type=int, help="seed for reproducible message streams")
+    args = parser.parse_args()
+
+    try:
+        spec = LoadSpec(args.host, args.port, args.connections, args.rate, args.arrivals, args.duration, args.count,
+                        parse_mix(args.mix), parse_sizes(args.size), args.window,
+                        FRAMING_LEGACY if args.legacy else FRAMING_BINARY, args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+    report(asyncio.run(run_load(spec)))
+
+if __name__ == "__main__":
+    main()
@@ -8,34 +8,132 @@
 #
 # The procedures defined in this file allow you to:
 #  1. Encode a Message to bytes (for socket transmission)
-#  2. Decode a Message from bytes
+#  2. Decode a Message from bytes, or a stream of Messages from byte chunks
 #  3. Modify the data of a Message via dict
 #  4. Interpret a dict of message data from a string
 #  5. Get a string of the Message's text formatted according to its modifiers
 #  6. Get a string describing the raw state of the Message text and modifiers
+#  7. Hold many Messages compactly in a MessageBatch
+#  8. Build Messages from definition strings through a cache of pre-encoded templates
+#  9. Compress large message texts on the wire, with codecs negotiated in the server's welcome
+#
+# Messages are kept small: their fields live in __slots__ and their modifiers are
+# packed into a single int of MOD_BITS. msg.modifiers is a dict-like view of those bits.
 # =============================================================================
 
+import struct                   # For binary frame headers
+import zlib                     # For compressed frames
+from array import array         # For MessageBatch columns
+from collections import OrderedDict     # For the template cache's recency order
+from threading import Lock      # For the recieve buffer pool
+
 # -------
 # Message
 # -------
 
 class Message:
+    __slots__ = ("text", "bits", "seq", "channel")
+
     # Keywords to wrap message data elements in during message transmission
     FORMAT_KEYS = {"text" : ("|TEXTSTART|", "|TEXTEND|"),
                    "echo" : ("|ECHOSTART|", "|ECHOEND|"),
                    "caps" : ("|CAPSSTART|", "|CAPSEND|"),
-                   "rvrs" : ("|RVRSSTART|", "|RVRSEND|")}
+                   "rvrs" : ("|RVRSSTART|", "|RVRSEND|"),
+                   "cmpr" : ("|CMPRSTART|", "|CMPREND|")}     # Wraps the codecs a server's welcome accepts
+
+    # Bits to flag each modifier with (in a Message's bits and a binary frame's modifier byte)
+    MOD_BITS = {"echo" : 0b001,
+                "caps" : 0b010,
+                "rvrs" : 0b100}
+    MOD_MASK = 0b111            # All modifier bits
+    DEFAULT_BITS = 0b001        # echo on, caps off, rvrs off
 
     # Constructor, initializes message to default values + optional defined data 
-    def __init__(self, msg_data: dict = {}):
+    def __init__(self, msg_data: dict = None):
         # Initial values
         self.text = ""
-        self.modifiers = {"echo":True,
-                          "caps":False,
-                          "rvrs":False}
+        self.bits = Message.DEFAULT_BITS    # Modifiers, packed as MOD_BITS
+        self.seq = None     # Sequence id stamped by the sender, matches an echo to its message
+        self.channel = None # Multiplexed channel the message travels on (see mux.py)
 
         # Parse value initialization dict for alternate values
-        modify_message(self, msg_data)
+        if msg_data: modify_message(self, msg_data)
+
+    # Dict-like view of the modifier bits, reads and writes go straight to them
+    @property
+    def modifiers(self) -> "ModifierView":
+        return ModifierView(self)
+
+    @modifiers.setter
+    def modifiers(self, modifiers: dict):
+        self.bits = 0
+        for mod in modifiers:
+            if modifiers[mod]: self.bits |= Message.MOD_BITS[mod]
+
+# Maps modifier names to a Message's bits, behaving like the {"echo":bool, ...} dict it replaces
+class ModifierView:
+    __slots__ = ("_msg",)
+
+    def __init__(self, msg: Message):
+        self._msg = msg
+
+    def __getitem__(self, mod: str) -> bool:
+        return bool(self._msg.bits & Message.MOD_BITS[mod])
+
+    def __setitem__(self, mod: str, on: bool):
+        if on: self._msg.bits |= Message.MOD_BITS[mod]
+        else: self._msg.bits &= ~Message.MOD_BITS[mod]
+
+    def __contains__(self, mod: str) -> bool:
+        return mod in Message.MOD_BITS
+
+    def __iter__(self):
+        return iter(Message.MOD_BITS)
+
+    def __len__(self) -> int:
+        return len(Message.MOD_BITS)
+
+    def __eq__(self, other) -> bool:
+        return dict(self.items()) == dict(other.items())
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+    def keys(self):
+        return Message.MOD_BITS.keys()
+
+    def items(self) -> list:
+        return [(mod, self[mod]) for mod in Message.MOD_BITS]
+
+    def get(self, mod: str, default=None):
+        if mod in Message.MOD_BITS: return self[mod]
+        return default
+
+# A Message straight off the wire, whose text is decoded only when first read
+#  Holds the recieved bytes (shared with the other frames of the same read) and the
+#  span of its text in them. Modifiers and sequence id are parsed up front, as they're
+#  cheap and needed to route the echo; echos which are only counted, deleted, or never
+#  displayed (noecho) never pay for decoding their text.
+#  Text that isn't valid UTF-8 decodes with replacement characters, rather than raising
+#  wherever it happens to be read.
+class LazyMessage(Message):
+    __slots__ = ("_raw", "_start", "_end")
+
+    @property
+    def text(self) -> str:
+        if self._raw is not None:
+            Message.text.__set__(self, str(memoryview(self._raw)[self._start:self._end], "utf-8", "replace"))
+            self._raw = None    # Let go of the recieved bytes
+        return Message.text.__get__(self)
+
+    @text.setter
+    def text(self, text: str):
+        Message.text.__set__(self, text)
+        self._raw = None
+
+    # Whether the text has been decoded yet
+    def decoded(self) -> bool:
+        return self._raw is None
 
 # =============================================================================
 
@@ -43,6 +141,39 @@ class Message:
 # Encoding/Decoding Messages
 # --------------------------
 
+# Messages can be framed for transmission in one of two formats:
+#  * binary: | version (1 byte) | modifier bits (1 byte) | length (4 bytes) | [seq (4 bytes)] | [channel (4 bytes)] | utf-8 text (length bytes) |
+#  * legacy: the text and modifiers wrapped in FORMAT_KEYS markers (understood by draco1 style servers)
+#
+# A binary frame carries the message's sequence id when the FRAME_SEQ bit is set in its
+# modifier byte, and its channel id when the FRAME_CHAN bit is. Legacy frames have no room
+# for either, so their echos are matched by order (and they can't be multiplexed).
+#
+# A binary frame's text is compressed when the FRAME_CMPR bit is set: its length bytes are
+# then a codec id (see CODECS) followed by the compressed text. Senders only compress for
+# servers whose welcome lists the codec, wrapped in FORMAT_KEYS["cmpr"] markers
+# (ex: 'Welcome!|CMPRSTART|zlib,lzma|CMPREND|'), so servers that don't know about
+# compression are only ever sent plain frames. Legacy frames are never compressed.
+#
+# Binary frames know their own length, so any text is safe to send and a stream of
+# frames can be split back into Messages no matter how the bytes were segmented.
+# Legacy frames are found by their markers, so text containing a marker will mangle them.
+
+FRAMING_BINARY = "binary"
+FRAMING_LEGACY = "legacy"
+
+FRAME_VERSION = 1                       # First byte of every binary frame
+FRAME_HEADER = struct.Struct("!BBI")    # version, modifier bits, text length
+FRAME_SEQ_FIELD = struct.Struct("!I")   # Optional sequence id following the header
+FRAME_SEQ = 0b10000000                  # Modifier byte bit flagging a sequence id
+FRAME_CMPR = 0b00001000                 # Modifier byte bit flagging compressed text
+FRAME_CHAN = 0b01000000                 # Modifier byte bit flagging a channel id
+FRAME_CHAN_FIELD = struct.Struct("!I")  # Optional channel id following the sequence id
+FRAME_MAX_LENGTH = 16 * 1024 * 1024     # Reject frames claiming more text than this
+
+_LEGACY_START = Message.FORMAT_KEYS["text"][0].encode()     # Legacy frames begin with the text marker
+_LEGACY_END = Message.FORMAT_KEYS["rvrs"][1].encode()       # and end with the last modifier's marker
+
 def _key_wrap(data, key: tuple((str, str))) -> str:
     # Wrap the data element around the given keys
     return key[0] + str(data) + key[1]
@@ -53,14 +184,40 @@ def _key_unwrap(format_string: str, key: tuple((str, str))) -> str:
     end = format_string.find(key[1])
     return format_string[start : end]
 
-def encode_message(msg: Message) -> bytes:
-    format_string = ""              # String to hold 'serialized' message
-    format_string += _key_wrap(msg.text, msg.FORMAT_KEYS["text"])               # Wrap text
+# Build a message straight from frame data (skips __init__ and modify_message's checks, data is trusted)
+def _message_from_frame(text: str, bits: int, seq: int = None, channel: int = None) -> Message:
+    mess = Message.__new__(Message)
+    mess.text = text
+    mess.bits = bits & Message.MOD_MASK
+    mess.seq = seq
+    mess.channel = channel
+    return mess
+
+# Build a message whose text stays undecoded in raw[start:end] until read
+def _lazy_message(raw: bytes, start: int, end: int, bits: int, seq: int = None, channel: int = None) -> LazyMessage:
+    mess = LazyMessage.__new__(LazyMessage)
+    mess._raw = raw
+    mess._start = start
+    mess._end = end
+    mess.bits = bits & Message.MOD_MASK
+    mess.seq = seq
+    mess.channel = channel
+    return mess
+
+# Bytes of optional fields between a binary frame's header and its text
+def _frame_extra(bits: int) -> int:
+    extra = 0
+    if bits & FRAME_SEQ: extra += FRAME_SEQ_FIELD.size
+    if bits & FRAME_CHAN: extra += FRAME_CHAN_FIELD.size
+    return extra
+
+def _encode_legacy(msg: Message) -> bytes:
+    parts = [_key_wrap(msg.text, msg.FORMAT_KEYS["text"])]                  # Wrap text
     for mod in msg.modifiers:
-        format_string += _key_wrap(msg.modifiers[mod], msg.FORMAT_KEYS[mod])    # Wrap modifiers
-    return format_string.encode()   # Return string encoded as bytes
+        parts.append(_key_wrap(msg.modifiers[mod], msg.FORMAT_KEYS[mod]))   # Wrap modifiers
+    return "".join(parts).encode()  # Return 'serialized' message encoded as bytes
 
-def decode_message(code: bytes) -> Message:
+def _decode_legacy(code: bytes) -> Message:
     # Create message, decode string message (formatted with protocol)
     mess = Message()
     format_string = code.decode()
@@ -73,6 +230,334 @@ def decode_message(code: bytes) -> Message:
 
     return mess
 
+# Texts of at least threshold bytes are compressed with codec, if given (and if it makes them smaller)
+def encode_message(msg: Message, framing: str = FRAMING_BINARY, codec: str = None, threshold: int = 0) -> bytes:
+    if framing == FRAMING_LEGACY: return _encode_legacy(msg)
+    text = _text_bytes(msg)
+    if codec is not None and len(text) >= threshold:
+        packed = compress_text(text, codec)
+        if packed is not None: return _frame_header(msg, len(packed), FRAME_CMPR) + packed
+    return _frame_header(msg, len(text)) + text
+
+# UTF-8 bytes of a message's text, straight from the recieved bytes if it was never decoded
+def _text_bytes(msg: Message) -> bytes:
+    if type(msg) is LazyMessage and msg._raw is not None: return msg._raw[msg._start:msg._end]
+    return msg.text.encode()
+
+# Header bytes (and sequence and channel ids) of a message's binary frame
+def _frame_header(msg: Message, length: int, flags: int = 0) -> bytes:
+    if msg.channel is not None:
+        if msg.seq is None: return FRAME_HEADER.pack(FRAME_VERSION, msg.bits | flags | FRAME_CHAN, length) + \
+                                   FRAME_CHAN_FIELD.pack(msg.channel)
+        return FRAME_HEADER.pack(FRAME_VERSION, msg.bits | flags | FRAME_SEQ | FRAME_CHAN, length) + \
+               FRAME_SEQ_FIELD.pack(msg.seq) + FRAME_CHAN_FIELD.pack(msg.channel)
+    if msg.seq is None: return FRAME_HEADER.pack(FRAME_VERSION, msg.bits | flags, length)
+    return FRAME_HEADER.pack(FRAME_VERSION, msg.bits | flags | FRAME_SEQ, length) + FRAME_SEQ_FIELD.pack(msg.seq)
+
+# Encodes many messages as a list of buffers for one scatter/gather write (socket.sendmsg)
+#  Binary frames are given as separate header and text buffers, so no text is copied to join them
+#  (codec and threshold compress texts as encode_message does)
+def encode_messages(msgs: list[Message], framing: str = FRAMING_BINARY, codec: str = None,
+                    threshold: int = 0) -> list[bytes]:
+    if framing == FRAMING_LEGACY: return [_encode_legacy(msg) for msg in msgs]
+    buffers = []
+    for msg in msgs:
+        text = _text_bytes(msg)
+        flags = 0
+        if codec is not None and len(text) >= threshold:
+            packed = compress_text(text, codec)
+            if packed is not None: text, flags = packed, FRAME_CMPR
+        buffers.append(_frame_header(msg, len(text), flags))
+        buffers.append(text)
+    return buffers
+
+# Decodes a single frame, the framing is detected from its first byte
+#  Binary frames give a LazyMessage, their text is decoded when first read
+#  Raises ValueError for a frame that is cut short or malformed
+def decode_message(code: bytes) -> Message:
+    if code.startswith(_LEGACY_START): return _decode_legacy(code)
+    if len(code) < FRAME_HEADER.size:
+        raise ValueError(f"truncated frame, expected a {FRAME_HEADER.size} byte header, got {len(code)} bytes")
+    version, bits, length = FRAME_HEADER.unpack_from(code)
+    if version != FRAME_VERSION:
+        raise ValueError(f"unknown frame version {version}")
+    start = FRAME_HEADER.size + _frame_extra(bits)
+    if len(code) < start:
+        raise ValueError(f"truncated frame, expected a {start} byte header, got {len(code)} bytes")
+    if len(code) - start < length:
+        raise ValueError(f"truncated frame, expected {length} bytes of text, got {max(len(code) - start, 0)}")
+    seq = channel = None
+    if bits & FRAME_SEQ: seq = FRAME_SEQ_FIELD.unpack_from(code, FRAME_HEADER.size)[0]
+    if bits & FRAME_CHAN: channel = FRAME_CHAN_FIELD.unpack_from(code, start - FRAME_CHAN_FIELD.size)[0]  # Last before the text
+    if bits & FRAME_CMPR:
+        if length == 0: raise ValueError("compressed frame has no codec id")
+        inflater = Inflater(code[start])
+        inflater.feed(code[start+1:start+length])
+        text = inflater.finish()
+        return _lazy_message(text, 0, len(text), bits, seq, channel)
+    if type(code) is not bytes: code = bytes(code)  # Don't hold on to a buffer that may change
+    return _lazy_message(code, start, start+length, bits, seq, channel)
+
+# -----------
+# Compression
+# -----------
+
+COMPRESS_MIN = 1024         # Default smallest text (bytes) worth compressing
+CODECS = {"zlib" : 1, "lzma" : 2}   # Codec name -> id byte leading a compressed frame's text
+_CODEC_NAMES = {CODECS[name]: name for name in CODECS}
+
+# lzma is optional (some Python builds lack it), and only imported once a codec
+# check or frame needs it: a welcome offering it, a 'compress lzma', an lzma frame
+_lzma = None
+
+# Returns the lzma module, or None if this Python lacks it
+def _lzma_module():
+    global _lzma
+    if _lzma is None:
+        try: import lzma
+        except ImportError: lzma = False
+        _lzma = lzma
+    return _lzma or None
+
+# Whether this Python can compress and decompress with a codec
+def codec_available(codec: str) -> bool:
+    if codec == "lzma": return _lzma_module() is not None
+    return codec in CODECS
+
+# Returns text compressed with a codec, led by the codec's id, or None if that's no smaller
+#  zlib runs at its fastest level, lzma is the slower choice for the smallest frames
+def compress_text(text: bytes, codec: str) -> bytes:
+    if codec == "zlib": packed = zlib.compress(text, 1)
+    elif codec == "lzma" and codec_available(codec):
+        packed = _lzma.compress(text, format=_lzma.FORMAT_XZ, check=_lzma.CHECK_NONE, preset=1)
+    else: raise ValueError(f"unknown compression codec '{codec}'")
+    if len(packed) + 1 >= len(text): return None
+    return bytes((CODECS[codec],)) + packed
+
+# Decompresses a compressed frame's text as it arrives, piece by piece
+#  Refuses to expand past FRAME_MAX_LENGTH, so a small frame can't balloon into a huge one
+class Inflater:
+    def __init__(self, codec_id: int):
+        match _CODEC_NAMES.get(codec_id):
+            case "zlib":
+                self._codec = zlib.decompressobj()
+                self._errors = (zlib.error, EOFError)
+            case "lzma" if codec_available("lzma"):
+                self._codec = _lzma.LZMADecompressor()
+                self._errors = (_lzma.LZMAError, EOFError)
+            case _: raise ValueError(f"unknown compression codec id {codec_id}")
+        self._parts = []
+        self._size = 0
+
+    def feed(self, data: bytes):
+        if len(data) == 0: return
+        try: part = self._codec.decompress(data, FRAME_MAX_LENGTH - self._size + 1)
+        except self._errors as e: raise ValueError(f"bad compressed text: {e}") from None
+        self._size += len(part)
+        if self._size > FRAME_MAX_LENGTH: raise ValueError(f"compressed text expands past {FRAME_MAX_LENGTH} bytes")
+        self._parts.append(part)
+
+    # Returns the whole decompressed text, raises ValueError if the compressed text was cut short
+    def finish(self) -> bytes:
+        if not self._codec.eof: raise ValueError("compressed text ends early")
+        return b"".join(self._parts)
+
+# Splits a server's welcome into (welcome text, codecs it accepts compressed frames in)
+def parse_welcome(welcome: str) -> tuple:
+    start_key, end_key = Message.FORMAT_KEYS["cmpr"]
+    start = welcome.find(start_key)
+    end = welcome.find(end_key, start)
+    if start == -1 or end == -1: return (welcome, ())
+    codecs = tuple(codec for codec in welcome[start+len(start_key):end].split(",") if codec_available(codec))
+    return ((welcome[:start] + welcome[end+len(end_key):]).strip(), codecs)
+
+# Wraps the codecs a server accepts for its welcome
+def welcome_codecs(codecs: tuple) -> str:
+    return _key_wrap(",".join(codecs), Message.FORMAT_KEYS["cmpr"])
+
+# Recycles fixed size recieve buffers between connections
+#  FrameDecoders borrow one while they hold undecoded bytes and hand it back once
+#  everything recieved is decoded, so buffers are only allocated up to the pool's count.
+class BufferPool:
+    def __init__(self, size = 65536, count = 64):
+        self.size = size        # Bytes per buffer
+        self.count = count      # Most idle buffers kept
+        self._free = []
+        self._lock = Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._free: return self._free.pop()
+        return bytearray(self.size)
+
+    def release(self, buffer):
+        if len(buffer) != self.size: return     # Grown for a large frame, let it go
+        with self._lock:
+            if len(self._free) < self.count: self._free.append(buffer)
+
+RECV_POOL = BufferPool()    # Shared by every connection's decoder
+
+# Incrementally splits a stream of byte chunks into Messages
+#  Bytes are recieved straight into the decoder's buffer: get_buffer() hands out the free
+#  space (for socket.recv_into or asyncio.BufferedProtocol), buffer_updated(n) decodes the n
+#  bytes just written. Frame headers are parsed in place, the complete frames of each read
+#  are copied out in one piece and handed out as LazyMessages over it (binary framing),
+#  and only the bytes of an incomplete frame are ever moved.
+#  Compressed frames are decompressed as their bytes arrive, rather than all at once
+#  when the last one does.
+#  feed() does the same for callers that already hold the bytes.
+#
+#  Buffers come from an optional pool (see BufferPool) and are handed back
+#  whenever every recieved byte has been decoded, so idle connections hold none.
+class FrameDecoder:
+    BUFFER_SIZE = 65536     # Size of buffers allocated without a pool
+
+    def __init__(self, framing: str = FRAMING_BINARY, pool = None):
+        self.framing = framing
+        self._pool = pool       # Where buffers are borrowed from (None to allocate them)
+        self._buffer = None     # Recieve buffer (bytearray), None while idle
+        self._view = None       # memoryview over the buffer
+        self._start = 0         # First byte not yet decoded
+        self._fill = 0          # End of the bytes recieved so far
+        self._need = 0          # Bytes the frame at _start needs in total, once its header is known
+        self._inflater = None   # Decompresses the frame at _start, if it's compressed and incomplete
+        self._fed = 0           # Bytes of that frame's text the inflater has been given
+
+    # Bytes held waiting for the rest of a frame
+    def pending(self) -> int:
+        return self._fill - self._start
+
+    # Returns a writable view of the buffer's free space
+    def get_buffer(self, sizehint: int = -1) -> memoryview:
+        if self._buffer is None: self._take_buffer()
+        if self._fill == len(self._buffer):
+            if self._start > 0: self._compact()
+            if self._fill == len(self._buffer) or self._need > len(self._buffer): self._grow()
+        return self._view[self._fill:]
+
+    # Decodes after n bytes were written into the view from get_buffer, returns the Messages completed
+    def buffer_updated(self, nbytes: int) -> list[Message]:
+        self._fill += nbytes
+        if self.framing == FRAMING_LEGACY: messages = self._decode_legacy()
+        else: messages = self._decode_binary()
+        if self._start == self._fill: self._give_buffer()   # All decoded, nothing to hold on to
+        return messages
+
+    # Add a chunk to the stream, return the list of Messages it completed
+    def feed(self, chunk: bytes) -> list[Message]:
+        messages = []
+        chunk = memoryview(chunk)
+        while len(chunk) > 0:
+            space = self.get_buffer()
+            size = min(len(space), len(chunk))
+            space[:size] = chunk[:size]
+            messages += self.buffer_updated(size)
+            chunk = chunk[size:]
+        return messages
+
+    # -----------------
+    # Buffer Management
+    # -----------------
+
+    def _take_buffer(self):
+        if self._pool is not None: self._buffer = self._pool.acquire()
+        else: self._buffer = bytearray(FrameDecoder.BUFFER_SIZE)
+        self._view = memoryview(self._buffer)
+        self._start = self._fill = 0
+
+    def _give_buffer(self):
+        self._view.release()
+        if self._pool is not None: self._pool.release(self._buffer)
+        self._buffer = self._view = None
+        self._start = self._fill = self._need = 0
+
+    # Move the incomplete frame's bytes to the front of the buffer
+    def _compact(self):
+        size = self._fill - self._start
+        self._view[:size] = self._view[self._start:self._fill]
+        self._start, self._fill = 0, size
+
+    # Replace the buffer with a larger one, big enough for the frame being recieved
+    def _grow(self):
+        size = max(len(self._buffer) * 2, self._need)
+        bigger = bytearray(size)
+        bigger[:self._fill] = self._view[:self._fill]
+        self._view.release()
+        if self._pool is not None: self._pool.release(self._buffer)
+        self._buffer = bigger
+        self._view = memoryview(bigger)
+
+    # Forget everything recieved, the stream can't be trusted past a bad frame
+    def _reset(self):
+        self._start = self._fill = self._need = 0
+        self._inflater = None
+
+    # --------
+    # Decoding
+    # --------
+
+    def _decode_binary(self) -> list[Message]:
+        frames = []     # (bits, seq, channel, text start, text end, decompressed text) of each complete frame
+        buf = self._buffer
+        first = offset = self._start
+        fill = self._fill
+        self._need = 0
+        while fill - offset >= FRAME_HEADER.size:
+            version, bits, length = FRAME_HEADER.unpack_from(buf, offset)
+            if version != FRAME_VERSION or length > FRAME_MAX_LENGTH:
+                self._reset()
+                raise ValueError(f"bad frame header (version {version}, length {length})")
+            start = offset + FRAME_HEADER.size + _frame_extra(bits)
+            end = start + length
+            if end > fill:                  # Rest of the frame hasn't arrived yet
+                self._need = end - offset
+                if bits & FRAME_CMPR and fill > start: self._inflate(start, fill)
+                break
+            seq = channel = None
+            if bits & FRAME_SEQ: seq = FRAME_SEQ_FIELD.unpack_from(buf, offset+FRAME_HEADER.size)[0]
+            if bits & FRAME_CHAN: channel = FRAME_CHAN_FIELD.unpack_from(buf, start-FRAME_CHAN_FIELD.size)[0]
+            text = None
+            if bits & FRAME_CMPR:
+                self._inflate(start, end)
+                try: text = self._inflater.finish()
+                except ValueError:
+                    self._reset()
+                    raise
+                self._inflater = None
+            frames.append((bits, seq, channel, start - first, end - first, text))
+            offset = end
+        self._start = offset
+        if not frames: return []
+        raw = bytes(self._view[first:offset])   # The buffer is reused, the messages get their own copy
+        return [_lazy_message(raw, start, end, bits, seq, channel) if text is None
+                else _lazy_message(text, 0, len(text), bits, seq, channel)
+                for bits, seq, channel, start, end, text in frames]
+
+    # Gives the compressed frame whose text starts at start the bytes of it recieved up to end
+    #  A frame with no text has no codec id, its start is already the next frame's first byte
+    def _inflate(self, start: int, end: int):
+        try:
+            if end <= start: raise ValueError("compressed frame has no codec id")
+            if self._inflater is None:
+                self._inflater = Inflater(self._buffer[start])
+                self._fed = 1
+            self._inflater.feed(self._view[start+self._fed:end])
+            self._fed = end - start
+        except ValueError:
+            self._reset()
+            raise
+
+    def _decode_legacy(self) -> list[Message]:
+        messages = []
+        buf = self._buffer
+        offset = self._start
+        while (end := buf.find(_LEGACY_END, offset, self._fill)) != -1:
+            end += len(_LEGACY_END)
+            messages.append(_decode_legacy(bytes(self._view[offset:end])))
+            offset = end
+        self._start = offset
+        return messages
+
 # =============================================================================
 
 # ---------------------------
@@ -126,11 +611,11 @@ def parse_message_data_string(inpt: str) -> dict:
 # Return string of message formatted according to its components
 def stringify_message_fancy(msg: Message) -> str:
     mess = ""
-    if msg.modifiers["echo"]:
+    if msg.bits & Message.MOD_BITS["echo"]:
         mess = msg.text
-        if msg.modifiers["caps"]:
+        if msg.bits & Message.MOD_BITS["caps"]:
             mess = mess.upper()
-        if msg.modifiers["rvrs"]:
+        if msg.bits & Message.MOD_BITS["rvrs"]:
             mess = mess[::-1]
     return mess
 
@@ -141,3 +626,98 @@ def stringify_message_raw(msg: Message):
         mess += f"|{mod}:{msg.modifiers[mod]}"
     mess += "|"
     return mess
+
+# =============================================================================
+
+# ---------------
+# Message Batches
+# ---------------
+
+# Columnar container for many messages: texts, modifier bits, sequence ids and channels held
+# in parallel arrays instead of one object per message. Indexing builds a Message on demand.
+class MessageBatch:
+    __slots__ = ("texts", "bits", "seqs", "channels")
+
+    NO_SEQ = -1     # Stands in for a message without a sequence id
+    NO_CHANNEL = -1 # Stands in for a message without a channel
+
+    def __init__(self, messages: list = ()):
+        self.texts = []             # Message texts
+        self.bits = bytearray()     # Modifier bits, one byte per message
+        self.seqs = array("q")      # Sequence ids (NO_SEQ for none)
+        self.channels = array("q")  # Channel ids (NO_CHANNEL for none)
+        self.extend(messages)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __getitem__(self, index: int) -> Message:
+        seq, channel = self.seqs[index], self.channels[index]
+        return _message_from_frame(self.texts[index], self.bits[index], None if seq == MessageBatch.NO_SEQ else seq,
+                                   None if channel == MessageBatch.NO_CHANNEL else channel)
+
+    def __iter__(self):
+        for index in range(len(self.texts)): yield self[index]
+
+    def append(self, mess: Message):
+        self.texts.append(mess.text)
+        self.bits.append(mess.bits)
+        self.seqs.append(MessageBatch.NO_SEQ if mess.seq is None else mess.seq)
+        self.channels.append(MessageBatch.NO_CHANNEL if mess.channel is None else mess.channel)
+
+    def extend(self, messages: list):
+        for mess in messages: self.append(mess)
+
+    def clear(self):
+        self.texts.clear()
+        del self.bits[:]
+        del self.seqs[:]
+        del self.channels[:]
+
+# =============================================================================
+
+# -----------------
+# Message Templates
+# -----------------
+
+# Bounded LRU cache of message definition strings ('write' operands) to pre-encoded templates
+#  Load tests send the same few definitions over and over. A template keeps a definition's
+#  modifier bits and its text already encoded as UTF-8, so a cached definition skips parsing,
+#  modify_message and encoding: each Message is a LazyMessage over the template's (immutable)
+#  bytes, sent as is and only decoded if its text is read.
+class TemplateCache:
+    def __init__(self, size: int = 256):
+        self.size = size        # Most templates kept, 0 turns the cache off
+        self.hits = 0
+        self.misses = 0
+        self._templates = OrderedDict()     # Definition -> (utf-8 text, bits), least recent first
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    # Returns a new Message for a definition string, as Message(parse_message_data_string(definition)) would
+    def message(self, definition: str) -> Message:
+        template = self._templates.get(definition)
+        if template is None:
+            self.misses += 1
+            mess = Message(parse_message_data_string(definition))
+            if self.size == 0: return mess
+            template = (mess.text.encode(), mess.bits)
+            self._templates[definition] = template
+            if len(self._templates) > self.size: self._templates.popitem(last=False)
+        else:
+            self.hits += 1
+            self._templates.move_to_end(definition)
+        return _lazy_message(template[0], 0, len(template[0]), template[1])
+
+    # Changes the most templates kept, evicting the least recently used
+    def resize(self, size: int):
+        self.size = size
+        while len(self._templates) > size: self._templates.popitem(last=False)
+
+    def clear(self):
+        self._templates.clear()
+        self.hits = self.misses = 0
+
+    def describe(self) -> str:
+        return f"{len(self._templates)}/{self.size} cached, {self.hits} hits, {self.misses} misses"
@@ -0,0 +1,123 @@
+import time     # For timing encodes/decodes
+
+# =============================================================================
+# Client Metrics
+#
+# Always on counters and timers kept by each connection:
+#  * messages and bytes sent and recieved
+#  * total time spent encoding and decoding messages
+#  * a histogram of round trip latencies (send to matching echo)
+#
+# Recording is a few integer additions, cheap enough to leave on for every message.
+# =============================================================================
+
+# ---------
+# Histogram
+# ---------
+
+# HDR style histogram of non-negative integer values (nanoseconds, for latency)
+#  Values are counted in log-linear buckets: each power of two is split into
+#  2^SUB_BITS sub-buckets, so any recorded value is known to within ~1%
+#  no matter how large, in a fixed and small amount of memory.
+class Histogram():
+    SUB_BITS = 7
+
+    def __init__(self):
+        self.counts = {}    # Bucket index -> values recorded in it
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    # Bucket holding a value: values below 2^(SUB_BITS+1) get their own, larger ones share
+    @classmethod
+    def _index(cls, value: int) -> int:
+        shift = value.bit_length() - cls.SUB_BITS - 1
+        if shift <= 0: return value
+        return (shift << cls.SUB_BITS) + (value >> shift)
+
+    # Highest value that lands in a bucket
+    @classmethod
+    def _bucket_high(cls, index: int) -> int:
+        if index < 2 << cls.SUB_BITS: return index
+        shift = (index >> cls.SUB_BITS) - 1
+        return ((index - (shift << cls.SUB_BITS) + 1) << shift) - 1
+
+    def record(self, value: int):
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min: self.min = value
+        if value > self.max: self.max = value
+
+    # Fold another histogram's values into this one
+    def merge(self, other: "Histogram"):
+        for index in other.counts:
+            self.counts[index] = self.counts.get(index, 0) + other.counts[index]
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min): self.min = other.min
+        if other.max > self.max: self.max = other.max
+
+    # Value at or below which p percent (0-100) of recorded values fall
+    def percentile(self, p: float) -> int:
+        if self.count == 0: return 0
+        rank = max(1, -(-self.count * p // 100))   # ceil, at least the first value
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank: return min(self._bucket_high(index), self.max)
+        return self.max
+
+    def mean(self) -> float:
+        if self.count == 0: return 0
+        return self.total / self.count
+
+# =============================================================================
+
+# -------
+# Metrics
+# -------
+
+# Counters and timers for one connection
+class Metrics():
+    def __init__(self):
+        self.messages_sent = 0
+        self.messages_recieved = 0
+        self.bytes_sent = 0
+        self.bytes_recieved = 0
+        self.encode_ns = 0      # Total time spent encoding
+        self.decode_ns = 0      # Total time spent decoding
+        self.rtt = Histogram()  # Round trip latencies, in nanoseconds
+        self.started = time.monotonic()
+
+    # Fold another connection's metrics into these
+    def merge(self, other: "Metrics"):
+        self.messages_sent += other.messages_sent
+        self.messages_recieved += other.messages_recieved
+        self.bytes_sent += other.bytes_sent
+        self.bytes_recieved += other.bytes_recieved
+        self.encode_ns += other.encode_ns
+        self.decode_ns += other.decode_ns
+        self.rtt.merge(other.rtt)
+        self.started = min(self.started, other.started)
+
+    # Returns a dict of display strings summarising the metrics
+    def summary(self) -> dict:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        per_sent = self.encode_ns / max(self.messages_sent, 1)
+        per_recieved = self.decode_ns / max(self.messages_recieved, 1)
+        return {"sent"      : f"{self.messages_sent} messages, {self.bytes_sent} bytes ({self.messages_sent/elapsed:.1f} msg/s)",
+                "recieved"  : f"{self.messages_recieved} messages, {self.bytes_recieved} bytes ({self.messages_recieved/elapsed:.1f} msg/s)",
+                "encode"    : f"{self.encode_ns/1e6:.3f}ms total, {per_sent/1e3:.2f}us per message",
+                "decode"    : f"{self.decode_ns/1e6:.3f}ms total, {per_recieved/1e3:.2f}us per message",
+                "rtt p50"   : _format_ns(self.rtt.percentile(50)),
+                "rtt p99"   : _format_ns(self.rtt.percentile(99)),
+                "rtt p999"  : _format_ns(self.rtt.percentile(99.9)),
+                "rtt max"   : _format_ns(self.rtt.max),
+                "rtt count" : str(self.rtt.count)}
+
+# Nanoseconds as a readable millisecond string
+def _format_ns(ns: int) -> str:
+    return f"{ns/1e6:.3f}ms"
@@ -0,0 +1,187 @@
+import asyncio          # For opening the shared connection once
+
+from aclient import AsyncClient, run_sync
+from client import Client
+from inbox import Inbox
+from messages import Message, FRAMING_LEGACY
+
+# =============================================================================
+# Multiplexed Channels
+#
+# Runs many logical sessions over one TCP connection, so a single machine can
+# stand in for tens of thousands of users without a socket (and an ephemeral
+# port) for each:
+#  * a Multiplexer owns one connection, the carrier, and opens channels on it
+#  * every frame a channel sends carries its channel id (the FRAME_CHAN bit,
+#    see messages.py), which the server echos back along with the rest
+#  * the carrier routes each echo to the inbox of the channel it names
+#  * a channel stands in for a ConnectionPool as a Client's engine, so every
+#    channel is driven through the usual Client API (or a command script)
+#
+# The carrier connects when the first channel does, and closes once the last
+# one has. Connection options (window, coalescing, timeouts, compression) are
+# the carrier's, set once on the multiplexer for every channel. Channels need
+# binary framing (legacy frames have no room for an id) and a server which
+# echos frames byte for byte, like server.py.
+#
+# ex: mux = Multiplexer("127.0.0.1", 31800, window=4096)
+#     clients = [mux.client() for _ in range(10000)]
+# =============================================================================
+
+MUX_WINDOW = 1024       # Default most messages in flight on the carrier, across every channel
+CHANNEL_LIMIT = 2**32   # Channel ids wrap around at the frame field's size
+
+class Multiplexer():
+    def __init__(self, host: str = None, port: int = None, window: int = MUX_WINDOW):
+        self.carrier = AsyncClient(host, port, window=window)  # The one real connection
+        self._next_id = 0       # Id for the next channel
+        self._opening = None    # Task connecting the carrier, shared by channels connecting at once
+
+    # Sets connection options on the carrier (see AsyncClient), ex: configure(window=4096, compress="zlib")
+    def configure(self, **options):
+        for option in options:
+            if not hasattr(self.carrier, option) or option in ("inbox", "channels"):
+                raise KeyError(f"unknown connection option '{option}'")
+            setattr(self.carrier, option, options[option])
+
+    # Returns a new channel (closed until its connection_open)
+    def channel(self, inbox: Inbox = None) -> "Channel":
+        channel = Channel(self, self._next_id, inbox)
+        self._next_id = (self._next_id + 1) % CHANNEL_LIMIT
+        return channel
+
+    # Returns a new Client whose sends travel on a channel of this multiplexer
+    def client(self) -> Client:
+        return Client(engine=self.channel())
+
+    # Number of channels open
+    def open_channels(self) -> int:
+        return len(self.carrier.channels)
+
+    # Closes every channel, and with them the carrier
+    def close(self):
+        if self.carrier.is_open(): run_sync(self._close())
+
+    async def _close(self):
+        self.carrier.channels.clear()
+        await self.carrier.connection_close()
+
+    # =========================================================================
+
+    # ----------------------------
+    # Attaching/Detaching Channels
+    # ----------------------------
+
+    # Registers a channel on the carrier, connecting the carrier first if it isn't, returns its welcome
+    async def _attach(self, channel: "Channel") -> str:
+        if not self.carrier.is_connected():
+            if self._opening is None or self._opening.done():
+                self._opening = asyncio.ensure_future(self._connect())
+            await asyncio.shield(self._opening)
+        self.carrier.channels[channel.id] = channel.inbox
+        return self.carrier.welcome
+
+    async def _connect(self):
+        if self.carrier.is_open(): await self.carrier.connection_close()   # Dropped, start afresh
+        await self.carrier.connection_open()
+
+    # Unregisters a channel, closing the carrier once no channel is left on it
+    async def _detach(self, channel: "Channel"):
+        self.carrier.channels.pop(channel.id, None)
+        if len(self.carrier.channels) == 0 and self.carrier.is_open(): await self.carrier.connection_close()
+
+# One logical session on a multiplexer's carrier
+#  Presents the engine interface Client drives (the same as ConnectionPool's), with
+#  its own inbox. Sends are stamped with the channel's id and go out on the carrier.
+class Channel():
+    def __init__(self, mux: Multiplexer, id: int, inbox: Inbox = None):
+        self.mux = mux
+        self.id = id
+        self.inbox = Inbox() if inbox is None else inbox    # Echos of this channel's messages
+        self.welcome = None         # Welcome the carrier got
+        self.policy = "roundrobin"  # Kept for Client, a channel only has the one connection
+        self.framing = None         # Framing the client asked for
+        self._open = False
+
+    # The carrier's endpoint and state, shared by every channel
+    @property
+    def host(self) -> str:
+        return self.mux.carrier.host
+
+    @host.setter
+    def host(self, host: str):
+        self.mux.carrier.host = host
+
+    @property
+    def port(self) -> int:
+        return self.mux.carrier.port
+
+    @port.setter
+    def port(self, port: int):
+        self.mux.carrier.port = port
+
+    @property
+    def codecs(self) -> tuple:
+        return self.mux.carrier.codecs
+
+    @property
+    def metrics(self):
+        return self.mux.carrier.metrics
+
+    # Connection options are the multiplexer's, only the framing is kept (to refuse legacy)
+    def configure(self, **options):
+        if "framing" in options: self.framing = options["framing"]
+
+    def is_open(self) -> bool:
+        return self._open
+
+    def is_connected(self) -> bool:
+        return self._open and self.mux.carrier.is_connected()
+
+    def describe(self) -> str:
+        return f"channel {self.id}, one of {self.mux.open_channels()} on a shared connection"
+
+    # =========================================================================
+
+    # ---------------------------
+    # Opening/Closing the Channel
+    # ---------------------------
+
+    async def connection_open(self) -> str:
+        if self._open: raise ConnectionError("channel already open")
+        if self.framing == FRAMING_LEGACY: raise ConnectionError("channels need binary framing, legacy frames can't carry their id")
+        self.welcome = await self.mux._attach(self)
+        self._open = True
+        return self.welcome
+
+    async def connection_close(self):
+        if not self._open: return
+        self._open = False
+        await self.mux._detach(self)
+
+    # A channel is always a single session
+    async def resize(self, size: int):
+        pass
+
+    # Moves the channel onto another inbox, returns the old one (see ConnectionPool.swap_inbox)
+    async def swap_inbox(self, inbox: Inbox) -> Inbox:
+        old = self.inbox
+        if len(inbox) == 0:
+            inbox.append_from(old)
+        self.inbox = inbox
+        if self._open: self.mux.carrier.channels[self.id] = inbox
+        return old
+
+    # ----------------
+    # Sending Messages
+    # ----------------
+
+    async def message_send(self, msg: Message, await_echo: bool = False) -> Message:
+        if not self.is_connected(): raise ConnectionError("channel is closed")
+        msg.channel = self.id
+        return await self.mux.carrier.message_send(msg, await_echo)
+
+    async def message_send_many(self, msgs: list[Message]) -> list[Message]:
+        if not self.is_connected(): raise ConnectionError("channel is closed")
+        for msg in msgs: msg.channel = self.id
+        return await self.mux.carrier.message_send_many(msgs)
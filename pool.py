@@ -0,0 +1,269 @@
+import asyncio          # For the supervisor task
+import random           # For backoff jitter
+from time import monotonic
+
+from aclient import AsyncClient, echo_wait
+from defaults import POOL_POLICIES, WINDOW, CONNECT_TIMEOUT, WELCOME_TIMEOUT, ECHO_TIMEOUT
+from inbox import Inbox
+from messages import Message, FRAMING_BINARY, COMPRESS_MIN
+from metrics import Metrics
+
+# =============================================================================
+# Connection Pool
+#
+# A pool keeps a number of warm connections (AsyncClients) open to one or more
+# host:port endpoints, and stands in for a single AsyncClient:
+#  * sends are spread across the connected members, round robin or to the
+#    member with the fewest messages in flight
+#  * a supervisor task probes members that have sat idle, and closes any
+#    that don't answer
+#  * members which drop are reconnected in the background, with exponential
+#    backoff (and jitter) so a flapping server isn't stormed with connects
+#
+# Every member recieves into the same inbox. Engine options (framing, window,
+# coalescing) are set on the pool with configure() and apply to every member.
+# =============================================================================
+
+HEALTH_INTERVAL = 5     # Seconds a member may sit idle before it's probed
+HEALTH_TIMEOUT = 2      # Seconds a probe has to come back
+BACKOFF_BASE = 0.1      # Seconds before the first reconnect attempt
+BACKOFF_MAX = 10        # Longest wait between reconnect attempts
+SUPERVISE_EVERY = 0.5   # Seconds between supervisor passes
+
+class ConnectionPool():
+    # --------------
+    # Initialization
+    # --------------
+
+    def __init__(self, endpoints: list = None, size: int = 1, policy: str = "roundrobin", inbox: Inbox = None):
+        self.endpoints = [] if endpoints is None else endpoints    # (host, port) pairs, members spread across them
+        self.size = size            # Members to keep open
+        self.policy = policy        # How sends pick a member
+        self.inbox = Inbox() if inbox is None else inbox    # Shared by every member
+        self.welcome = None         # Welcome from the first member to connect
+        self.codecs = ()            # Compression codecs its server accepts
+        self.reconnects = 0         # Successful reconnects since opening
+
+        self.options = {"framing"        : FRAMING_BINARY,
+                        "window"         : WINDOW,
+                        "coalesce_us"    : 0,
+                        "coalesce_bytes" : 0,
+                        "connect_timeout": CONNECT_TIMEOUT,
+                        "welcome_timeout": WELCOME_TIMEOUT,
+                        "echo_timeout"   : ECHO_TIMEOUT,
+                        "compress"       : "off",
+                        "compress_min"   : COMPRESS_MIN,
+                        "recorder"       : None}
+
+        self._members = []          # AsyncClients
+        self._retry_at = {}         # Member -> when to next try reconnecting it
+        self._backoff = {}          # Member -> current backoff delay
+        self._supervisor = None     # Supervisor task
+        self._next = 0              # Round robin position
+        self._retired = Metrics()   # Metrics of members no longer in the pool
+
+    # Single endpoint shorthand, what Client sets with host/port
+    @property
+    def host(self) -> str:
+        return self.endpoints[0][0] if self.endpoints else None
+
+    @host.setter
+    def host(self, host: str):
+        self.endpoints = [(host, self.port)]
+
+    @property
+    def port(self) -> int:
+        return self.endpoints[0][1] if self.endpoints else None
+
+    @port.setter
+    def port(self, port: int):
+        self.endpoints = [(self.host, port)]
+
+    # Sets engine options on the pool and every member
+    def configure(self, **options):
+        for option in options:
+            if option not in self.options: raise KeyError(f"unknown engine option '{option}'")
+            self.options[option] = options[option]
+            for member in self._members: setattr(member, option, options[option])
+
+    # Members currently connected
+    def connected(self) -> list:
+        return [member for member in self._members if member.is_connected()]
+
+    def is_connected(self) -> bool:
+        return any(member.is_connected() for member in self._members)
+
+    def is_open(self) -> bool:
+        return len(self._members) > 0
+
+    # Merged metrics of every member, past and present
+    @property
+    def metrics(self) -> Metrics:
+        merged = Metrics()
+        merged.merge(self._retired)
+        for member in self._members: merged.merge(member.metrics)
+        return merged
+
+    # Returns a short description of the pool's health
+    def describe(self) -> str:
+        return f"{len(self.connected())}/{len(self._members)} connected, {self.reconnects} reconnects"
+
+    # =========================================================================
+
+    # -------------
+    # Using Members
+    # -------------
+
+    # Picks the member the next send goes through
+    def pick(self) -> AsyncClient:
+        members = self.connected()
+        if len(members) == 0: raise ConnectionError("no pooled connection is up")
+        if self.policy == "leastinflight": return min(members, key=AsyncClient.in_flight)
+        self._next = (self._next + 1) % len(members)
+        return members[self._next]
+
+    async def message_send_pipelined(self, msg: Message, intended: int = None) -> asyncio.Future:
+        return await self.pick().message_send_pipelined(msg, intended)
+
+    async def message_send(self, msg: Message, await_echo: bool = False) -> Message:
+        return await self.pick().message_send(msg, await_echo)
+
+    async def message_send_batch(self, msgs: list[Message]) -> list[asyncio.Future]:
+        return await self.pick().message_send_batch(msgs)
+
+    # Splits the messages across every connected member, returns their echos in send order
+    async def message_send_many(self, msgs: list[Message]) -> list[Message]:
+        members = self.connected()
+        if len(members) == 0: raise ConnectionError("no pooled connection is up")
+        shares = [msgs[i::len(members)] for i in range(len(members))]
+        batches = await asyncio.gather(*[member.message_send_batch(share) for member, share in zip(members, shares)])
+        echos = [None] * len(msgs)
+        for i in range(len(members)): echos[i::len(members)] = batches[i]
+        return await echo_wait(echos, self.options["echo_timeout"])
+
+    # Waits for and returns the next message any member recieves
+    async def inbox_next(self) -> Message:
+        members = self.connected()
+        if len(members) == 0: raise ConnectionError("no pooled connection is up")
+        waits = [asyncio.ensure_future(member.inbox_next()) for member in members]
+        done, pending = await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+        for wait in pending: wait.cancel()
+        return done.pop().result()
+
+    # =========================================================================
+
+    # ---------------------------
+    # Opening/Closing Connections
+    # ---------------------------
+
+    def _new_member(self, index: int) -> AsyncClient:
+        host, port = self.endpoints[index % len(self.endpoints)]
+        member = AsyncClient(host, port, inbox=self.inbox)
+        for option in self.options: setattr(member, option, self.options[option])
+        return member
+
+    # Opens every member at once, returns the first welcome
+    #  Members that fail are left to the supervisor to reconnect; raises the
+    #  first error only if none connect at all
+    async def connection_open(self) -> str:
+        if self._members: raise ConnectionError("pool already open")
+        if not self.endpoints: raise ConnectionError("no endpoints to connect to")
+        self._members = [self._new_member(i) for i in range(self.size)]
+        results = await asyncio.gather(*[member.connection_open() for member in self._members], return_exceptions=True)
+        for member, result in zip(self._members, results):
+            if isinstance(result, BaseException): self._schedule_retry(member)
+        welcomes = [result for result in results if not isinstance(result, BaseException)]
+        if len(welcomes) == 0:
+            self._members = []
+            self._retry_at.clear()
+            self._backoff.clear()
+            raise results[0]
+        self.welcome = welcomes[0]
+        self.codecs = next(member.codecs for member in self._members if member.is_connected())
+        self._supervisor = asyncio.create_task(self._supervise())
+        return self.welcome
+
+    # Stops the supervisor and closes every member
+    async def connection_close(self):
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+            await asyncio.gather(self._supervisor, return_exceptions=True)
+            self._supervisor = None
+        await asyncio.gather(*[member.connection_close() for member in self._members])
+        for member in self._members: self._retired.merge(member.metrics)
+        self._members = []
+        self._retry_at.clear()
+        self._backoff.clear()
+
+    # Changes how many members are kept open, opening or closing the difference
+    async def resize(self, size: int):
+        self.size = size
+        if not self._members: return
+        while len(self._members) > size:
+            member = self._members.pop()
+            self._retry_at.pop(member, None)
+            self._backoff.pop(member, None)
+            await member.connection_close()
+            self._retired.merge(member.metrics)
+        fresh = []
+        while len(self._members) < size:
+            fresh.append(self._new_member(len(self._members)))
+            self._members.append(fresh[-1])
+        results = await asyncio.gather(*[member.connection_open() for member in fresh], return_exceptions=True)
+        for member, result in zip(fresh, results):
+            if isinstance(result, BaseException): self._schedule_retry(member)
+
+    # Moves the pool and every member onto another inbox, returns the old one
+    #  The old inbox's messages move across with their numbers, unless the new one already holds its own.
+    #  Runs on the engine loop, where members append, so no arrival is lost in between.
+    async def swap_inbox(self, inbox: Inbox) -> Inbox:
+        old = self.inbox
+        if len(inbox) == 0:
+            inbox.append_from(old)
+        self.inbox = inbox
+        for member in self._members: member.inbox = inbox
+        return old
+
+    # =========================================================================
+
+    # -----------
+    # Supervising
+    # -----------
+
+    # Schedule a member's next reconnect attempt, doubling its backoff each time
+    def _schedule_retry(self, member: AsyncClient):
+        delay = self._backoff.get(member, BACKOFF_BASE / 2) * 2
+        delay = min(delay, BACKOFF_MAX)
+        self._backoff[member] = delay
+        self._retry_at[member] = monotonic() + delay * random.uniform(0.5, 1)
+
+    async def _reconnect(self, member: AsyncClient):
+        await member.connection_close()
+        try: await member.connection_open()
+        except (OSError, TimeoutError, ConnectionError):
+            self._schedule_retry(member)
+            return
+        self._retry_at.pop(member, None)
+        self._backoff.pop(member, None)
+        self.reconnects += 1
+
+    async def _check(self, member: AsyncClient):
+        try: await member.ping(HEALTH_TIMEOUT)
+        except (OSError, TimeoutError, ConnectionError):
+            await member.connection_close()
+            self._schedule_retry(member)
+
+    # The supervisor task
+    # Reconnects dropped members once their backoff passes, probes idle ones
+    async def _supervise(self):
+        while True:
+            await asyncio.sleep(SUPERVISE_EVERY)
+            now = monotonic()
+            work = []
+            for member in list(self._members):
+                if not member.is_connected():
+                    if member not in self._retry_at: self._schedule_retry(member)
+                    elif now >= self._retry_at[member]: work.append(self._reconnect(member))
+                elif now - member.last_active >= HEALTH_INTERVAL:
+                    work.append(self._check(member))
+            if work: await asyncio.gather(*work)
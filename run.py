@@ -1,26 +1,41 @@
+import sys
+
 from client import Client
 from commands import command_get, command_run
 
-print(" .running client setup script:")
+# Given a host and port ('python run.py 127.0.0.1 31800') the client skips the setup
+# script and its prompts: it connects straight away, then reads commands, without
+# a '> ' prompt when they are piped in. For harnesses launching many short runs.
+fast = len(sys.argv) == 3
 
-print(" .creating client")
 client = Client()
+prompt = "> "
+
+if fast:
+    if not (command_run(client, command_get("host " + sys.argv[1]), interactive=False)
+            and command_run(client, command_get("port " + sys.argv[2]), interactive=False)
+            and command_run(client, command_get("connect"), interactive=False)): sys.exit(3)
+    if not sys.stdin.isatty(): prompt = ""
+else:
+    print(" .running client setup script:")
+
+    print(" .creating client")
 
-print(" .setting host to draco1 with 'host 158.83.11.22'")
-command_run(client, command_get("host 158.83.11.22"))
+    print(" .setting host to draco1 with 'host 158.83.11.22'")
+    command_run(client, command_get("host 158.83.11.22"))
 
-while(not command_run(client, command_get("port " + input(" .asking you for initial port: ")))): pass
+    while(not command_run(client, command_get("port " + input(" .asking you for initial port: ")))): pass
 
-print(" .establishing connection with 'connect'")
-command_run(client, command_get("connect"))
+    print(" .establishing connection with 'connect'")
+    command_run(client, command_get("connect"))
 
-print(" .client setup complete, running input loop:")
-print(" .try 'help' for a list of commands\n")
+    print(" .client setup complete, running input loop:")
+    print(" .try 'help' for a list of commands\n")
 
 try:
-    while not client.killme: command_run(client, command_get(input("> ")))
+    while not client.killme: command_run(client, command_get(input(prompt)))
+except EOFError:
+    client.shutdown()   # Commands ran out
 except:
     print(" .an unhandled error occured, attempting graceful shutdown")
     client.shutdown()
-
-
@@ -0,0 +1,170 @@
+import asyncio                  # For running timers on the event loop
+import random                   # For Poisson arrivals
+from time import perf_counter_ns
+
+from metrics import Histogram
+
+# =============================================================================
+# Open Loop Scheduler
+#
+# Sends messages at the times a schedule says they should go, whether or not
+# earlier echos have come back. A closed loop (send, wait for the echo, send
+# again) quietly stops sending while the server stalls, so the stall only ever
+# shows up in the one message caught in it (coordinated omission). Here:
+#  * every send has an intended time, fixed in advance from the start of the
+#    run: evenly spaced for a constant rate, or exponential gaps for Poisson
+#  * a timer wheel fires each send at its intended time, computed from the
+#    monotonic clock, so late wakeups never push later sends back
+#  * a send that can't go out (window full, socket backed up) waits without
+#    holding up the ones after it
+#  * latency is measured from the intended time, so waiting counts against it
+#
+# ex: loop = OpenLoop(send, rate=5000, arrivals="poisson")
+#     await loop.run(duration=30)
+#  where send is an async callable taking the intended time (perf_counter_ns)
+# =============================================================================
+
+TICK_NS = 1_000_000     # Timer wheel resolution, 1ms
+WHEEL_SLOTS = 1024      # Ticks in one turn of the wheel
+
+ARRIVALS = ("constant", "poisson")
+
+# -----------
+# Timer Wheel
+# -----------
+
+# Hashed timer wheel on perf_counter_ns
+#  Timers are bucketed by the tick they are due in, with a count of whole turns
+#  left for ones further away than a turn. Scheduling and firing are O(1), and
+#  each tick's deadline is computed from when the wheel started rather than from
+#  the last wakeup, so oversleeping never accumulates into drift. Between timers the
+#  wheel sleeps until the next tick with any in its slot, woken early by schedule()
+#  if an earlier timer comes in, rather than waking on every tick.
+class TimerWheel():
+    def __init__(self, tick_ns: int = TICK_NS, slots: int = WHEEL_SLOTS):
+        self.tick_ns = tick_ns
+        self._slots = [[] for _ in range(slots)]
+        self._origin = perf_counter_ns()    # Time of tick 0
+        self._tick = 0                      # Next tick to fire
+        self._count = 0                     # Timers waiting
+        self._runner = None                 # Task firing ticks, while any timers wait
+        self._wake = None                   # Future the runner sleeps on, resolved to wake it
+        self._waking = None                 # Tick the runner is sleeping until
+
+    def __len__(self) -> int:
+        return self._count
+
+    # Calls callback(*args) at time 'at' (perf_counter_ns), or on the next tick if that has passed
+    def schedule(self, at: int, callback, *args):
+        if self._runner is None:    # Idle, skip the ticks that passed with nothing to fire
+            self._tick = max(self._tick, (perf_counter_ns() - self._origin) // self.tick_ns)
+        due = max(-(-(at - self._origin) // self.tick_ns), self._tick)
+        rounds = (due - self._tick) // len(self._slots)
+        self._slots[due % len(self._slots)].append([rounds, callback, args])
+        self._count += 1
+        if self._runner is None: self._runner = asyncio.ensure_future(self._run())
+        elif self._wake is not None and due < self._waking: self._wake_up()   # Due before the runner wakes
+
+    # First tick from the next one to fire whose slot holds any timers
+    #  Timers a turn or more away sit in their slot too, so none is ever passed over
+    def _next_due(self) -> int:
+        for tick in range(self._tick, self._tick + len(self._slots)):
+            if self._slots[tick % len(self._slots)]: return tick
+        return self._tick
+
+    def _wake_up(self):
+        if self._wake is not None and not self._wake.done(): self._wake.set_result(None)
+
+    # Fires ticks as their deadlines pass, catching up on any slept through
+    #  Sleeps until the next occupied tick is due, so empty ticks never wake it
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while self._count:
+                due = self._next_due()
+                delay = self._origin + due * self.tick_ns - perf_counter_ns()
+                if delay > 0:
+                    self._wake, self._waking = loop.create_future(), due
+                    timer = loop.call_later(delay / 1e9, self._wake_up)
+                    try: await self._wake
+                    finally:
+                        timer.cancel()
+                        self._wake = self._waking = None
+                now = perf_counter_ns()
+                while self._count and self._origin + self._tick * self.tick_ns <= now: self._fire()
+        finally: self._runner = None
+
+    # Fires the timers of the next tick whose turn it is
+    #  The tick is moved on first, so timers scheduled by a callback land in a later one
+    def _fire(self):
+        slot = self._tick % len(self._slots)
+        self._tick += 1
+        timers, self._slots[slot] = self._slots[slot], []
+        for timer in timers:
+            if timer[0] > 0:
+                timer[0] -= 1
+                self._slots[slot].append(timer)
+                continue
+            self._count -= 1
+            timer[1](*timer[2])
+
+# =============================================================================
+
+# ---------
+# Open Loop
+# ---------
+
+# Drives an async send at a rate, as a constant or Poisson arrival process
+#  The send handles its own errors, a failed send is the caller's to count
+class OpenLoop():
+    def __init__(self, send, rate: float, arrivals: str = "constant", seed: int = None, wheel: TimerWheel = None):
+        if rate <= 0: raise ValueError("an open loop needs a rate above 0")
+        if arrivals not in ARRIVALS: raise ValueError(f"arrivals must be one of {', '.join(ARRIVALS)}, not '{arrivals}'")
+        self.send = send
+        self.rate = rate            # Sends per second
+        self.arrivals = arrivals
+        self.wheel = TimerWheel() if wheel is None else wheel   # Share one wheel between loops on the same event loop
+        self.issued = 0             # Sends started
+        self.lag = Histogram()      # How late each send started after its intended time, in nanoseconds
+        self._rng = random.Random(seed)
+        self._sending = set()       # Sends still running
+        self._done = None
+
+    # Intended time of the send after the one at 'previous'
+    #  Constant sends are spaced from the start time, so rounding never adds up
+    def _next(self, start: int, previous: int) -> int:
+        if self.arrivals == "constant": return start + round(self.issued * 1e9 / self.rate)
+        return previous + round(self._rng.expovariate(self.rate) * 1e9)
+
+    # Sends until the duration (seconds) has passed or count sends have started, whichever is first
+    #  Returns once every started send has finished
+    async def run(self, duration: float = None, count: int = None):
+        if duration is None and count is None: raise ValueError("an open loop needs a duration or a count")
+        if count == 0: return
+        self._done = asyncio.get_running_loop().create_future()
+        start = perf_counter_ns()
+        end = None if duration is None else start + round(duration * 1e9)
+        self.wheel.schedule(start, self._arrive, start, start, end, count)
+        try: await self._done
+        finally:
+            if self._sending: await asyncio.gather(*self._sending, return_exceptions=True)
+
+    # Starts the send due at 'intended', and any after it that are already due, then schedules the next one
+    #  Sends closer together than a tick all start on the wakeup they fall in, so the rate
+    #  isn't held to one send per tick
+    def _arrive(self, intended: int, start: int, end: int, count: int):
+        now = perf_counter_ns()
+        while True:
+            self.lag.record(max(now - intended, 0))
+            self.issued += 1
+            sending = asyncio.ensure_future(self.send(intended))
+            self._sending.add(sending)
+            sending.add_done_callback(self._sending.discard)
+
+            upcoming = self._next(start, intended)
+            if (count is not None and self.issued >= count) or (end is not None and upcoming >= end):
+                if not self._done.done(): self._done.set_result(None)
+                return
+            if upcoming > now: break
+            intended = upcoming
+        self.wheel.schedule(upcoming, self._arrive, upcoming, start, end, count)
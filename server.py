@@ -0,0 +1,265 @@
+import argparse             # For command line options
+import asyncio              # For serving many connections at once
+import multiprocessing      # For SO_REUSEPORT workers
+import random               # For latency jitter
+import socket               # For TCP_NODELAY
+from dataclasses import dataclass
+
+from messages import FRAME_HEADER, FRAME_VERSION, FRAME_MAX_LENGTH, CODECS, codec_available, welcome_codecs, _frame_extra, \
+                     _LEGACY_START, _LEGACY_END
+
+# =============================================================================
+# Echo Server
+#
+# A local stand in for the echo servers the client is normally pointed at, so
+# it can be run and measured offline:
+#  * sends a welcome on connect, then echos every frame back byte for byte
+#  * lists every compression codec in its welcome, as compressed frames are
+#    echoed byte for byte too (see messages.py)
+#  * understands both framings encode_message produces (binary and legacy),
+#    detected frame by frame, so the client decides how it displays echos
+#  * answers a raw "Bye!" (what older clients send to stop their listener) by
+#    echoing it and closing the connection
+#  * runs on asyncio, optionally as several worker processes sharing the port
+#    with SO_REUSEPORT
+#
+# Switches reproduce real network behaviour:
+#  * delay/jitter: hold every echo for a time before writing it
+#  * split:        write echos in segments of at most n bytes
+#  * coalesce:     hold echos for a time and write them out together
+#
+# ex: python server.py 127.0.0.1 31800 --workers 4 --delay 2 --jitter 1 --split 7
+# =============================================================================
+
+BYE = b"Bye!"                   # Raw shutdown message sent by older clients
+WELCOME = "Welcome to the local echo server!"
+
+# How the server behaves
+@dataclass
+class ServerSpec():
+    host: str = "127.0.0.1"
+    port: int = 0               # 0 picks a free port (single process only)
+    welcome: str = WELCOME      # Sent to each client on connect
+    delay: float = 0            # Milliseconds to hold each echo for
+    jitter: float = 0           # Up to this many extra milliseconds, at random
+    split: int = 0              # Write echos in segments of at most this many bytes (0 for whole)
+    coalesce: float = 0         # Milliseconds to gather echos for before writing them together
+    workers: int = 1            # Processes sharing the port (SO_REUSEPORT)
+    codecs: tuple = tuple(codec for codec in CODECS if codec_available(codec))    # Compression codecs offered in the welcome (none, like a legacy server)
+
+# What the server has done
+@dataclass
+class ServerStats():
+    connections: int = 0        # Accepted in total
+    open: int = 0               # Currently connected
+    frames: int = 0             # Echoed
+    bytes: int = 0              # Echoed
+    errors: int = 0             # Connections closed for sending garbage
+
+# =============================================================================
+
+# --------------
+# Finding Frames
+# --------------
+
+# Finds the complete frames at the front of a buffer
+#  Returns (end of the last complete frame, frames found, whether a Bye follows them)
+#  Raises ValueError on bytes that aren't a frame of either framing
+def _scan(buf) -> tuple:
+    offset = 0
+    frames = 0
+    size = len(buf)
+    while offset < size:
+        if buf[offset] == FRAME_VERSION:
+            if size - offset < FRAME_HEADER.size: break
+            version, bits, length = FRAME_HEADER.unpack_from(buf, offset)
+            if length > FRAME_MAX_LENGTH: raise ValueError(f"frame too long ({length} bytes)")
+            end = offset + FRAME_HEADER.size + _frame_extra(bits) + length
+            if end > size: break
+        elif buf.startswith(_LEGACY_START[:size-offset], offset):
+            end = buf.find(_LEGACY_END, offset)
+            if end == -1: break
+            end += len(_LEGACY_END)
+        elif buf.startswith(BYE[:size-offset], offset):
+            if size - offset < len(BYE): break
+            return (offset, frames, True)
+        else: raise ValueError(f"unrecognised byte {buf[offset]:#04x}")
+        offset = end
+        frames += 1
+    return (offset, frames, False)
+
+# =============================================================================
+
+# -------------
+# Echo Protocol
+# -------------
+
+# Echos one client's frames, through the delay, coalesce and split switches
+class _EchoProtocol(asyncio.Protocol):
+    def __init__(self, server: "EchoServer"):
+        self.server = server
+        self.spec = server.spec
+        self.transport = None
+        self._loop = asyncio.get_running_loop()
+        self._buffer = bytearray()      # Bytes of an incomplete frame
+        self._held = []                 # Echos waiting to be coalesced
+        self._flush_handle = None       # Scheduled coalesce flush
+        self._due = 0                   # When the last delayed echo is written, keeps echos in order
+
+    def connection_made(self, transport: asyncio.Transport):
+        self.transport = transport
+        sock = transport.get_extra_info("socket")
+        if sock is not None: sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.stats.connections += 1
+        self.server.stats.open += 1
+        self.server._protocols.add(self)
+        welcome = self.spec.welcome
+        if self.spec.codecs: welcome += welcome_codecs(self.spec.codecs)
+        transport.write(welcome.encode())   # Always whole, clients read it in one go
+
+    def connection_lost(self, exc: Exception):
+        self.server.stats.open -= 1
+        self.server._protocols.discard(self)
+        if self._flush_handle is not None: self._flush_handle.cancel()
+
+    def data_received(self, data: bytes):
+        if self._buffer:
+            self._buffer += data
+            data = self._buffer
+        try: end, frames, bye = _scan(data)
+        except ValueError:
+            self.server.stats.errors += 1
+            self.transport.abort()
+            return
+        if end > 0:
+            self.server.stats.frames += frames
+            self.server.stats.bytes += end
+            self._echo(data if end == len(data) and type(data) is bytes else bytes(data[:end]))
+        if bye:
+            self._echo(BYE)
+            self._close()
+            return
+        self._buffer = bytearray(data[end:])
+
+    # Flow control, stop reading while the client isn't reading its echos
+    def pause_writing(self):
+        self.transport.pause_reading()
+
+    def resume_writing(self):
+        self.transport.resume_reading()
+
+    # ---------------------
+    # Writing (and Shaping)
+    # ---------------------
+
+    def _echo(self, data: bytes):
+        if self.spec.coalesce <= 0: return self._send(data)
+        self._held.append(data)
+        if self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(self.spec.coalesce / 1000, self._flush)
+
+    def _flush(self):
+        self._flush_handle = None
+        if self._held: self._send(b"".join(self._held))
+        self._held.clear()
+
+    def _send(self, data: bytes):
+        if self.spec.delay <= 0 and self.spec.jitter <= 0: return self._write(data)
+        due = self._loop.time() + (self.spec.delay + random.uniform(0, self.spec.jitter)) / 1000
+        self._due = max(due, self._due)
+        self._loop.call_at(self._due, self._write, data)
+
+    def _write(self, data: bytes):
+        if self.transport.is_closing(): return
+        split = self.spec.split
+        if split <= 0 or len(data) <= split: return self.transport.write(data)
+        view = memoryview(data)
+        for start in range(0, len(data), split): self.transport.write(view[start:start+split])
+
+    # Closes once every echo already accepted has been written
+    def _close(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush()
+        if self._due > self._loop.time(): self._loop.call_at(self._due, self.transport.close)
+        else: self.transport.close()
+
+# =============================================================================
+
+# ------
+# Server
+# ------
+
+# An echo server running on the current event loop
+class EchoServer():
+    def __init__(self, spec: ServerSpec = None):
+        self.spec = ServerSpec() if spec is None else spec
+        self.stats = ServerStats()
+        self._server = None
+        self._protocols = set()     # Open connections
+
+    # Port the server is listening on
+    @property
+    def port(self) -> int:
+        if self._server is None: return self.spec.port
+        return self._server.sockets[0].getsockname()[1]
+
+    # Starts listening, returns the port
+    async def start(self) -> int:
+        loop = asyncio.get_running_loop()
+        self._server = await loop.create_server(lambda: _EchoProtocol(self), self.spec.host, self.spec.port,
+                                                reuse_port=self.spec.workers > 1 or None)
+        return self.port
+
+    # Stops listening and drops every connection
+    async def close(self):
+        if self._server is None: return
+        self._server.close()
+        for protocol in list(self._protocols): protocol.transport.abort()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def serve_forever(self):
+        if self._server is None: await self.start()
+        await self._server.serve_forever()
+
+# Runs one server process until interrupted, printing what it did
+def _serve(spec: ServerSpec):
+    server = EchoServer(spec)
+    async def run():
+        await server.start()
+        print(f" Echo server listening on {spec.host}:{server.port}")
+        await server.serve_forever()
+    try: asyncio.run(run())
+    except KeyboardInterrupt: pass
+    stats = server.stats
+    print(f" Served {stats.connections} connections, echoed {stats.frames} frames ({stats.bytes} bytes), {stats.errors} errors")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local echo server")
+    parser.add_argument("host", nargs="?", default="127.0.0.1")
+    parser.add_argument("port", nargs="?", type=int, default=31800)
+    parser.add_argument("-w", "--workers", type=int, default=1, help="processes sharing the port with SO_REUSEPORT")
+    parser.add_argument("--welcome", default=WELCOME, help="text sent to each client on connect")
+    parser.add_argument("--delay", type=float, default=0, help="milliseconds to hold each echo for")
+    parser.add_argument("--jitter", type=float, default=0, help="up to this many extra milliseconds per echo")
+    parser.add_argument("--split", type=int, default=0, help="write echos in segments of at most n bytes")
+    parser.add_argument("--coalesce", type=float, default=0, help="milliseconds to gather echos for before writing")
+    parser.add_argument("--no-compression", action="store_true", help="don't offer compression, like a legacy server")
+    args = parser.parse_args()
+
+    if args.workers > 1 and not hasattr(socket, "SO_REUSEPORT"): parser.error("SO_REUSEPORT isn't available here")
+    if args.workers > 1 and args.port == 0: parser.error("workers need a fixed port")
+    spec = ServerSpec(args.host, args.port, args.welcome, args.delay, args.jitter, args.split, args.coalesce, args.workers,
+                      () if args.no_compression else tuple(codec for codec in CODECS if codec_available(codec)))
+
+    if spec.workers == 1: return _serve(spec)
+    workers = [multiprocessing.Process(target=_serve, args=(spec,)) for _ in range(spec.workers)]
+    for worker in workers: worker.start()
+    try:
+        for worker in workers: worker.join()
+    except KeyboardInterrupt:
+        for worker in workers: worker.join()
+
+if __name__ == "__main__":
+    main()
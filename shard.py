@@ -0,0 +1,175 @@
+import argparse                 # For command line options
+import multiprocessing          # For worker processes
+import os                       # For os.devnull and cpu count
+import random                   # For generated workloads
+import time                     # For timing the run
+from contextlib import redirect_stdout
+from multiprocessing.connection import wait
+
+from client import Client
+from loadgen import LoadSpec, LoadResult, parse_mix, parse_sizes, report, _draw_message
+from messages import Message, MessageBatch, FRAMING_BINARY, FRAMING_LEGACY
+from metrics import Metrics
+from transforms import mismatches
+from aclient import WINDOW
+
+# =============================================================================
+# Sharded Runner
+#
+# Spreads one workload across worker processes, so sending isn't held to a
+# single core by the GIL:
+#  * the workload is either a list of message texts or a LoadSpec to generate
+#    messages from (modifier mix, sizes, count)
+#  * each worker owns its own Client, with a pool of its own connections,
+#    and sends its shard in pipelined chunks, checking each chunk's echos
+#    in bulk (see transforms.py)
+#  * workers stream results back over a pipe as they go: one status byte per
+#    message (see RESULT_*), then their Metrics once finished
+#  * the parent merges everything into a single report
+#
+# Workers connect first and only start sending once every worker is ready, so
+# the measured time covers sending alone.
+#
+# ex: python shard.py 127.0.0.1 31800 -w 8 -c 4 -n 1000000 --size 16-512
+# =============================================================================
+
+CHUNK = 2048    # Messages sent per pipelined batch (and per result message)
+
+# Status recorded for each message
+RESULT_OK = 0           # Echo came back matching
+RESULT_MISMATCH = 1     # Echo came back different
+RESULT_LOST = 2         # No echo came back
+
+# -------
+# Workers
+# -------
+
+# Yields a worker's messages in chunks: from its share of the texts, or generated
+def _chunks(spec: LoadSpec, index: int, texts: list, quota: int):
+    if texts is not None:
+        for start in range(0, len(texts), CHUNK):
+            yield [Message({"text":text}) for text in texts[start:start+CHUNK]]
+        return
+    rng = random.Random(None if spec.seed is None else spec.seed + index)
+    for start in range(0, quota, CHUNK):
+        yield [_draw_message(rng, spec) for _ in range(min(CHUNK, quota - start))]
+
+# One worker process: connect, wait for the go, send, stream results back
+def _worker(spec: LoadSpec, index: int, texts: list, quota: int, pipe):
+    with redirect_stdout(open(os.devnull, "w")):    # Client chatter stays out of the report
+        client = Client()
+        client.flags["legacyframes"] = spec.framing == FRAMING_LEGACY
+        client.setting_set("window", str(spec.window))
+        client.setting_set("poolsize", str(spec.connections))
+        client.connection_set_ip(spec.host)
+        client.connection_set_port(spec.port)
+        pipe.send(("ready", client.connection_establish()))
+        pipe.recv()     # Go
+        for msgs in _chunks(spec, index, texts, quota):
+            if not client.is_connected(): break
+            echos = client.message_send_many(msgs)
+            status = bytearray([RESULT_OK]) * len(echos) + bytearray([RESULT_LOST]) * (len(msgs) - len(echos))
+            for i in mismatches(MessageBatch(msgs), MessageBatch(echos)):
+                if i < len(echos): status[i] = RESULT_MISMATCH
+            pipe.send(("results", bytes(status), sum(len(msg.text) for msg in msgs)))
+            client.inbox_empty()    # Echos were checked above, don't let them pile up
+        metrics = client.metrics()
+        if client.is_connected(): client.shutdown()
+    pipe.send(("done", metrics))
+    pipe.close()
+
+# =============================================================================
+
+# ------
+# Parent
+# ------
+
+# Shards a workload across workers, returns the merged (LoadResult, Metrics)
+#  texts, when given, are sent instead of messages generated from the spec
+def run_sharded(spec: LoadSpec, workers: int, texts: list = None) -> tuple:
+    total = len(texts) if texts is not None else (spec.count or 0)
+    quotas = [total // workers + (i < total % workers) for i in range(workers)]
+    pipes = []
+    procs = []
+    for i in range(workers):
+        parent_end, child_end = multiprocessing.Pipe()
+        shard = texts[i::workers] if texts is not None else None
+        procs.append(multiprocessing.Process(target=_worker, args=(spec, i, shard, quotas[i], child_end)))
+        procs[-1].start()
+        child_end.close()
+        pipes.append(parent_end)
+
+    result = LoadResult()
+    metrics = Metrics()
+    unsent = dict(zip(pipes, quotas))   # Messages of each worker's shard not yet reported
+    ready = []
+    for pipe in pipes:
+        try: connected = pipe.recv()[1]
+        except (EOFError, OSError):     # Worker died before it was ready, its whole shard is lost
+            result.connect_errors += 1
+            result.errors += unsent.pop(pipe)
+            continue
+        if not connected: result.connect_errors += 1
+        ready.append(pipe)
+    start = time.monotonic()
+    for pipe in ready:
+        try: pipe.send("go")
+        except OSError: pass            # Died since it was ready, the merge below finds out
+
+    # Merge results as they stream in from whichever workers have them
+    waiting = list(ready)
+    while waiting:
+        for pipe in wait(waiting):
+            try: kind, *data = pipe.recv()
+            except (EOFError, OSError):     # Worker died without finishing, what it didn't report is lost
+                result.errors += unsent.pop(pipe)
+                waiting.remove(pipe)
+                continue
+            if kind == "results":
+                status, nbytes = data
+                unsent[pipe] -= len(status)
+                result.sent += len(status)
+                result.bytes_sent += nbytes
+                result.recieved += status.count(RESULT_OK) + status.count(RESULT_MISMATCH)
+                result.errors += len(status) - status.count(RESULT_OK)
+            elif kind == "done":
+                metrics.merge(data[0])
+                waiting.remove(pipe)
+    result.elapsed = time.monotonic() - start
+    for proc in procs: proc.join()
+    result.latency = metrics.rtt
+    return (result, metrics)
+
+def main():
+    parser = argparse.ArgumentParser(description="Send a workload through many client processes at once")
+    parser.add_argument("host")
+    parser.add_argument("port", type=int)
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument("-c", "--connections", type=int, default=1, help="connections per worker")
+    parser.add_argument("-n", "--count", type=int, default=100000, help="messages to generate in total")
+    parser.add_argument("--messages", help="file of message texts (one per line) to send instead")
+    parser.add_argument("--mix", default="plain=1", help="weighted modifiers, ex: plain=6,caps=2,reverse+noecho=1")
+    parser.add_argument("--size", default="64", help="text size: 64 / 16-512 (uniform) / exp:128")
+    parser.add_argument("--window", type=int, default=WINDOW, help="most messages in flight per connection")
+    parser.add_argument("--legacy", action="store_true", help="use the old text marker framing")
+    parser.add_argument("--seed", type=int, help="seed for reproducible message streams")
+    args = parser.parse_args()
+
+    try:
+        spec = LoadSpec(args.host, args.port, args.connections, count=args.count, mix=parse_mix(args.mix),
+                        sizes=parse_sizes(args.size), window=args.window,
+                        framing=FRAMING_LEGACY if args.legacy else FRAMING_BINARY, seed=args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+    texts = None
+    if args.messages:
+        with open(args.messages) as f: texts = [line.rstrip("\n") for line in f]
+    result, metrics = run_sharded(spec, args.workers, texts)
+    report(result)
+    print(" [Workers]:")
+    print(f"  {args.workers} processes x {args.connections} connections")
+    for name, value in metrics.summary().items():
+        if name in ("encode", "decode"): print(f"  {name}: {value}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import os
+
+import pytest
+
+import inboxlog
+from inboxlog import InboxLog, LOG_START_SIZE
+from messages import Message
+
+# =============================================================================
+# Inbox Log
+#
+# What's on disk must read back the same after the log is closed and opened
+# again, and after compaction has moved the live messages to a fresh log:
+# same texts, same numbers, and numbering carries on from where it stopped.
+# =============================================================================
+
+def message(text: str, seq: int = None) -> Message:
+    mess = Message()
+    mess.text, mess.seq = text, seq
+    return mess
+
+def contents(inbox) -> list:
+    return [(number, mess.text, mess.seq) for number, mess in inbox.items()]
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "inbox")
+
+# ------
+# Reopen
+# ------
+
+def test_reopen_keeps_messages_and_numbering(path):
+    log = InboxLog(path)
+    for i in range(5): log.append(message(f"message {i}", seq=i))
+    log.delete(2)
+    log.pop_oldest()
+    expected = contents(log)
+    log.close()
+
+    log = InboxLog(path)
+    assert contents(log) == expected == [(3, "message 2", 2), (4, "message 3", 3), (5, "message 4", 4)]
+    assert len(log) == 3
+    assert log.get(1) is None and log.get(2) is None
+    assert log.append(message("after reopen")) == 6
+    log.close()
+
+def test_reopen_keeps_kept_numbers(path):
+    log = InboxLog(path)
+    log.append(message("first"))
+    assert log.append(message("moved in"), number=10) == 10
+    with pytest.raises(ValueError):
+        log.append(message("too low"), number=5)
+    log.close()
+
+    log = InboxLog(path)
+    assert contents(log) == [(1, "first", None), (10, "moved in", None)]
+    assert all(log.get(number) is None for number in range(2, 10))
+    assert log.append(message("next")) == 11
+    log.close()
+
+def test_reopen_after_clear(path):
+    log = InboxLog(path)
+    for i in range(3): log.append(message(str(i)))
+    log.clear()
+    log.close()
+
+    log = InboxLog(path)
+    assert len(log) == 0
+    assert log.append(message("again")) == 1
+    log.close()
+
+def test_reopen_rejects_other_files(path):
+    with open(path + ".idx", "wb") as index: index.write(b"not an inbox log" * 4)
+    with pytest.raises(ValueError):
+        InboxLog(path)
+
+# ----------
+# Compaction
+# ----------
+
+def test_compact_keeps_numbers(path):
+    log = InboxLog(path)
+    text = "x" * 20_000
+    for i in range(200): log.append(message(f"{i} {text}", seq=i))
+    assert os.path.getsize(path + ".log") > LOG_START_SIZE
+    for number in range(1, 201):
+        if number % 20 != 0: log.delete(number)
+    expected = contents(log)
+    log.compact()
+    assert contents(log) == expected
+    assert [number for number, _, _ in expected] == list(range(20, 201, 20))
+    assert os.path.getsize(path + ".log") == LOG_START_SIZE
+    assert log.append(message("after compacting")) == 201
+    log.close()
+
+    log = InboxLog(path)
+    assert contents(log)[:-1] == expected
+    assert contents(log)[-1] == (201, "after compacting", None)
+    log.close()
+
+# Deleting most of the log compacts it in the background, reads and appends carry on meanwhile
+def test_background_compaction(path, monkeypatch):
+    monkeypatch.setattr(inboxlog, "COMPACT_MIN", 1024)
+    log = InboxLog(path)
+    for i in range(100): log.append(message(f"message {i} " + "y" * 100))
+    for number in range(1, 91): log.delete(number)
+    log.append(message("during"))
+    expected = contents(log)
+    log.close()     # Waits out the compaction
+
+    assert os.path.getsize(path + ".log") == LOG_START_SIZE
+    assert not os.path.exists(path + ".log.compact")
+    log = InboxLog(path)
+    assert contents(log) == expected
+    assert [number for number, _, _ in expected] == list(range(91, 102))
+    log.close()
+
+def test_compact_drops_out_of_capacity(path):
+    log = InboxLog(path, capacity=3)
+    for i in range(6): log.append(message(str(i)))
+    assert log.dropped == 3
+    log.compact()
+    assert contents(log) == [(4, "3", None), (5, "4", None), (6, "5", None)]
+    log.close()
@@ -0,0 +1,143 @@
+import random
+import struct
+
+import pytest
+
+from messages import Message, BufferPool, FrameDecoder, encode_message, decode_message, \
+                     FRAMING_LEGACY, FRAME_HEADER, FRAME_VERSION, FRAME_CMPR, FRAME_SEQ, FRAME_MAX_LENGTH, CODECS
+
+# =============================================================================
+# Frame encoding and decoding
+#
+# A stream of frames must come back as the same messages however it was split
+# into chunks, and a malformed frame must raise ValueError rather than
+# anything else (or hang on to half a stream).
+# =============================================================================
+
+def message(text: str, bits: int = Message.DEFAULT_BITS, seq: int = None, channel: int = None) -> Message:
+    mess = Message()
+    mess.text, mess.bits, mess.seq, mess.channel = text, bits, seq, channel
+    return mess
+
+def fields(mess: Message) -> tuple:
+    return (mess.text, mess.bits, mess.seq, mess.channel)
+
+MESSAGES = [message("hello"),
+            message("", bits=0b000),
+            message("caps and reverse", bits=0b111, seq=7),
+            message("on a channel", seq=2**32 - 1, channel=3),
+            message("no seq, only a channel", channel=0),
+            message("ünïcödé ✓ " * 50, seq=1),
+            message("x" * 200_000, seq=2)]     # Larger than a recieve buffer
+
+def stream(messages: list, **options) -> bytes:
+    return b"".join(encode_message(mess, **options) for mess in messages)
+
+# Splits data into chunks at random points
+def chunks(data: bytes, seed: int, most: int) -> list:
+    rng = random.Random(seed)
+    parts, offset = [], 0
+    while offset < len(data):
+        size = rng.randint(1, most)
+        parts.append(data[offset:offset+size])
+        offset += size
+    return parts
+
+# -------------
+# Segmentation
+# -------------
+
+def test_decode_message_round_trip():
+    for mess in MESSAGES:
+        assert fields(decode_message(encode_message(mess))) == fields(mess)
+
+@pytest.mark.parametrize("most", [1, 7, 4096, 100_000])
+def test_feed_any_segmentation(most):
+    data = stream(MESSAGES)
+    decoder = FrameDecoder()
+    decoded = []
+    for part in chunks(data, seed=most, most=most): decoded += decoder.feed(part)
+    assert [fields(mess) for mess in decoded] == [fields(mess) for mess in MESSAGES]
+    assert decoder.pending() == 0
+
+# Recieving in place, as the engine's BufferedProtocol does, through a small pool so
+# buffers are compacted, grown past the pool's size and handed back
+def test_recieve_in_place_with_pool():
+    pool = BufferPool(size=64, count=2)
+    decoder = FrameDecoder(pool=pool)
+    data = stream(MESSAGES * 3)
+    decoded, offset = [], 0
+    rng = random.Random(1)
+    while offset < len(data):
+        space = decoder.get_buffer()
+        assert len(space) > 0
+        size = min(len(space), rng.randint(1, 300), len(data) - offset)
+        space[:size] = data[offset:offset+size]
+        offset += size
+        decoded += decoder.buffer_updated(size)
+    assert [fields(mess) for mess in decoded] == [fields(mess) for mess in MESSAGES * 3]
+    assert decoder.pending() == 0
+
+def test_decoded_messages_outlive_the_buffer():
+    decoder = FrameDecoder(pool=BufferPool(size=64, count=1))
+    first = decoder.feed(encode_message(message("first")))
+    decoder.feed(encode_message(message("second, written over the same buffer")))
+    assert first[0].text == "first"
+
+def test_compressed_frames_any_segmentation():
+    messages = [message("compress me " * 500, seq=1), message("short", seq=2), message("z" * 50_000, seq=3)]
+    data = stream(messages, codec="zlib", threshold=100)
+    assert len(data) < sum(len(encode_message(mess)) for mess in messages)
+    for most in (1, 13, 5000):
+        decoder = FrameDecoder()
+        decoded = []
+        for part in chunks(data, seed=most, most=most): decoded += decoder.feed(part)
+        assert [fields(mess) for mess in decoded] == [fields(mess) for mess in messages]
+
+def test_legacy_any_segmentation():
+    messages = [message("hello"), message("caps", bits=0b011), message("", bits=0b100)]
+    data = stream(messages, framing=FRAMING_LEGACY)
+    decoder = FrameDecoder(FRAMING_LEGACY)
+    decoded = []
+    for part in chunks(data, seed=3, most=5): decoded += decoder.feed(part)
+    assert [(mess.text, mess.bits) for mess in decoded] == [(mess.text, mess.bits) for mess in messages]
+
+# ----------------
+# Malformed frames
+# ----------------
+
+@pytest.mark.parametrize("code", [
+    b"",                                                            # No header
+    FRAME_HEADER.pack(FRAME_VERSION, 0, 5)[:4],                     # Header cut short
+    FRAME_HEADER.pack(FRAME_VERSION, 0, 5) + b"abc",                # Text cut short
+    FRAME_HEADER.pack(FRAME_VERSION, FRAME_SEQ, 0) + b"\x00\x01",   # Sequence id cut short
+    FRAME_HEADER.pack(FRAME_VERSION + 1, 0, 0),                     # Unknown version
+    FRAME_HEADER.pack(FRAME_VERSION, FRAME_CMPR, 0),                # Compressed, with no codec id
+    FRAME_HEADER.pack(FRAME_VERSION, FRAME_CMPR, 3) + b"\xff\x00\x00",              # Unknown codec
+    FRAME_HEADER.pack(FRAME_VERSION, FRAME_CMPR, 4) + bytes([CODECS["zlib"]]) + b"bad",  # Corrupt zlib
+])
+def test_decode_message_rejects(code):
+    with pytest.raises(ValueError):
+        decode_message(code)
+
+@pytest.mark.parametrize("code", [
+    FRAME_HEADER.pack(FRAME_VERSION + 1, 0, 0),
+    FRAME_HEADER.pack(FRAME_VERSION, 0, FRAME_MAX_LENGTH + 1),
+    FRAME_HEADER.pack(FRAME_VERSION, FRAME_CMPR, 0),
+    FRAME_HEADER.pack(FRAME_VERSION, FRAME_CMPR, 4) + bytes([CODECS["zlib"]]) + b"bad",
+])
+def test_decoder_rejects_and_recovers(code):
+    decoder = FrameDecoder()
+    with pytest.raises(ValueError):
+        decoder.feed(encode_message(message("before")) + code)
+    # The bad stream is dropped, a fresh frame after it still decodes
+    assert decoder.pending() == 0
+    assert [mess.text for mess in decoder.feed(encode_message(message("after")))] == ["after"]
+
+# A compressed frame cut short waits for the rest rather than failing
+def test_decoder_waits_for_compressed_tail():
+    code = encode_message(message("wait for it " * 200), codec="zlib")
+    assert struct.unpack_from("!B", code, 1)[0] & FRAME_CMPR
+    decoder = FrameDecoder()
+    assert decoder.feed(code[:-10]) == []
+    assert [mess.text for mess in decoder.feed(code[-10:])] == ["wait for it " * 200]
@@ -0,0 +1,280 @@
+import argparse         # For command line options
+import asyncio          # For replaying many connections at once
+import struct           # For the trace header and records
+from dataclasses import dataclass
+from threading import Lock
+from time import perf_counter_ns, time_ns
+
+# =============================================================================
+# Traffic Record and Replay
+#
+# Captures exactly what went over the wire, so an incident can be driven at a
+# server again later:
+#  * a TraceRecorder is hooked into connections (AsyncClient takes one as
+#    'recorder') and appends a record for every write and read
+#  * each record holds the kind, the connection it happened on, nanoseconds since
+#    the trace started and the raw bytes, so frames go back out exactly as sent
+#  * replay reads the trace one record at a time and re-drives every recorded
+#    connection at once against a server, at the recorded pace (or faster)
+#
+# Each replayed connection only has a bounded queue of records read ahead for
+# it, so traces much larger than memory replay fine. Recieved bytes aren't sent anywhere on replay, they
+# tell each connection how much echo to wait for before closing. The server's
+# welcome is recorded apart from them (a trace started mid-connection has none),
+# and a replayed connection leaves its welcome out of what it counts too.
+#
+# ex: python traffic.py incident.trace 127.0.0.1 31800 --speed 4
+# =============================================================================
+
+TRACE_HEADER = struct.Struct("!4sIQ")   # magic, version, wall clock start (unix ns)
+TRACE_RECORD = struct.Struct("!BIQI")   # kind, connection, ns since start, payload length
+TRACE_MAGIC = b"ECTR"
+TRACE_VERSION = 2
+
+RECORD_OPEN = 1         # Connection first seen, payload is its 'host:port'
+RECORD_SEND = 2         # Bytes written
+RECORD_RECV = 3         # Bytes read
+RECORD_CLOSE = 4        # Connection closed
+RECORD_WELCOME = 5      # The server's welcome, the first bytes a connection read
+
+CLOSE_WAIT = 5          # Seconds a replayed connection waits for its echos before closing
+WELCOME_WAIT = 5        # Seconds a replayed connection waits for the server's welcome before sending
+REPLAY_QUEUE = 1024     # Records read ahead for each replayed connection
+
+# ---------
+# Recording
+# ---------
+
+# Appends the traffic of any number of connections to one trace file
+#  Connections are told apart by identity and numbered in the order they are first
+#  seen. Safe to share between threads; after close() it records nothing.
+class TraceRecorder():
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "wb", buffering=1 << 20)
+        self._file.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, time_ns()))
+        self._start = perf_counter_ns()
+        self._ids = {}              # id(connection) -> its number in the trace
+        self._next_id = 0
+        self._lock = Lock()
+
+    def _write(self, kind: int, connection: int, buffers: list):
+        self._file.write(TRACE_RECORD.pack(kind, connection, perf_counter_ns() - self._start,
+                                           sum(len(buffer) for buffer in buffers)))
+        for buffer in buffers: self._file.write(buffer)
+
+    # Number of a connection, recording that it opened if this is the first sight of it
+    def _id(self, connection) -> int:
+        number = self._ids.get(id(connection))
+        if number is None:
+            number = self._ids[id(connection)] = self._next_id
+            self._next_id += 1
+            self._write(RECORD_OPEN, number, [f"{connection.host}:{connection.port}".encode()])
+        return number
+
+    # Records bytes a connection wrote, as the buffers they were written from
+    def sent(self, connection, buffers: list):
+        with self._lock:
+            if self._file is None: return
+            self._write(RECORD_SEND, self._id(connection), buffers)
+
+    def recieved(self, connection, data):
+        with self._lock:
+            if self._file is None: return
+            self._write(RECORD_RECV, self._id(connection), [data])
+
+    def welcomed(self, connection, welcome):
+        with self._lock:
+            if self._file is None: return
+            self._write(RECORD_WELCOME, self._id(connection), [welcome])
+
+    def closed(self, connection):
+        with self._lock:
+            if self._file is None or id(connection) not in self._ids: return
+            self._write(RECORD_CLOSE, self._ids.pop(id(connection)), [])
+
+    def close(self):
+        with self._lock:
+            if self._file is None: return
+            self._file.close()
+            self._file = None
+
+# Yields a trace's records as (kind, connection, ns since start, payload), reading one at a time
+#  Raises ValueError if the file isn't a trace; a record cut short by a crash ends the trace
+def read_trace(path: str):
+    with open(path, "rb", buffering=1 << 20) as trace:
+        header = trace.read(TRACE_HEADER.size)
+        if len(header) < TRACE_HEADER.size or TRACE_HEADER.unpack(header)[:2] != (TRACE_MAGIC, TRACE_VERSION):
+            raise ValueError(f"'{path}' isn't a traffic trace this client can read")
+        while True:
+            head = trace.read(TRACE_RECORD.size)
+            if len(head) < TRACE_RECORD.size: return
+            kind, connection, at, length = TRACE_RECORD.unpack(head)
+            payload = trace.read(length)
+            if len(payload) < length: return
+            yield kind, connection, at, payload
+
+# =============================================================================
+
+# ---------
+# Replaying
+# ---------
+
+# Everything measured during a replay
+@dataclass
+class ReplayResult():
+    connections: int = 0
+    connect_errors: int = 0
+    sends: int = 0
+    bytes_sent: int = 0
+    bytes_recieved: int = 0     # Bytes recieved after each welcome
+    bytes_expected: int = 0     # Bytes the recorded connections recieved after theirs
+    elapsed: float = 0
+
+# One replayed connection, counting what the server sends back
+#  The first bytes recieved are the server's welcome and aren't counted
+class _ReplayProtocol(asyncio.Protocol):
+    def __init__(self, result: ReplayResult):
+        self.result = result
+        self.recieved = 0               # Bytes recieved since the welcome
+        self.expected = 0               # Recorded bytes recieved so far
+        loop = asyncio.get_running_loop()
+        self.welcome = loop.create_future()     # Resolved once the welcome arrives (or stops being waited for)
+        self.closed = loop.create_future()
+        self._caught_up = None          # Set while waiting for the echos to catch up with the recording
+        self._drain_waiter = None
+
+    def data_received(self, data: bytes):
+        if not self.welcome.done():
+            self.welcome.set_result(None)
+            return
+        self.recieved += len(data)
+        self.result.bytes_recieved += len(data)
+        if self._caught_up is not None and self.recieved >= self.expected and not self._caught_up.done():
+            self._caught_up.set_result(None)
+
+    def connection_lost(self, exc: Exception):
+        if not self.welcome.done(): self.welcome.set_result(None)
+        self.resume_writing()
+        if self._caught_up is not None and not self._caught_up.done(): self._caught_up.set_result(None)
+        if not self.closed.done(): self.closed.set_result(None)
+
+    def pause_writing(self):
+        self._drain_waiter = asyncio.get_running_loop().create_future()
+
+    def resume_writing(self):
+        if self._drain_waiter is not None and not self._drain_waiter.done(): self._drain_waiter.set_result(None)
+        self._drain_waiter = None
+
+    async def drain(self):
+        if self._drain_waiter is not None: await self._drain_waiter
+
+    # Waits (up to a limit) until as much has come back as the recording recieved
+    async def catch_up(self, timeout: float):
+        if self.recieved >= self.expected or self.closed.done(): return
+        self._caught_up = asyncio.get_running_loop().create_future()
+        try: await asyncio.wait_for(self._caught_up, timeout)
+        except TimeoutError: pass
+
+# Opens a replayed connection and waits for its welcome, as the recorded client did before sending
+#  A server which sends no welcome is waited on for WELCOME_WAIT, everything after counts
+async def _open(host: str, port: int, result: ReplayResult):
+    try: transport, protocol = await asyncio.get_running_loop().create_connection(lambda: _ReplayProtocol(result), host, port)
+    except OSError:
+        result.connect_errors += 1
+        return None
+    try: await asyncio.wait_for(asyncio.shield(protocol.welcome), WELCOME_WAIT)
+    except TimeoutError:
+        if not protocol.welcome.done(): protocol.welcome.set_result(None)
+    return transport, protocol
+
+# Replays one recorded connection, from the records the trace reader queues for it
+#  Runs alongside every other connection's, so one waiting to open, drain or catch up
+#  never holds up another. Sends go at start + their recorded time / speed; None
+#  on the queue ends the connection, as does its CLOSE record.
+async def _replay_connection(queue: asyncio.Queue, host: str, port: int, speed: float, start: int, result: ReplayResult):
+    connection = None
+    try:
+        while (record := await queue.get()) is not None:
+            kind, at, payload = record
+            if speed > 0:
+                delay = start + at / speed - perf_counter_ns()
+                if delay > 0: await asyncio.sleep(delay / 1e9)
+            if kind == RECORD_OPEN:
+                connection = await _open(host, port, result)
+            elif kind == RECORD_CLOSE: break
+            elif connection is None: continue   # Failed to open, keep draining so the reader never blocks
+            elif kind == RECORD_SEND:
+                if connection[0].is_closing(): continue
+                connection[0].write(payload)
+                result.sends += 1
+                result.bytes_sent += len(payload)
+                await connection[1].drain()     # Don't outrun the socket, so memory stays bounded
+            elif kind == RECORD_RECV:
+                connection[1].expected += len(payload)
+    except asyncio.CancelledError:
+        if connection is not None: connection[0].close()
+        raise
+    if connection is None: return
+    transport, protocol = connection
+    await protocol.catch_up(CLOSE_WAIT)
+    transport.close()
+    await protocol.closed
+
+# Re-drives a trace against a server
+#  speed scales the recorded pace (2 for twice as fast), 0 sends everything as fast as possible
+#  Every recorded connection gets its own task, opened and closed when the recording's was,
+#  fed through a queue of at most REPLAY_QUEUE records; a full queue pauses the reader
+async def replay(path: str, host: str, port: int, speed: float = 1) -> ReplayResult:
+    result = ReplayResult()
+    queues = {}     # Recorded connection -> queue of its records
+    tasks = []
+    start = perf_counter_ns()
+    try:
+        for kind, connection, at, payload in read_trace(path):
+            if kind == RECORD_OPEN:
+                result.connections += 1
+                queues[connection] = asyncio.Queue(REPLAY_QUEUE)
+                tasks.append(asyncio.ensure_future(_replay_connection(queues[connection], host, port, speed, start, result)))
+            elif connection not in queues: continue
+            elif kind == RECORD_RECV: result.bytes_expected += len(payload)
+            elif kind == RECORD_WELCOME: continue
+            await queues[connection].put((kind, at, payload))
+            if kind == RECORD_CLOSE: del queues[connection]
+        # Connections the recording never closed
+        for queue in queues.values(): await queue.put(None)
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks: task.cancel()
+    result.elapsed = (perf_counter_ns() - start) / 1e9
+    return result
+
+# =============================================================================
+
+# ---------
+# Reporting
+# ---------
+
+def report(result: ReplayResult):
+    elapsed = result.elapsed or 1
+    print(" [Replay Results]:")
+    print(f"  elapsed:     {result.elapsed:.2f}s")
+    print(f"  connections: {result.connections} ({result.connect_errors} failed)")
+    print(f"  sent:        {result.sends} writes, {result.bytes_sent} bytes ({result.bytes_sent/elapsed/1024:.1f} KiB/s)")
+    print(f"  recieved:    {result.bytes_recieved} bytes (recorded {result.bytes_expected})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded traffic trace against a server")
+    parser.add_argument("trace")
+    parser.add_argument("host")
+    parser.add_argument("port", type=int)
+    parser.add_argument("--speed", type=float, default=1, help="pace relative to the recording, 0 for as fast as possible")
+    args = parser.parse_args()
+    if args.speed < 0: parser.error("speed can't be negative")
+
+    try: result = asyncio.run(replay(args.trace, args.host, args.port, args.speed))
+    except (OSError, ValueError) as e: parser.exit(1, f" ! couldn't replay '{args.trace}': {e}\n")
+    report(result)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+from itertools import accumulate
+
+from messages import Message, MessageBatch, stringify_message_fancy
+
+np = False      # NumPy once imported (None if it isn't installed), optional, locates mismatched echos faster
+
+# =============================================================================
+# Bulk Message Transforms
+#
+# Applies modifiers to a whole MessageBatch at once, and checks batches of
+# echos against what was sent, for inboxes and validation runs too big to walk
+# message by message:
+#  * the batch's texts are joined into one buffer, with an offset per message
+#  * caps and reverse are each applied once to the whole buffer (upper() of an
+#    ASCII buffer, and the buffer read backwards, in which every message's
+#    reversed text sits at its mirrored offset)
+#  * each message then only slices its text out of the variant it needs
+#  * messages with caps and non-ASCII text (where upper() can change lengths)
+#    are left to stringify_message_fancy
+#
+# Verification compares whole joined buffers first, so a batch that matches
+# costs two joins and a compare. Only when something differs are the culprits
+# located, with NumPy over the code points if it's installed.
+#
+# The results always match stringify_message_fancy and a message by message
+# comparison exactly.
+# =============================================================================
+
+_ECHO = Message.MOD_BITS["echo"]
+_CAPS = Message.MOD_BITS["caps"]
+_RVRS = Message.MOD_BITS["rvrs"]
+
+# ----------
+# Transforms
+# ----------
+
+# Returns each message's text as stringify_message_fancy would display it
+def transform_batch(batch: MessageBatch) -> list[str]:
+    texts = batch.texts
+    joined = "".join(texts)
+    total = len(joined)
+    present = set(batch.bits)       # Modifier combinations in the batch
+    upper = None
+    if joined.isascii() and any(bits & _CAPS for bits in present): upper = joined.upper()
+    backward = joined[::-1] if any(bits & _RVRS for bits in present) else None
+    upper_backward = upper[::-1] if upper is not None and any(bits & _CAPS and bits & _RVRS for bits in present) else None
+
+    transformed = []
+    start = 0
+    for text, bits in zip(texts, batch.bits):
+        end = start + len(text)
+        if not bits & _ECHO: transformed.append("")
+        elif bits & _CAPS:
+            if upper is None: transformed.append(stringify_message_fancy(_message(text, bits)))
+            elif bits & _RVRS: transformed.append(upper_backward[total-end:total-start])
+            else: transformed.append(upper[start:end])
+        elif bits & _RVRS: transformed.append(backward[total-end:total-start])
+        else: transformed.append(text)
+        start = end
+    return transformed
+
+def _message(text: str, bits: int) -> Message:
+    mess = Message()
+    mess.text = text
+    mess.bits = bits
+    return mess
+
+# =============================================================================
+
+# ------------
+# Verification
+# ------------
+
+# Returns the indices of sent messages whose echo doesn't match
+#  By default an echo must carry the same text and modifiers as its message (what an
+#  echo server sends back). With transformed, its text must instead be the message's
+#  transformed text, for servers which apply the modifiers themselves.
+#  Messages without an echo (echos is shorter) all count as mismatches.
+def mismatches(sent: MessageBatch, echos: MessageBatch, transformed: bool = False) -> list[int]:
+    count = min(len(sent), len(echos))
+    missing = list(range(count, len(sent)))
+    expected = transform_batch(sent) if transformed else sent.texts
+    got = echos.texts
+    if len(expected) > count: expected = expected[:count]
+    if len(got) > count: got = got[:count]
+
+    bad = []
+    if not transformed and sent.bits[:count] != echos.bits[:count]:
+        bad = [i for i in range(count) if sent.bits[i] != echos.bits[i]]
+    if "".join(expected) != "".join(got) or list(map(len, expected)) != list(map(len, got)):
+        bad = sorted(set(bad).union(_differing(expected, got)))
+    return bad + missing
+
+# NumPy, imported the first time mismatches need locating rather than with this module,
+# since importing it takes longer than a short client run does
+def _numpy():
+    global np
+    if np is False:
+        try: import numpy
+        except ImportError: numpy = None
+        np = numpy
+    return np
+
+# Indices where two equally long lists of texts differ
+def _differing(expected: list, got: list) -> list[int]:
+    lengths = list(map(len, expected))
+    if lengths != list(map(len, got)) or _numpy() is None:
+        return [i for i in range(len(expected)) if expected[i] != got[i]]
+    # Texts line up, compare their code points in one go and map differences to messages
+    want = np.frombuffer("".join(expected).encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    have = np.frombuffer("".join(got).encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    ends = np.fromiter(accumulate(lengths), dtype=np.int64, count=len(lengths))
+    return np.unique(np.searchsorted(ends, np.nonzero(want != have)[0], side="right")).tolist()